@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Compile-time benchmark of the generator pipeline.
+
+Compiles synthesized Porth programs of increasing size (and the real programs of the porth submodule, if present)
+in-process and reports the wall time and peak traced memory of every stage of the pipeline as JSON.
+
+Usage: python -m benchmarks.compile [-sizes 100,1000,5000] [-repeat 3] [-o result.json] [program.porth...]
+"""
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from os import path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from jawa.cf import ClassFile
+
+import jvm.generator
+from benchmarks.programs import SYNTHESIZERS, PORTH_DIRECTORY, corpus_programs
+from extensions.DeduplicatingConstantPool import DeduplicatingConstantPool
+from jvm.instructions import Instructions
+import porth.porth
+from porth.porth import ParseContext, Program
+
+DEFAULT_SIZES = [100, 1000, 5000]
+DEFAULT_REPEAT = 3
+
+
+@dataclass
+class StageResult:
+    calls: int = 0
+    # Wall time including nested stages
+    time: float = 0.0
+    # Wall time excluding nested stages
+    self_time: float = 0.0
+    # Peak traced memory while the stage was running, only measured in the memory pass
+    peak_memory: int = 0
+
+
+@dataclass
+class _Frame:
+    stage: str
+    start: float
+    children: float = 0.0
+    peak: int = 0
+
+
+@dataclass
+class Profiler:
+    trace_memory: bool = False
+    stages: Dict[str, StageResult] = field(default_factory=dict)
+    _frames: List[_Frame] = field(default_factory=list)
+
+    def wrap(self, stage: str, function: Callable) -> Callable:
+        def wrapper(*args, **kwargs):
+            self._enter(stage)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._exit()
+
+        return wrapper
+
+    def _enter(self, stage: str):
+        frame = _Frame(stage, 0.0)
+        if self.trace_memory:
+            # The peak is reset for the nested stage, so keep the peak of the enclosing stage until now
+            current, peak = tracemalloc.get_traced_memory()
+            if self._frames:
+                self._frames[-1].peak = max(self._frames[-1].peak, peak)
+            tracemalloc.reset_peak()
+            frame.peak = current
+        self._frames.append(frame)
+        frame.start = time.perf_counter()
+
+    def _exit(self):
+        end = time.perf_counter()
+        frame = self._frames.pop()
+        elapsed = end - frame.start
+        result = self.stages.setdefault(frame.stage, StageResult())
+        result.calls += 1
+        result.time += elapsed
+        result.self_time += elapsed - frame.children
+        if self._frames:
+            self._frames[-1].children += elapsed
+        if self.trace_memory:
+            frame.peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+            result.peak_memory = max(result.peak_memory, frame.peak)
+            if self._frames:
+                self._frames[-1].peak = max(self._frames[-1].peak, frame.peak)
+
+
+# (owner, attribute, stage) of every instrumented part of the pipeline
+INSTRUMENTED: List[Tuple[object, str, str]] = [
+    (porth.porth, "parse_program_from_file", "parse"),
+    (porth.porth, "type_check_program", "type_check"),
+    (jvm.generator, "generate_jvm_bytecode", "generate"),
+    (jvm.generator, "scan_called_procedures", "scan_procedures"),
+    (jvm.generator, "generate_runtime", "runtime"),
+    (jvm.generator, "create_method", "create_method"),
+    (Instructions, "assemble", "assemble"),
+    (DeduplicatingConstantPool, "append", "constant_pool"),
+    (ClassFile, "save", "save"),
+]
+
+
+def compile_program(program_path: str, out_file_path: str, profiler: Profiler):
+    originals = [(owner, attribute, getattr(owner, attribute)) for owner, attribute, _ in INSTRUMENTED]
+    for (owner, attribute, stage), (_, _, original) in zip(INSTRUMENTED, originals):
+        setattr(owner, attribute, profiler.wrap(stage, original))
+    try:
+        include_paths = [path.dirname(program_path), PORTH_DIRECTORY, path.join(PORTH_DIRECTORY, "std")]
+        parse_context = ParseContext()
+        porth.porth.parse_program_from_file(parse_context, program_path, include_paths)
+        program = Program(ops=parse_context.ops, memory_capacity=parse_context.memory_capacity)
+        porth.porth.type_check_program(program, {proc.addr: proc for proc in parse_context.procs.values()})
+        jvm.generator.generate_jvm_bytecode(parse_context, program, out_file_path, program_path)
+        return len(program.ops), len(parse_context.procs)
+    finally:
+        for owner, attribute, original in originals:
+            setattr(owner, attribute, original)
+
+
+def benchmark_program(name: str, program_path: str, out_directory: str, repeat: int) -> dict:
+    out_file_path = path.join(out_directory, "Main.class")
+
+    # Timing passes without tracemalloc, as tracing slows down allocations considerably
+    best: Optional[Profiler] = None
+    best_total = 0.0
+    ops = procedures = 0
+    for _ in range(repeat):
+        profiler = Profiler()
+        start = time.perf_counter()
+        ops, procedures = compile_program(program_path, out_file_path, profiler)
+        total = time.perf_counter() - start
+        if best is None or total < best_total:
+            best, best_total = profiler, total
+
+    # Memory pass
+    memory_profiler = Profiler(trace_memory=True)
+    tracemalloc.start()
+    try:
+        compile_program(program_path, out_file_path, memory_profiler)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    stages = {}
+    for stage, result in best.stages.items():
+        stages[stage] = {
+            "calls": result.calls,
+            "time": result.time,
+            "self_time": result.self_time,
+            "peak_memory": memory_profiler.stages[stage].peak_memory,
+        }
+    return {
+        "name": name,
+        "ops": ops,
+        "procedures": procedures,
+        "class_size": path.getsize(out_file_path),
+        "time": best_total,
+        "peak_memory": peak_memory,
+        "stages": stages,
+    }
+
+
+def usage(program_name: str):
+    print("Usage: %s [OPTIONS] [program.porth...]" % program_name)
+    print("  OPTIONS:")
+    print("    -sizes <n,...>    Sizes of the synthesized programs (default: %s)" % ",".join(map(str, DEFAULT_SIZES)))
+    print("    -only <kind,...>  Synthesize only the given kinds of programs: %s" % ", ".join(SYNTHESIZERS))
+    print("    -repeat <n>       Number of timed compilations per program, the fastest is reported (default: %d)"
+          % DEFAULT_REPEAT)
+    print("    -no-corpus        Do not benchmark the programs of the porth submodule")
+    print("    -o <file>         Write the JSON report to <file> instead of stdout")
+
+
+def main():
+    program_name, *argv = sys.argv
+
+    sizes = DEFAULT_SIZES
+    kinds = list(SYNTHESIZERS)
+    repeat = DEFAULT_REPEAT
+    corpus = True
+    output_path = None
+    while len(argv) > 0 and argv[0].startswith("-"):
+        arg, *argv = argv
+        if arg == "-no-corpus":
+            corpus = False
+            continue
+        if arg not in ("-sizes", "-only", "-repeat", "-o"):
+            usage(program_name)
+            print("[ERROR] unknown option %s" % arg, file=sys.stderr)
+            exit(1)
+        if len(argv) == 0:
+            usage(program_name)
+            print("[ERROR] no argument is provided for parameter %s" % arg, file=sys.stderr)
+            exit(1)
+        value, *argv = argv
+        if arg == "-sizes":
+            sizes = [int(size) for size in value.split(",")]
+        elif arg == "-only":
+            kinds = value.split(",")
+            for kind in kinds:
+                if kind not in SYNTHESIZERS:
+                    usage(program_name)
+                    print("[ERROR] unknown program kind %s" % kind, file=sys.stderr)
+                    exit(1)
+        elif arg == "-repeat":
+            repeat = max(1, int(value))
+        else:
+            output_path = value
+
+    programs = [(path.basename(program_path), program_path) for program_path in argv]
+    if corpus:
+        programs += [(path.relpath(program_path, PORTH_DIRECTORY), program_path) for program_path in corpus_programs()]
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for kind in kinds:
+            for size in sizes:
+                program_path = path.join(directory, "%s_%d.porth" % (kind, size))
+                with open(program_path, "w") as f:
+                    f.write(SYNTHESIZERS[kind](size))
+                print("[INFO] Benchmarking %s (size %d)" % (kind, size), file=sys.stderr)
+                result = benchmark_program(kind, program_path, directory, repeat)
+                result["size"] = size
+                results.append(result)
+        for name, program_path in programs:
+            print("[INFO] Benchmarking %s" % name, file=sys.stderr)
+            results.append(benchmark_program(name, program_path, directory, repeat))
+
+    report = json.dumps({"repeat": repeat, "results": results}, indent=2)
+    if output_path is None:
+        print(report)
+    else:
+        with open(output_path, "w") as f:
+            f.write(report)
+            f.write("\n")
+
+
+if __name__ == '__main__':
+    main()
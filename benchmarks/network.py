@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Network benchmark of the emulated socket syscalls.
+
+Compiles the Porth server in `benchmarks/servers` with `porth-jvm.py com`, starts it on a local JVM and sends it
+requests over loopback, one connection per request, reporting the latency percentiles and the requests per second as
+JSON. The report has the format of `benchmarks.runtime`, two reports are compared with
+`python -m benchmarks.runtime diff`.
+
+Usage: python -m benchmarks.network [OPTIONS]
+"""
+import hashlib
+import json
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from os import path
+from typing import List
+
+from benchmarks.runtime import DEFAULT_COMPILER, BENCHMARKS_DIRECTORY, compile_workload, percentile
+
+SERVER = path.join(BENCHMARKS_DIRECTORY, "servers", "http.porth")
+# Address the server listens on, set in its source
+SERVER_ADDRESS = ("127.0.0.1", 6969)
+REQUEST = b"GET / HTTP/1.0\r\n\r\n"
+DEFAULT_WARMUP = 1000
+DEFAULT_REQUESTS = 10000
+STARTUP_TIMEOUT = 30
+
+
+def request() -> bytes:
+    with socket.create_connection(SERVER_ADDRESS) as connection:
+        connection.sendall(REQUEST)
+        response = b""
+        while True:
+            data = connection.recv(4096)
+            if not data:
+                return response
+            response += data
+
+
+def wait_for_server(server: subprocess.Popen):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError("the server exited with code %d" % server.returncode)
+        try:
+            request()
+            return
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def benchmark_server(compiler: str, compiler_args: List[str], java: str, java_args: List[str], warmup: int,
+                     requests: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        compile_workload(compiler, compiler_args, SERVER, directory)
+        compile_time = time.perf_counter() - start
+
+        jar_path = path.join(directory, "Main.jar")
+        class_path = jar_path if path.exists(jar_path) else directory
+        server = subprocess.Popen([java] + java_args + ["-cp", class_path, "Main"], stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL)
+        try:
+            wait_for_server(server)
+            # Discarded requests to warm up the JIT
+            for _ in range(warmup):
+                request()
+
+            samples = []
+            response = b""
+            start = time.perf_counter()
+            for _ in range(requests):
+                request_start = time.perf_counter()
+                response = request()
+                samples.append(time.perf_counter() - request_start)
+            elapsed = time.perf_counter() - start
+        finally:
+            server.kill()
+            server.wait()
+
+    return {
+        "name": path.splitext(path.basename(SERVER))[0],
+        "compile_time": compile_time,
+        "iterations": requests,
+        "mean": sum(samples) / len(samples),
+        "min": min(samples),
+        "p50": percentile(samples, 50),
+        "p90": percentile(samples, 90),
+        "p99": percentile(samples, 99),
+        "max": max(samples),
+        # Requests per second
+        "throughput": requests / elapsed,
+        "output_sha256": hashlib.sha256(response).hexdigest(),
+        "samples": samples,
+    }
+
+
+def usage(program_name: str):
+    print("Usage: %s [OPTIONS]" % program_name)
+    print("  OPTIONS:")
+    print("    -compiler <porth-jvm.py>  Compiler build to benchmark (default: this checkout)")
+    print("    -com <arg>                Pass <arg> to `com`, may be repeated")
+    print("    -java <java>              Java executable (default: java)")
+    print("    -jvm <arg>                Pass <arg> to the JVM, may be repeated")
+    print("    -warmup <n>               Number of discarded requests (default: %d)" % DEFAULT_WARMUP)
+    print("    -n <n>                    Number of measured requests (default: %d)" % DEFAULT_REQUESTS)
+    print("    -o <file>                 Write the JSON report to <file> instead of stdout")
+
+
+def main():
+    program_name, *argv = sys.argv
+
+    compiler = DEFAULT_COMPILER
+    compiler_args = []
+    java = "java"
+    java_args = []
+    warmup = DEFAULT_WARMUP
+    requests = DEFAULT_REQUESTS
+    output_path = None
+    while len(argv) > 0:
+        arg, *argv = argv
+        if arg not in ("-compiler", "-com", "-java", "-jvm", "-warmup", "-n", "-o"):
+            usage(program_name)
+            print("[ERROR] unknown option %s" % arg, file=sys.stderr)
+            exit(1)
+        if len(argv) == 0:
+            usage(program_name)
+            print("[ERROR] no argument is provided for parameter %s" % arg, file=sys.stderr)
+            exit(1)
+        value, *argv = argv
+        if arg == "-compiler":
+            compiler = value
+        elif arg == "-com":
+            compiler_args.append(value)
+        elif arg == "-java":
+            java = value
+        elif arg == "-jvm":
+            java_args.append(value)
+        elif arg == "-warmup":
+            warmup = int(value)
+        elif arg == "-n":
+            requests = max(1, int(value))
+        else:
+            output_path = value
+
+    print("[INFO] Benchmarking %s" % SERVER, file=sys.stderr)
+    report = json.dumps({
+        "compiler": path.abspath(compiler),
+        "compiler_args": compiler_args,
+        "java": java,
+        "java_args": java_args,
+        "warmup": warmup,
+        "results": [benchmark_server(compiler, compiler_args, java, java_args, warmup, requests)],
+    }, indent=2)
+    if output_path is None:
+        print(report)
+    else:
+        with open(output_path, "w") as f:
+            f.write(report)
+            f.write("\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import os
+from os import path
+from typing import Callable, Dict, List
+
+PORTH_DIRECTORY = path.join(path.dirname(path.dirname(path.abspath(__file__))), "porth")
+
+
+def synthesize_ops(size: int) -> str:
+    # Straight-line arithmetic in the main method
+    return "".join(f"{i} {i + 1} + {i % 7 + 1} * print\n" for i in range(size))
+
+
+def synthesize_procedures(size: int) -> str:
+    # Procedures that are all called from the main method
+    procedures = "".join(f"proc p{i} int -- int in {i} + end\n" for i in range(size))
+    calls = "".join(f"{i} p{i} print\n" for i in range(size))
+    return procedures + calls
+
+
+def synthesize_strings(size: int) -> str:
+    # Distinct string literals written to stdout
+    return "".join(f"\"string {i}\\n\" 1 1 syscall3 drop\n" for i in range(size))
+
+
+def synthesize_nesting(size: int) -> str:
+    # Deeply nested conditions inside a loop
+    return (
+        "0 while dup 10 < do\n"
+        + "".join(f"dup {i} >= if\n" for i in range(size))
+        + "dup print\n"
+        + "end\n" * size
+        + "1 +\nend drop\n"
+    )
+
+
+SYNTHESIZERS: Dict[str, Callable[[int], str]] = {
+    "ops": synthesize_ops,
+    "procedures": synthesize_procedures,
+    "strings": synthesize_strings,
+    "nesting": synthesize_nesting,
+}
+
+
+def corpus_programs() -> List[str]:
+    """
+    Real programs of the porth submodule (which use `std`), if the submodule is checked out.
+    """
+    programs = []
+    for directory in ("examples", "euler"):
+        directory = path.join(PORTH_DIRECTORY, directory)
+        if path.isdir(directory):
+            programs.extend(sorted(path.join(directory, name)
+                                   for name in os.listdir(directory) if name.endswith(".porth")))
+    return programs
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Runtime benchmark of the generated classes.
+
+Compiles the Porth workloads in `benchmarks/workloads` with `porth-jvm.py com` and runs each of them repeatedly on a
+local JVM, reporting latency percentiles and throughput as JSON. Two reports, e.g. of two compiler builds, can be
+compared with the `diff` subcommand.
+
+Usage: python -m benchmarks.runtime run [OPTIONS] [workload.porth...]
+       python -m benchmarks.runtime diff <old.json> <new.json>
+"""
+import hashlib
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from os import path
+from typing import List
+
+BENCHMARKS_DIRECTORY = path.dirname(path.abspath(__file__))
+WORKLOADS_DIRECTORY = path.join(BENCHMARKS_DIRECTORY, "workloads")
+DEFAULT_COMPILER = path.join(path.dirname(BENCHMARKS_DIRECTORY), "porth-jvm.py")
+DEFAULT_WARMUP = 2
+DEFAULT_ITERATIONS = 10
+
+
+def workloads() -> List[str]:
+    return sorted(path.join(WORKLOADS_DIRECTORY, name)
+                  for name in os.listdir(WORKLOADS_DIRECTORY) if name.endswith(".porth"))
+
+
+def percentile(samples: List[float], p: float) -> float:
+    # Nearest-rank percentile
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def compile_workload(compiler: str, compiler_args: List[str], workload: str, directory: str):
+    # `com` always writes `Main.jar` (`Main.class` before the runtime class) into the current working directory
+    subprocess.run([sys.executable, compiler, "com", "-s"] + compiler_args + [workload],
+                   cwd=directory, check=True, stdout=subprocess.DEVNULL)
+
+
+def run_workload(java: str, java_args: List[str], directory: str) -> (float, bytes):
+    jar_path = path.join(directory, "Main.jar")
+    class_path = jar_path if path.exists(jar_path) else directory
+    start = time.perf_counter()
+    process = subprocess.run([java] + java_args + ["-cp", class_path, "Main"], stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start, process.stdout
+
+
+def benchmark_workload(workload: str, compiler: str, compiler_args: List[str], java: str, java_args: List[str],
+                       warmup: int, iterations: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        compile_workload(compiler, compiler_args, workload, directory)
+        compile_time = time.perf_counter() - start
+
+        # Discarded runs to warm up the file system cache
+        for _ in range(warmup):
+            run_workload(java, java_args, directory)
+
+        samples = []
+        output = b""
+        for _ in range(iterations):
+            elapsed, output = run_workload(java, java_args, directory)
+            samples.append(elapsed)
+
+    return {
+        "name": path.splitext(path.basename(workload))[0],
+        "compile_time": compile_time,
+        "iterations": iterations,
+        "mean": sum(samples) / len(samples),
+        "min": min(samples),
+        "p50": percentile(samples, 50),
+        "p90": percentile(samples, 90),
+        "p99": percentile(samples, 99),
+        "max": max(samples),
+        # Runs per second
+        "throughput": len(samples) / sum(samples),
+        # Lets `diff` detect builds that change the behaviour of a workload
+        "output_sha256": hashlib.sha256(output).hexdigest(),
+        "samples": samples,
+    }
+
+
+def diff(old_path: str, new_path: str):
+    with open(old_path) as f:
+        old = {result["name"]: result for result in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = {result["name"]: result for result in json.load(f)["results"]}
+
+    print("%-16s %12s %12s %9s" % ("workload", "old p50 [s]", "new p50 [s]", "change"))
+    for name in sorted(old.keys() & new.keys()):
+        old_p50 = old[name]["p50"]
+        new_p50 = new[name]["p50"]
+        note = ""
+        if old[name]["output_sha256"] != new[name]["output_sha256"]:
+            note = "  [output differs]"
+        print("%-16s %12.4f %12.4f %+8.1f%%%s" % (name, old_p50, new_p50, (new_p50 / old_p50 - 1) * 100, note))
+    for name in sorted(old.keys() ^ new.keys()):
+        print("%-16s only in %s" % (name, old_path if name in old else new_path))
+
+
+def usage(program_name: str):
+    print("Usage: %s <SUBCOMMAND> [ARGS]" % program_name)
+    print("  SUBCOMMANDS:")
+    print("    run [OPTIONS] [workload.porth...]  Benchmark the given workloads (default: all in %s)"
+          % path.relpath(WORKLOADS_DIRECTORY))
+    print("      OPTIONS:")
+    print("        -compiler <porth-jvm.py>  Compiler build to benchmark (default: this checkout)")
+    print("        -com <arg>                Pass <arg> to `com`, may be repeated")
+    print("        -java <java>              Java executable (default: java)")
+    print("        -jvm <arg>                Pass <arg> to the JVM, may be repeated")
+    print("        -warmup <n>               Number of discarded runs (default: %d)" % DEFAULT_WARMUP)
+    print("        -n <n>                    Number of measured runs (default: %d)" % DEFAULT_ITERATIONS)
+    print("        -o <file>                 Write the JSON report to <file> instead of stdout")
+    print("    diff <old.json> <new.json>        Compare the median latencies of two reports")
+
+
+def main():
+    program_name, *argv = sys.argv
+
+    if len(argv) < 1:
+        usage(program_name)
+        print("[ERROR] no subcommand is provided", file=sys.stderr)
+        exit(1)
+    subcommand, *argv = argv
+
+    if subcommand == "diff":
+        if len(argv) != 2:
+            usage(program_name)
+            print("[ERROR] two reports are expected for `diff`", file=sys.stderr)
+            exit(1)
+        diff(*argv)
+    elif subcommand == "run":
+        compiler = DEFAULT_COMPILER
+        compiler_args = []
+        java = "java"
+        java_args = []
+        warmup = DEFAULT_WARMUP
+        iterations = DEFAULT_ITERATIONS
+        output_path = None
+        while len(argv) > 0 and argv[0].startswith("-"):
+            arg, *argv = argv
+            if arg not in ("-compiler", "-com", "-java", "-jvm", "-warmup", "-n", "-o"):
+                usage(program_name)
+                print("[ERROR] unknown option %s" % arg, file=sys.stderr)
+                exit(1)
+            if len(argv) == 0:
+                usage(program_name)
+                print("[ERROR] no argument is provided for parameter %s" % arg, file=sys.stderr)
+                exit(1)
+            value, *argv = argv
+            if arg == "-compiler":
+                compiler = value
+            elif arg == "-com":
+                compiler_args.append(value)
+            elif arg == "-java":
+                java = value
+            elif arg == "-jvm":
+                java_args.append(value)
+            elif arg == "-warmup":
+                warmup = int(value)
+            elif arg == "-n":
+                iterations = max(1, int(value))
+            else:
+                output_path = value
+
+        results = []
+        for workload in argv or workloads():
+            print("[INFO] Benchmarking %s" % workload, file=sys.stderr)
+            results.append(benchmark_workload(path.abspath(workload), compiler, compiler_args, java, java_args,
+                                              warmup, iterations))
+
+        report = json.dumps({
+            "compiler": path.abspath(compiler),
+            "compiler_args": compiler_args,
+            "java": java,
+            "java_args": java_args,
+            "warmup": warmup,
+            "results": results,
+        }, indent=2)
+        if output_path is None:
+            print(report)
+        else:
+            with open(output_path, "w") as f:
+                f.write(report)
+                f.write("\n")
+    else:
+        usage(program_name)
+        print("[ERROR] unknown subcommand %s" % subcommand, file=sys.stderr)
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
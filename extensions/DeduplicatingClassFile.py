@@ -8,7 +8,7 @@ from extensions.DeduplicatingConstantPool import DeduplicatingConstantPool
 class DeduplicatingClassFile(ClassFile):
     def __init__(self, source: IO = None):
         super().__init__(source)
-        self._version = ClassVersion(51, 0)
+        self._version = ClassVersion(52, 0)
         self._constants = DeduplicatingConstantPool()
 
     @classmethod
@@ -1,44 +1,44 @@
-from typing import Callable, Tuple, Any, Union
+from struct import pack
+from typing import Tuple, Any, Union, Dict, Optional
 
 from jawa.constants import ConstantPool, InterfaceMethodRef, MethodReference, FieldReference, NameAndType, String, \
-    ConstantClass, Double, Long, Float, Integer, _constant_types, Constant, UTF8, Module, InvokeDynamic, PackageInfo, \
+    ConstantClass, Double, Long, Float, Integer, Constant, UTF8, Module, InvokeDynamic, PackageInfo, \
     MethodHandle, MethodType, MethodHandleKind
 
+RawConstant = Tuple[Any, ...]
+
 
 class DeduplicatingConstantPool(ConstantPool):
+    _index: Dict[RawConstant, int]
+
+    def __init__(self):
+        super().__init__()
+        self._index = dict()
 
     @staticmethod
-    def _equals(other: Constant) -> Callable[[Constant], bool]:
-        def test(constant: Constant) -> bool:
-            if hasattr(constant, "pack") and hasattr(other, "pack"):
-                return constant.pack() == other.pack()
-            else:
-                return False
-
-        return test
-
-    def append(self, constant: Union[None, Tuple[Any, ...]]):
-        found = None
-        inserted = False
-        if constant is not None:
-            found = self.find_one(self.get_constant_type(constant),
-                                  self._equals(self.create_constant(constant)))
-        if found is None:
+    def _key(constant: RawConstant) -> RawConstant:
+        # Floats and doubles are keyed on their packed representation, so that -0.0/0.0 and NaNs
+        # are told apart (or merged) exactly like they would be in the emitted class file.
+        if constant[0] == 4:
+            return 4, pack('>f', constant[1])
+        elif constant[0] == 6:
+            return 6, pack('>d', constant[1])
+        return constant
+
+    def append(self, constant: Union[None, RawConstant]) -> Tuple[Optional[Constant], bool]:
+        if constant is None:
             self._pool.append(constant)
-            inserted = True
-            if constant:
-                found = self.get(self.raw_count - 1)
-        # else:
-        # print("In constant pool")
+            return None, True
 
-        return found, inserted
+        key = self._key(constant)
+        index = self._index.get(key)
+        if index is not None:
+            return self.get(index), False
 
-    def create_constant(self, constant):
-        return self.get_constant_type(constant)(self._pool, 0, *constant[1:])
-
-    @staticmethod
-    def get_constant_type(constant):
-        return _constant_types[constant[0]]
+        index = self.raw_count
+        self._pool.append(constant)
+        self._index[key] = index
+        return self.get(index), True
 
     def create_utf8(self, value) -> UTF8:
         return self.append((1, value))[0]
@@ -0,0 +1,67 @@
+from struct import pack
+from typing import List, Tuple
+
+from jawa.attributes.stack_map_table import StackMapTableAttribute, TYPES_WITH_EXTRA
+
+VerificationTypeInfo = Tuple[int, ...]
+
+
+class PackingStackMapTableAttribute(StackMapTableAttribute):
+    """
+    Packs frames given by their absolute offset and complete types, choosing the most compact frame type.
+    """
+    initial_locals: List[VerificationTypeInfo]
+    entries: List[Tuple[int, List[VerificationTypeInfo], List[VerificationTypeInfo]]]
+
+    def __init__(self, table, name_index=None):
+        super().__init__(table, name_index)
+        self.initial_locals = []
+        self.entries = []
+
+    def pack(self) -> bytes:
+        out = bytearray(pack(">H", len(self.entries)))
+        previous_offset = -1
+        previous_locals = self.initial_locals
+        for offset, locals_, stack in self.entries:
+            delta = offset - previous_offset - 1
+            added = len(locals_) - len(previous_locals)
+            if not stack and locals_ == previous_locals:
+                if delta < 64:
+                    # same_frame
+                    out += pack(">B", delta)
+                else:
+                    # same_frame_extended
+                    out += pack(">BH", 251, delta)
+            elif len(stack) == 1 and locals_ == previous_locals:
+                if delta < 64:
+                    # same_locals_1_stack_item_frame
+                    out += pack(">B", 64 + delta)
+                else:
+                    # same_locals_1_stack_item_frame_extended
+                    out += pack(">BH", 247, delta)
+                out += self._pack_types(stack)
+            elif not stack and -3 <= added < 0 and locals_ == previous_locals[:len(locals_)]:
+                # chop_frame
+                out += pack(">BH", 251 + added, delta)
+            elif not stack and 0 < added <= 3 and locals_[:len(previous_locals)] == previous_locals:
+                # append_frame
+                out += pack(">BH", 251 + added, delta)
+                out += self._pack_types(locals_[len(previous_locals):])
+            else:
+                out += pack(">BHH", 255, delta, len(locals_))
+                out += self._pack_types(locals_)
+                out += pack(">H", len(stack))
+                out += self._pack_types(stack)
+            previous_offset = offset
+            previous_locals = locals_
+        return bytes(out)
+
+    @staticmethod
+    def _pack_types(types: List[VerificationTypeInfo]) -> bytes:
+        out = bytearray()
+        for verification_type in types:
+            if verification_type[0] in TYPES_WITH_EXTRA:
+                out += pack(">BH", *verification_type)
+            else:
+                out += pack(">B", verification_type[0])
+        return bytes(out)
@@ -0,0 +1,71 @@
+from typing import Iterable, List
+
+from jawa.assemble import Label
+from jawa.util.bytecode import opcode_table
+
+from jvm.intrinsics import InstructionsType
+
+# Largest offset of a branch with a 16-bit operand
+MAX_BRANCH_OFFSET = 32767
+
+NEGATED_BRANCHES = {
+    "ifeq": "ifne",
+    "ifne": "ifeq",
+    "iflt": "ifge",
+    "ifge": "iflt",
+    "ifgt": "ifle",
+    "ifle": "ifgt",
+    "if_icmpeq": "if_icmpne",
+    "if_icmpne": "if_icmpeq",
+    "if_icmplt": "if_icmpge",
+    "if_icmpge": "if_icmplt",
+    "if_icmpgt": "if_icmple",
+    "if_icmple": "if_icmpgt",
+    "if_acmpeq": "if_acmpne",
+    "if_acmpne": "if_acmpeq",
+    "ifnull": "ifnonnull",
+    "ifnonnull": "ifnull",
+}
+
+
+def instruction_size(instruction: InstructionsType, offset: int = 0) -> int:
+    """
+    Size of the instruction in bytes, the padding of a `lookupswitch` depends on its `offset` in the code.
+    """
+    if isinstance(instruction, Label):
+        return 0
+    mnemonic, *operands = instruction
+    if mnemonic == "lookupswitch":
+        # Padding to a multiple of 4, default, number of pairs and the pairs
+        return 1 + (3 - offset % 4) + 8 + 8 * len(operands[0])
+    info = opcode_table[mnemonic]
+    if info.get("can_be_wide") and isinstance(operands[0], int) and \
+            any(isinstance(operand, int) and operand >= 255 for operand in operands):
+        # Prefixed by `wide` with 16-bit operands
+        return 2 + 2 * len(operands)
+    return 1 + sum(fmt.value.size for fmt, _ in info["operands"] or ())
+
+
+def code_size(instructions: Iterable[InstructionsType]) -> int:
+    return sum(map(instruction_size, instructions))
+
+
+def widen_branches(instructions: Iterable[InstructionsType]) -> List[InstructionsType]:
+    """
+    Replaces the branches by `goto_w`, conditional branches jump over a `goto_w` with the negated condition.
+    Only needed if the code is larger than `MAX_BRANCH_OFFSET`.
+    """
+    widened: List[InstructionsType] = []
+    for instruction in instructions:
+        if isinstance(instruction, Label):
+            widened.append(instruction)
+        elif instruction[0] == "goto":
+            widened.append(("goto_w", instruction[1]))
+        elif instruction[0] in NEGATED_BRANCHES:
+            skip = Label(f"wide_{len(widened)}")
+            widened.append((NEGATED_BRANCHES[instruction[0]], skip))
+            widened.append(("goto_w", instruction[1]))
+            widened.append(skip)
+        else:
+            widened.append(instruction)
+    return widened
@@ -0,0 +1,133 @@
+"""
+Content-addressed cache of the classes generated by `porth-jvm.py com`.
+
+A compilation is identified by the compiler sources, the codegen options and the program path. Its manifest records
+every file that was opened while parsing (the program and its includes, including the include paths that were tried
+and did not exist) with the hash of its content. The cache hits if all of them are unchanged.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+from contextlib import contextmanager
+from os import path
+from typing import Dict, Optional, Iterator, Iterable, List
+
+CACHE_DIRECTORY_ENV = "PORTH_JVM_CACHE"
+COMPILER_DIRECTORY = path.dirname(path.dirname(path.abspath(__file__)))
+# Sources that affect the generated class, relative to `COMPILER_DIRECTORY`
+COMPILER_SOURCES = ["porth-jvm.py", "jvm", "extensions", path.join("porth", "porth.py")]
+
+# Files opened while recording, None if not recording
+_opened_files: Optional[List[str]] = None
+# Audit hooks cannot be removed, so `_audit` is installed once, on the first recording
+_audit_hook_installed = False
+
+
+def _audit(event: str, args: tuple):
+    # Modules imported while recording are covered by `compiler_version` or do not affect the class
+    if event == "open" and _opened_files is not None and isinstance(args[0], str) \
+            and not args[0].endswith((".py", ".pyc")):
+        _opened_files.append(path.abspath(args[0]))
+
+
+@contextmanager
+def record_opened_files() -> Iterator[List[str]]:
+    global _opened_files, _audit_hook_installed
+    if not _audit_hook_installed:
+        sys.addaudithook(_audit)
+        _audit_hook_installed = True
+    opened_files = []
+    _opened_files = opened_files
+    try:
+        yield opened_files
+    finally:
+        _opened_files = None
+
+
+def default_cache_directory() -> str:
+    return os.environ.get(CACHE_DIRECTORY_ENV) or path.join(
+        os.environ.get("XDG_CACHE_HOME") or path.join(path.expanduser("~"), ".cache"), "porth-jvm")
+
+
+def file_hash(file_path: str) -> Optional[str]:
+    # None if the file does not exist
+    try:
+        with open(file_path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        return None
+
+
+def compiler_version() -> str:
+    """
+    Hash of the sources of the compiler.
+    """
+    digest = hashlib.sha256()
+    for source in COMPILER_SOURCES:
+        source_path = path.join(COMPILER_DIRECTORY, source)
+        if path.isdir(source_path):
+            files = sorted(path.join(directory, name)
+                           for directory, _, names in os.walk(source_path) for name in names if name.endswith(".py"))
+        else:
+            files = [source_path]
+        for file in files:
+            digest.update(path.relpath(file, COMPILER_DIRECTORY).encode())
+            digest.update((file_hash(file) or "").encode())
+    return digest.hexdigest()
+
+
+class CompileCache:
+    def __init__(self, directory: str, program_path: str, options: Iterable[str]):
+        self.directory = directory
+        key = hashlib.sha256()
+        for part in (compiler_version(), path.abspath(program_path), *options):
+            key.update(part.encode())
+            key.update(b"\0")
+        self.key = key.hexdigest()
+
+    @property
+    def manifest_path(self) -> str:
+        return path.join(self.directory, "manifests", self.key + ".json")
+
+    def class_path(self, class_hash: str) -> str:
+        return path.join(self.directory, "classes", class_hash + ".class")
+
+    def lookup(self, out_file_path: str) -> bool:
+        """
+        Copies the cached class to `out_file_path` if none of the files of the last compilation changed.
+        """
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+
+        files: Dict[str, Optional[str]] = manifest["files"]
+        if any(file_hash(file_path) != content_hash for file_path, content_hash in files.items()):
+            return False
+        class_path = self.class_path(manifest["class"])
+        if not path.isfile(class_path):
+            return False
+        shutil.copyfile(class_path, out_file_path)
+        return True
+
+    def store(self, out_file_path: str, opened_files: Iterable[str]):
+        class_hash = file_hash(out_file_path)
+        manifest = {
+            "files": {file_path: file_hash(file_path) for file_path in sorted(set(opened_files))},
+            "class": class_hash,
+        }
+        with open(out_file_path, "rb") as f:
+            write_atomic(self.class_path(class_hash), f.read())
+        write_atomic(self.manifest_path, json.dumps(manifest, indent=1).encode())
+
+
+def write_atomic(file_path: str, content: bytes):
+    # Concurrent compilations only ever see complete files
+    os.makedirs(path.dirname(file_path) or ".", exist_ok=True)
+    temporary_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(content)
+    os.replace(temporary_path, file_path)
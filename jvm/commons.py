@@ -5,7 +5,7 @@ from jawa.cf import ClassFile
 from jawa.constants import Constant, MethodReference, FieldReference, InterfaceMethodRef
 from jawa.util.bytecode import Instruction
 
-from jvm.context import GenerateContext
+from jvm.context import GenerateContext, MemoryBackend
 from jvm.instructions import INSTRUCTIONS, OperandType, Instructions
 
 LONG_SIZE = 8
@@ -43,17 +43,56 @@ def print_long(cf: ClassFile, instructions: MutableSequence):
 
 
 def print_long_method_instructions(context: GenerateContext) -> Instructions:
-    return (
-        Instructions(context)
+    instructions = Instructions(context)
+    if not context.buffered_output:
+        (
+            instructions
+            # `System.out` writes to the standard output until the file descriptor 1 is replaced (see `dup2`)
+            .get_static_field(context.fd_ref)
+            .push_integer(1)
+            .load_array_reference()
+            .get_static_field(context.cf.constants.create_field_ref("java/io/FileDescriptor", "out",
+                                                                    "Ljava/io/FileDescriptor;"))
+            .branch_if_reference_not_equal("redirected")
             .load_long(0)
-            .get_static_field(context.cf.constants.create_field_ref("java/lang/System", "out", "Ljava/io/PrintStream;"))
+            .get_static_field(context.cf.constants.create_field_ref("java/lang/System", "out",
+                                                                    "Ljava/io/PrintStream;"))
             .move_short_behind_long()
-            .invoke_virtual(context.cf.constants.create_method_ref(
-            "java/io/PrintStream",
-            "println",
-            "(J)V"
-        ))
+            .invoke_virtual(context.cf.constants.create_method_ref("java/io/PrintStream", "println", "(J)V"))
             .return_void()
+            .label("redirected")
+        )
+    if context.memory_backend != MemoryBackend.NATIVE:
+        (
+            instructions
+            # Nothing is printed once the file descriptor 1 is closed
+            .get_static_field(context.fd_ref)
+            .push_integer(1)
+            .load_array_reference()
+            .branch_if_reference_is_not_null("print")
+            .get_static_field(context.channels_ref)
+            .push_integer(1)
+            .load_array_reference()
+            .branch_if_reference_is_null("return")
+            .label("print")
+        )
+    # Print through the stdout stream, buffered or not, to keep the order with the output of the write syscall
+    return (
+        instructions
+        .push_integer(1)
+        .invoke_static(context.output_stream_method)
+        # Stack: stream
+        .duplicate_top_of_stack()
+        .load_long(0)
+        .invoke_static(context.cf.constants.create_method_ref("java/lang/Long", "toString",
+                                                              "(J)Ljava/lang/String;"))
+        .string_get_bytes()
+        # Stack: stream, stream, string (as byte array)
+        .invoke_virtual(context.cf.constants.create_method_ref("java/io/OutputStream", "write", "([B)V"))
+        .push_integer(ord("\n"))
+        .invoke_virtual(context.cf.constants.create_method_ref("java/io/OutputStream", "write", "(I)V"))
+        .label("return")
+        .return_void()
     )
 
 
@@ -0,0 +1,144 @@
+import io
+import multiprocessing
+import os
+import sys
+import time
+from contextlib import redirect_stdout, redirect_stderr
+from dataclasses import dataclass
+from os import path
+from typing import Optional, List, Tuple
+
+from jvm.cache import CompileCache, default_cache_directory, record_opened_files
+from jvm.context import MemoryBackend, ReturnConvention, GenerateContext
+from jvm.generator import generate_jvm_bytecode, generate_runtime
+from jvm.runtime import Runtime, RuntimeCache, JAR_EXT, write_runtime
+from porth.porth import Program, ParseContext, parse_program_from_file, type_check_program, PORTH_EXT
+
+
+@dataclass(frozen=True)
+class CompileOptions:
+    include_paths: Tuple[str, ...]
+    unsafe: bool = False
+    memory_backend: MemoryBackend = MemoryBackend.BYTES
+    buffered_output: bool = False
+    peephole: bool = True
+    return_convention: ReturnConvention = ReturnConvention.SLOTS
+    use_cache: bool = True
+
+
+@dataclass
+class CompileResult:
+    program_path: str
+    out_file_path: str
+    # Wall time in seconds
+    time: float
+    cached: bool
+    # Output of the failed compilation, None if it succeeded
+    error: Optional[str] = None
+
+
+def compile_program(program_path: str, out_file_path: str, options: CompileOptions, silent: bool = True) \
+        -> Optional[GenerateContext]:
+    """
+    Compiles the program into `out_file_path`, a JAR or a class file, the class is named after the file.
+    Returns None if the program was copied from the compile cache.
+    """
+    # The includes are also searched next to the program
+    include_paths = list(options.include_paths) + [path.dirname(program_path)]
+    runtime = load_runtime(options)
+
+    cache: Optional[CompileCache] = None
+    if options.use_cache:
+        # The include paths are resolved against the working directory
+        cache = CompileCache(default_cache_directory(), program_path,
+                             [path.basename(out_file_path), options.memory_backend.value,
+                              options.return_convention.value, str(options.buffered_output), str(options.peephole),
+                              str(options.unsafe)] + [path.abspath(include_path) for include_path in include_paths])
+        if cache.lookup(out_file_path):
+            if not out_file_path.endswith(JAR_EXT):
+                write_runtime(path.dirname(out_file_path), runtime)
+            if not silent:
+                print("[INFO] Using cached %s" % out_file_path)
+            return None
+
+    parse_context = ParseContext()
+    with record_opened_files() as opened_files:
+        parse_program_from_file(parse_context, program_path, include_paths)
+    program = Program(ops=parse_context.ops, memory_capacity=parse_context.memory_capacity)
+    if not options.unsafe:
+        type_check_program(program, {proc.addr: proc for proc in parse_context.procs.values()})
+    if not silent:
+        print("[INFO] Generating %s" % out_file_path)
+    context = generate_jvm_bytecode(parse_context, program, out_file_path, program_path, options.memory_backend,
+                                    options.buffered_output, options.peephole, options.return_convention, runtime)
+    if not silent:
+        for rule, hits in context.peephole_hits.most_common():
+            print("[INFO] Peephole rule %s applied %d times" % (rule, hits))
+    if cache is not None:
+        cache.store(out_file_path, opened_files)
+    return context
+
+
+def load_runtime(options: CompileOptions) -> Runtime:
+    def generate() -> Runtime:
+        return generate_runtime(options.memory_backend, options.buffered_output, options.peephole)
+
+    if not options.use_cache:
+        return generate()
+    return RuntimeCache(default_cache_directory(),
+                        [options.memory_backend.value, str(options.buffered_output), str(options.peephole)]).load(generate)
+
+
+def batch_programs(inputs: List[str]) -> List[str]:
+    # Directories are expanded to the programs directly inside of them
+    programs = []
+    for input_path in inputs:
+        if path.isdir(input_path):
+            programs.extend(sorted(path.join(input_path, name)
+                                   for name in os.listdir(input_path) if name.endswith(PORTH_EXT)))
+        else:
+            programs.append(input_path)
+    return programs
+
+
+def batch_out_file_path(program_path: str, out_directory: Optional[str]) -> str:
+    basename = path.basename(program_path)
+    if basename.endswith(PORTH_EXT):
+        basename = basename[:-len(PORTH_EXT)]
+    return path.join(out_directory if out_directory is not None else path.dirname(program_path), basename + ".class")
+
+
+def _compile_job(job: Tuple[str, str, CompileOptions]) -> CompileResult:
+    program_path, out_file_path, options = job
+    start = time.perf_counter()
+    # Porth reports errors on stdout or stderr and exits, the output is kept for the report
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output), redirect_stderr(output):
+            context = compile_program(program_path, out_file_path, options)
+    except (Exception, SystemExit) as e:
+        error = output.getvalue().strip() or f"{type(e).__name__}: {e}"
+        return CompileResult(program_path, out_file_path, time.perf_counter() - start, False, error)
+    return CompileResult(program_path, out_file_path, time.perf_counter() - start, context is None)
+
+
+def compile_batch(programs: List[str], out_directory: Optional[str], options: CompileOptions,
+                  jobs: int) -> List[CompileResult]:
+    """
+    Compiles the programs across a pool of `jobs` processes, a failure does not stop the other compilations.
+    The results are printed as they complete and returned in the order of the programs.
+    """
+    batch = [(program_path, batch_out_file_path(program_path, out_directory), options) for program_path in programs]
+    # Forked workers share the modules that are already imported, e.g. jawa and the instruction table
+    start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+    results = []
+    with multiprocessing.get_context(start_method).Pool(jobs) as pool:
+        for result in pool.imap(_compile_job, batch):
+            if result.error is not None:
+                print("[ERROR] %s failed after %.3fs:\n%s" % (result.program_path, result.time, result.error),
+                      file=sys.stderr)
+            else:
+                print("[INFO] %s -> %s in %.3fs%s" % (result.program_path, result.out_file_path, result.time,
+                                                        " (cached)" if result.cached else ""))
+            results.append(result)
+    return results
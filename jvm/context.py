@@ -1,5 +1,7 @@
+from collections import Counter
 from dataclasses import dataclass
-from typing import Dict, OrderedDict, Tuple
+from enum import Enum
+from typing import Dict, OrderedDict, Tuple, Optional
 
 from jawa.constants import MethodReference, FieldReference
 
@@ -8,35 +10,158 @@ from jvm.intrinsics.procedures import Procedure
 from porth.porth import Program
 
 
+class MemoryBackend(Enum):
+    # Multi-byte values are assembled from single bytes of the `memory` array
+    BYTES = "bytes"
+    # Multi-byte values are accessed through little-endian `VarHandle` views of the `memory` array
+    VAR_HANDLE = "varhandle"
+    # The memory is an off-heap `MemorySegment` with 64-bit addresses, reserved once and committed by the OS on first
+    # touch, so it grows in place
+    SEGMENT = "segment"
+    # Segment backend addressed with the native addresses of the reservation, the syscalls are passed to the kernel
+    # through the C library instead of being emulated
+    NATIVE = "native"
+
+    @property
+    def is_segment(self) -> bool:
+        return self in (MemoryBackend.SEGMENT, MemoryBackend.NATIVE)
+
+
+class ReturnConvention(Enum):
+    # Multiple return values are returned in a newly allocated `long[]`
+    ARRAY = "array"
+    # Multiple return values are stored in the static `return_values` array, the procedure returns void
+    SLOTS = "slots"
+
+
 @dataclass(init=False)
 class GenerateContext:
     program: Program
     program_name: str
+    memory_backend: MemoryBackend
+    buffered_output: bool
+    return_convention: ReturnConvention
+    # Size of the `return_values` array, the maximum number of outputs of a procedure or an outlined region
+    return_values_size: int
+    peephole: bool
+    # Number of applications of every peephole rule
+    peephole_hits: Counter
     procedures: Dict[str, Procedure]
     strings: OrderedDict[str, int]
+    # Whether `main` copies the arguments and the environment to the memory, see `scan_startup_requirements`
+    uses_argv: bool
+    uses_envp: bool
 
     cf: DeduplicatingClassFile
 
     print_long_method: MethodReference
     prepare_argv_method: MethodReference
     prepare_envp_method: MethodReference
+    # The native backend has all of them, the other backends emulate syscall1 to syscall6
+    syscall0_method: MethodReference
     syscall1_method: MethodReference
     syscall2_method: MethodReference
     syscall3_method: MethodReference
+    syscall4_method: MethodReference
+    syscall5_method: MethodReference
+    syscall6_method: MethodReference
     extend_mem_method: MethodReference
     store_64_method: MethodReference
+    store_32_method: MethodReference
+    store_16_method: MethodReference
+    # Only used by the segment backend, the other backends store bytes inline
+    store_8_method: MethodReference
     load_64_method: MethodReference
     load_32_method: MethodReference
     load_16_method: MethodReference
     load_8_method: MethodReference
-    put_string_method: MethodReference
+    put_strings_method: MethodReference
     cstring_to_string_method: MethodReference
+    input_stream_method: MethodReference
+    output_stream_method: MethodReference
+    flush_stdout_method: MethodReference
+    read_method: MethodReference
+    write_method: MethodReference
+    write_stdout_method: MethodReference
+    write_stderr_method: MethodReference
+    grow_fds_method: MethodReference
+    allocate_fd_method: MethodReference
+    fd_entry_method: MethodReference
+    aliased_method: MethodReference
+    channel_method: MethodReference
+    file_channel_method: MethodReference
+    seek_append_method: MethodReference
+    open_method: MethodReference
+    lseek_method: MethodReference
+    fstat_method: MethodReference
+    mmap_method: MethodReference
+    close_method: MethodReference
+    dup_method: MethodReference
+    dup2_method: MethodReference
+    pipe_method: MethodReference
+    sendfile_method: MethodReference
+    socket_address_method: MethodReference
+    socket_method: MethodReference
+    bind_method: MethodReference
+    listen_method: MethodReference
+    accept_method: MethodReference
+    connect_method: MethodReference
+    shutdown_method: MethodReference
+    setsockopt_method: MethodReference
+    sendto_method: MethodReference
+    recvfrom_method: MethodReference
+    poll_method: MethodReference
 
     memory_ref: FieldReference
+    memory_top_ref: FieldReference
+    # Top of the mapped files, the memory below it is never released (not used by the native backend)
+    memory_floor_ref: FieldReference
+    # None if no method returns multiple values through `return_values`
+    return_values_ref: Optional[FieldReference]
+    long_view_ref: FieldReference
+    int_view_ref: FieldReference
+    short_view_ref: FieldReference
+    # Highest top of the memory so far, the segment above it has never been used and is still zeroed
+    memory_high_ref: FieldReference
+    long_layout_ref: FieldReference
+    int_layout_ref: FieldReference
+    short_layout_ref: FieldReference
+    # Native backend: address of the memory of the program, the handle of the C `syscall` function and the buffer
+    # that receives its `errno`
+    memory_base_ref: FieldReference
+    syscall_handle_ref: FieldReference
+    call_state_ref: FieldReference
     argc_ref: FieldReference
     argv_ref: FieldReference
     envp_ref: FieldReference
     fd_ref: FieldReference
+    # Files and sockets opened by the program, indexed like `fd_ref` (not used by the native backend)
+    channels_ref: FieldReference
+    # Channels of the files opened with O_APPEND (not used by the native backend)
+    appending_ref: FieldReference
+    # Selector of `poll`, opened on first use (not used by the native backend)
+    selector_ref: FieldReference
+    input_streams_ref: FieldReference
+    output_streams_ref: FieldReference
+
+    # Name of the class that declares the members of `runtime_references`
+    runtime_class_name: str
+    # Attribute -> ("field" or "method", name, descriptor) of the members that are referenced on first use
+    runtime_references: Dict[str, Tuple[str, str, str]]
+
+    def __getattr__(self, attribute: str):
+        # Only called for the attributes that are not set: the constant pool of a program only gets the references to
+        # the runtime members it actually uses
+        references = self.__dict__.get("runtime_references")
+        if references is None or attribute not in references:
+            raise AttributeError(attribute)
+        kind, name, descriptor = references[attribute]
+        if kind == "field":
+            reference = self.cf.constants.create_field_ref(self.runtime_class_name, name, descriptor)
+        else:
+            reference = self.cf.constants.create_method_ref(self.runtime_class_name, name, descriptor)
+        setattr(self, attribute, reference)
+        return reference
 
     def get_string(self, string: str) -> int:
         if string not in self.strings:
@@ -51,6 +176,9 @@ class GenerateContext:
         return self.strings[string]
 
     def get_strings_size(self) -> int:
+        if len(self.strings) == 0:
+            return 0
+
         # noinspection PyTypeChecker
         last_string: Tuple[str, int] = next(reversed(self.strings.items()))
         size = last_string[1] + len(last_string[0].encode("utf-8"))
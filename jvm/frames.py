@@ -0,0 +1,428 @@
+from typing import NamedTuple, Union, Optional, List, Tuple, Dict, Iterable
+
+from jawa.assemble import Label
+from jawa.constants import ConstantPool, ConstantClass, Integer, Float, Long, Double, String, MethodHandle, \
+    MethodType, Reference, InvokeDynamic
+from jawa.util.verifier import VerificationTypes
+
+from jvm.branches import instruction_size
+from jvm.intrinsics import InstructionsType
+
+
+class VerificationType(NamedTuple):
+    tag: int
+    # Internal name of the class of an `ITEM_Object` or index of the `new` instruction of an `ITEM_Uninitialized`
+    value: Union[str, int, None] = None
+
+    @property
+    def size(self) -> int:
+        return 2 if self.tag in (VerificationTypes.ITEM_Long, VerificationTypes.ITEM_Double) else 1
+
+    @property
+    def is_reference(self) -> bool:
+        return self.tag in (VerificationTypes.ITEM_Object, VerificationTypes.ITEM_Null)
+
+
+TOP = VerificationType(VerificationTypes.ITEM_Top)
+INTEGER = VerificationType(VerificationTypes.ITEM_Integer)
+FLOAT = VerificationType(VerificationTypes.ITEM_Float)
+LONG = VerificationType(VerificationTypes.ITEM_Long)
+DOUBLE = VerificationType(VerificationTypes.ITEM_Double)
+NULL = VerificationType(VerificationTypes.ITEM_Null)
+
+OBJECT_CLASS = "java/lang/Object"
+# Superclasses of the classes that may meet at a branch target, others are merged to `java/lang/Object`
+SUPERCLASSES: Dict[str, str] = {
+    "java/io/InputStream": OBJECT_CLASS,
+    "java/io/OutputStream": OBJECT_CLASS,
+    "java/io/FileInputStream": "java/io/InputStream",
+    "java/io/FileOutputStream": "java/io/OutputStream",
+    "java/io/FilterOutputStream": "java/io/OutputStream",
+    "java/io/BufferedOutputStream": "java/io/FilterOutputStream",
+}
+
+NEW_ARRAY_TYPES = {4: "[Z", 5: "[C", 6: "[F", 7: "[D", 8: "[B", 9: "[S", 10: "[I", 11: "[J"}
+
+# Number of popped operands and pushed types of the instructions that do not depend on their operands
+SIMPLE_INSTRUCTIONS: Dict[str, Tuple[int, Tuple[VerificationType, ...]]] = {
+    "nop": (0, ()),
+    "aconst_null": (0, (NULL,)),
+    **{f"iconst_{value}": (0, (INTEGER,)) for value in ("m1", 0, 1, 2, 3, 4, 5)},
+    "lconst_0": (0, (LONG,)),
+    "lconst_1": (0, (LONG,)),
+    "bipush": (0, (INTEGER,)),
+    "sipush": (0, (INTEGER,)),
+    **{mnemonic: (1, (INTEGER,)) for mnemonic in ("ineg", "i2b", "i2c", "i2s", "l2i", "arraylength", "instanceof")},
+    **{mnemonic: (1, (LONG,)) for mnemonic in ("lneg", "i2l")},
+    **{mnemonic: (2, (INTEGER,)) for mnemonic in ("iadd", "isub", "imul", "idiv", "irem", "ishl", "ishr", "iushr",
+                                                  "iand", "ior", "ixor", "lcmp", "iaload", "baload", "caload",
+                                                  "saload")},
+    **{mnemonic: (2, (LONG,)) for mnemonic in ("ladd", "lsub", "lmul", "ldiv", "lrem", "lshl", "lshr", "lushr",
+                                               "land", "lor", "lxor", "laload")},
+    **{mnemonic: (3, ()) for mnemonic in ("iastore", "bastore", "castore", "sastore", "lastore", "aastore")},
+    **{mnemonic: (1, ()) for mnemonic in ("pop", "ifeq", "ifne", "iflt", "ifge", "ifgt", "ifle", "ifnull",
+                                          "ifnonnull", "lookupswitch", "tableswitch", "ireturn", "lreturn",
+                                          "areturn", "athrow", "monitorenter", "monitorexit")},
+    **{mnemonic: (2, ()) for mnemonic in ("if_icmpeq", "if_icmpne", "if_icmplt", "if_icmpge", "if_icmpgt",
+                                          "if_icmple", "if_acmpeq", "if_acmpne")},
+    "goto": (0, ()),
+    "goto_w": (0, ()),
+    "return": (0, ()),
+    "iinc": (0, ()),
+}
+
+# Instructions after which the execution does not continue with the next instruction
+UNCONDITIONAL = {"goto", "goto_w", "lookupswitch", "tableswitch", "ireturn", "lreturn", "freturn", "dreturn",
+                 "areturn", "return", "athrow"}
+
+
+class Frame(NamedTuple):
+    # One entry per local variable slot, the second slot of a long or double is `TOP`
+    locals: Tuple[VerificationType, ...]
+    stack: Tuple[VerificationType, ...]
+
+
+class FrameAnalysis(NamedTuple):
+    # Reachable instructions
+    instructions: List[InstructionsType]
+    # Frames at the labels that are branch targets
+    frames: Dict[str, Frame]
+    initial: Frame
+    max_stack: int
+    max_locals: int
+
+
+def object_type(class_name: str) -> VerificationType:
+    return VerificationType(VerificationTypes.ITEM_Object, class_name)
+
+
+def field_type(descriptor: str) -> VerificationType:
+    if descriptor[0] in "IZBSC":
+        return INTEGER
+    elif descriptor[0] == "J":
+        return LONG
+    elif descriptor[0] == "F":
+        return FLOAT
+    elif descriptor[0] == "D":
+        return DOUBLE
+    elif descriptor[0] == "L":
+        return object_type(descriptor[1:-1])
+    elif descriptor[0] == "[":
+        return object_type(descriptor)
+    raise ValueError(f"Invalid field descriptor {descriptor}")
+
+
+def method_types(descriptor: str) -> Tuple[List[VerificationType], Optional[VerificationType]]:
+    parameters = []
+    i = 1
+    while descriptor[i] != ")":
+        start = i
+        while descriptor[i] == "[":
+            i += 1
+        if descriptor[i] == "L":
+            i = descriptor.index(";", i)
+        i += 1
+        parameters.append(field_type(descriptor[start:i]))
+    return_type = None if descriptor[i + 1] == "V" else field_type(descriptor[i + 1:])
+    return parameters, return_type
+
+
+def component_type(array: VerificationType) -> VerificationType:
+    if array == NULL:
+        return NULL
+    return field_type(array.value[1:])
+
+
+def common_superclass(a: str, b: str) -> str:
+    ancestors = set()
+    while a is not None:
+        ancestors.add(a)
+        a = SUPERCLASSES.get(a)
+    while b is not None:
+        if b in ancestors:
+            return b
+        b = SUPERCLASSES.get(b)
+    return OBJECT_CLASS
+
+
+def merge_types(a: VerificationType, b: VerificationType) -> VerificationType:
+    if a == b:
+        return a
+    if a.is_reference and b.is_reference:
+        if a == NULL:
+            return b
+        if b == NULL:
+            return a
+        return object_type(common_superclass(a.value, b.value))
+    return TOP
+
+
+def merge_frames(label: str, a: Frame, b: Frame) -> Frame:
+    if a == b:
+        return a
+    if len(a.stack) != len(b.stack):
+        raise Exception(f"Inconsistent stack size at {label}: {a.stack} and {b.stack}")
+    stack = tuple(merge_types(x, y) for x, y in zip(a.stack, b.stack))
+    if TOP in stack:
+        raise Exception(f"Inconsistent stack types at {label}: {a.stack} and {b.stack}")
+    # Variables that are only defined on one of the paths can not be used after the merge
+    locals_ = tuple(merge_types(x, y) for x, y in zip(a.locals, b.locals))
+    while locals_ and locals_[-1] == TOP:
+        locals_ = locals_[:-1]
+    return Frame(locals_, stack)
+
+
+def parameter_locals(descriptor: str) -> Tuple[VerificationType, ...]:
+    # The generated methods are static
+    locals_ = []
+    for parameter in method_types(descriptor)[0]:
+        locals_.append(parameter)
+        if parameter.size == 2:
+            locals_.append(TOP)
+    return tuple(locals_)
+
+
+def _pop_slots(stack: List[VerificationType], slots: int) -> List[VerificationType]:
+    popped = []
+    while slots > 0:
+        operand = stack.pop()
+        popped.insert(0, operand)
+        slots -= operand.size
+    if slots < 0:
+        raise Exception("Operation splits a long or double on the stack")
+    return popped
+
+
+def _store(locals_: List[VerificationType], index: int, operand: VerificationType):
+    while len(locals_) < index + operand.size:
+        locals_.append(TOP)
+    if index > 0 and locals_[index - 1].size == 2:
+        # Overwrites the second half of a long or double
+        locals_[index - 1] = TOP
+    locals_[index] = operand
+    if operand.size == 2:
+        locals_[index + 1] = TOP
+
+
+def _local_index(mnemonic: str, operands: tuple) -> int:
+    # `lload 4` or `lload_0`
+    return operands[0] if operands else int(mnemonic[-1])
+
+
+def execute(frame: Frame, index: int, instruction: tuple) -> Frame:
+    """
+    Types after the instruction, `index` identifies a `new` instruction in the uninitialized type it creates.
+    """
+    mnemonic, *operands = instruction
+    locals_ = list(frame.locals)
+    stack = list(frame.stack)
+
+    if mnemonic in SIMPLE_INSTRUCTIONS:
+        pops, pushes = SIMPLE_INSTRUCTIONS[mnemonic]
+        del stack[len(stack) - pops:]
+        stack.extend(pushes)
+    elif mnemonic in ("ldc", "ldc_w", "ldc2_w"):
+        constant = operands[0]
+        if isinstance(constant, Integer):
+            stack.append(INTEGER)
+        elif isinstance(constant, Float):
+            stack.append(FLOAT)
+        elif isinstance(constant, Long):
+            stack.append(LONG)
+        elif isinstance(constant, Double):
+            stack.append(DOUBLE)
+        elif isinstance(constant, String):
+            stack.append(object_type("java/lang/String"))
+        elif isinstance(constant, ConstantClass):
+            stack.append(object_type("java/lang/Class"))
+        elif isinstance(constant, MethodHandle):
+            stack.append(object_type("java/lang/invoke/MethodHandle"))
+        elif isinstance(constant, MethodType):
+            stack.append(object_type("java/lang/invoke/MethodType"))
+        else:
+            raise NotImplementedError(constant)
+    elif mnemonic.startswith(("iload", "lload", "fload", "dload", "aload")) and mnemonic != "aaload":
+        local_index = _local_index(mnemonic, operands)
+        stack.append({"i": INTEGER, "l": LONG, "f": FLOAT, "d": DOUBLE}.get(mnemonic[0], None) or
+                     locals_[local_index])
+    elif mnemonic.startswith(("istore", "lstore", "fstore", "dstore", "astore")) and mnemonic != "aastore":
+        _store(locals_, _local_index(mnemonic, operands), stack.pop())
+    elif mnemonic == "aaload":
+        del stack[-1]
+        stack.append(component_type(stack.pop()))
+    elif mnemonic in ("dup", "dup_x1", "dup_x2", "dup2", "dup2_x1", "dup2_x2"):
+        top = _pop_slots(stack, 2 if mnemonic.startswith("dup2") else 1)
+        under = _pop_slots(stack, int(mnemonic[-1])) if "_x" in mnemonic else []
+        stack.extend(top + under + top)
+    elif mnemonic == "swap":
+        stack[-1], stack[-2] = stack[-2], stack[-1]
+    elif mnemonic == "pop2":
+        _pop_slots(stack, 2)
+    elif mnemonic in ("getstatic", "getfield"):
+        if mnemonic == "getfield":
+            stack.pop()
+        stack.append(field_type(operands[0].name_and_type.descriptor.value))
+    elif mnemonic in ("putstatic", "putfield"):
+        stack.pop()
+        if mnemonic == "putfield":
+            stack.pop()
+    elif mnemonic in ("invokestatic", "invokevirtual", "invokespecial", "invokeinterface", "invokedynamic"):
+        method: Union[Reference, InvokeDynamic] = operands[0]
+        parameters, return_type = method_types(method.name_and_type.descriptor.value)
+        del stack[len(stack) - len(parameters):]
+        if mnemonic not in ("invokestatic", "invokedynamic"):
+            receiver = stack.pop()
+            if method.name_and_type.name.value == "<init>":
+                initialized = object_type(method.class_.name.value)
+                stack = [initialized if operand == receiver else operand for operand in stack]
+                locals_ = [initialized if operand == receiver else operand for operand in locals_]
+        if return_type is not None:
+            stack.append(return_type)
+    elif mnemonic == "new":
+        stack.append(VerificationType(VerificationTypes.ITEM_Uninitialized, index))
+    elif mnemonic == "newarray":
+        stack[-1] = object_type(NEW_ARRAY_TYPES[operands[0]])
+    elif mnemonic == "anewarray":
+        class_name = operands[0].name.value
+        stack[-1] = object_type("[" + (class_name if class_name.startswith("[") else f"L{class_name};"))
+    elif mnemonic == "multianewarray":
+        del stack[len(stack) - operands[1]:]
+        stack.append(object_type(operands[0].name.value))
+    elif mnemonic == "checkcast":
+        stack[-1] = object_type(operands[0].name.value)
+    else:
+        raise NotImplementedError(mnemonic)
+
+    return Frame(tuple(locals_), tuple(stack))
+
+
+def branch_labels(instruction: tuple) -> List[Label]:
+    labels = []
+    for operand in instruction[1:]:
+        if isinstance(operand, Label):
+            labels.append(operand)
+        elif isinstance(operand, dict):
+            labels.extend(operand.values())
+    return labels
+
+
+def analyze(descriptor: str, instructions: Iterable[InstructionsType]) -> FrameAnalysis:
+    """
+    Computes the types of the local variables and of the operand stack at every branch target of a static method
+    and removes the instructions that are never executed.
+    """
+    code = list(instructions)
+    label_indices = {instruction.name: index for index, instruction in enumerate(code)
+                     if isinstance(instruction, Label)}
+    initial = Frame(parameter_locals(descriptor), ())
+    # Types before every instruction, None if it is not reachable
+    frames: List[Optional[Frame]] = [None] * len(code)
+    frames[0] = initial
+    max_stack = 0
+    max_locals = len(initial.locals)
+
+    # Indices of the labels whose frame changed
+    worklist = [0]
+    while worklist:
+        index = worklist.pop()
+        frame = frames[index]
+        # Walks to the end of the basic block, only labels can be reached from elsewhere
+        while True:
+            instruction = code[index]
+            if not isinstance(instruction, Label):
+                frame = execute(frame, index, instruction)
+                max_stack = max(max_stack, len(frame.stack) + frame.stack.count(LONG) + frame.stack.count(DOUBLE))
+                max_locals = max(max_locals, len(frame.locals))
+                for label in branch_labels(instruction):
+                    target = label_indices[label.name]
+                    merged = frame if frames[target] is None else merge_frames(label.name, frames[target], frame)
+                    if merged != frames[target]:
+                        frames[target] = merged
+                        worklist.append(target)
+                if instruction[0] in UNCONDITIONAL:
+                    break
+
+            index += 1
+            if index >= len(code):
+                raise Exception("Execution continues after the last instruction")
+            if isinstance(code[index], Label) and frames[index] is not None:
+                merged = merge_frames(code[index].name, frames[index], frame)
+                if merged == frames[index]:
+                    break
+                frame = merged
+            frames[index] = frame
+
+    targets = {label.name for instruction, frame in zip(code, frames)
+               if frame is not None and not isinstance(instruction, Label) for label in branch_labels(instruction)}
+    reachable = [index for index, frame in enumerate(frames) if frame is not None]
+    # The uninitialized types refer to the `new` instructions by their index in the reachable code
+    new_indices = {index: new_index for new_index, index in enumerate(reachable)}
+
+    def relocate(types: Tuple[VerificationType, ...]) -> Tuple[VerificationType, ...]:
+        return tuple(VerificationType(t.tag, new_indices[t.value]) if t.tag == VerificationTypes.ITEM_Uninitialized
+                     else t for t in types)
+
+    target_frames = {}
+    for index in reachable:
+        instruction = code[index]
+        if isinstance(instruction, Label) and instruction.name in targets:
+            # Labels at the same offset share the frame, the last one includes the jumps to all of them
+            last = index
+            while last + 1 < len(code) and isinstance(code[last + 1], Label):
+                last += 1
+            target_frames[instruction.name] = Frame(relocate(frames[last].locals), relocate(frames[last].stack))
+
+    return FrameAnalysis(
+        instructions=[code[index] for index in reachable],
+        frames=target_frames,
+        initial=initial,
+        max_stack=max_stack,
+        max_locals=max_locals,
+    )
+
+
+def instruction_offsets(instructions: Iterable[InstructionsType]) -> List[int]:
+    # Offset of every instruction and label in the assembled code
+    offsets = []
+    offset = 0
+    for instruction in instructions:
+        offsets.append(offset)
+        offset += instruction_size(instruction, offset)
+    return offsets
+
+
+def verification_type_info(constants: ConstantPool, offsets: List[int], verification_type: VerificationType) \
+        -> tuple:
+    if verification_type.tag == VerificationTypes.ITEM_Object:
+        return verification_type.tag, constants.create_class(verification_type.value).index
+    elif verification_type.tag == VerificationTypes.ITEM_Uninitialized:
+        return verification_type.tag, offsets[verification_type.value]
+    return verification_type.tag,
+
+
+def encode_locals(constants: ConstantPool, offsets: List[int], locals_: Iterable[VerificationType]) -> List[tuple]:
+    # A long or double is a single entry that covers two slots
+    encoded = []
+    skip = False
+    for local in locals_:
+        if not skip:
+            encoded.append(verification_type_info(constants, offsets, local))
+        skip = not skip and local.size == 2
+    while encoded and encoded[-1] == (VerificationTypes.ITEM_Top,):
+        encoded.pop()
+    return encoded
+
+
+def stack_map_frames(constants: ConstantPool, analysis: FrameAnalysis) -> List[Tuple[int, List[tuple], List[tuple]]]:
+    """
+    Offset, locals and stack of the frames of the `StackMapTable`, ordered by offset.
+    """
+    offsets = instruction_offsets(analysis.instructions)
+    frames = {}
+    for instruction, offset in zip(analysis.instructions, offsets):
+        if isinstance(instruction, Label) and instruction.name in analysis.frames:
+            frame = analysis.frames[instruction.name]
+            frames[offset] = (offset,
+                              encode_locals(constants, offsets, frame.locals),
+                              [verification_type_info(constants, offsets, operand) for operand in frame.stack])
+    return [frames[offset] for offset in sorted(frames)]
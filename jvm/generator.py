@@ -1,38 +1,106 @@
-import random
-from collections import OrderedDict
+from collections import OrderedDict, Counter
+from functools import lru_cache
+from io import BytesIO
+from itertools import chain
 from pathlib import Path
-from typing import Optional, Dict, Set, List
+from typing import Optional, Dict, Set, List, Callable, Tuple
 
 from jawa.assemble import Label
 from jawa.attributes.line_number_table import LineNumberTableAttribute, line_number_entry
 from jawa.attributes.source_file import SourceFileAttribute
 from jawa.cf import ClassFile
+from jawa.constants import FieldReference, MethodReference
 from jawa.methods import Method
 
 from extensions.DeduplicatingClassFile import DeduplicatingClassFile
+from extensions.PackingStackMapTableAttribute import PackingStackMapTableAttribute
 from jvm.commons import count_locals, print_long_method_instructions
-from jvm.context import GenerateContext
+from jvm.context import GenerateContext, MemoryBackend, ReturnConvention
+from jvm.frames import stack_map_frames, encode_locals
 from jvm.instructions import Instructions
-from jvm.intrinsics import get_method_input_types, OperandType
+from jvm.intrinsics import OperandType, LabelType
 from jvm.intrinsics.args import prepare_argv_method_instructions, prepare_envp_method_instructions
-from jvm.intrinsics.init import clinit_method_instructions
-from jvm.intrinsics.load import load_64_method_instructions, \
-    load_32_method_instructions, load_16_method_instructions, load_8_method_instructions
-from jvm.intrinsics.memory import extend_mem_method_instructions, put_string_method_instructions, \
-    cstring_to_string_method_instructions
+from jvm.intrinsics.init import clinit_method_instructions, runtime_clinit_method_instructions
+from jvm.intrinsics.load import load_64_method_instructions, load_32_method_instructions, \
+    load_16_method_instructions, load_8_method_instructions, load_view_method_instructions, \
+    load_segment_method_instructions
+from jvm.intrinsics.memory import extend_mem_method_instructions, extend_segment_method_instructions, \
+    put_strings_method_instructions, cstring_to_string_method_instructions, push_address
+from jvm.intrinsics.native import SEGMENT_CLASS, LAYOUTS, value_layout_ref
 from jvm.intrinsics.procedures import Procedure
-from jvm.intrinsics.store import store_32, store_16, store_8, store_64_method_instructions
-from jvm.syscalls.syscall3 import syscall3_method_instructions
+from jvm.intrinsics.store import store_32, store_16, store_8, store_64_method_instructions, \
+    store_view_method_instructions, store_segment_method_instructions
+from jvm.outline import HUGE_METHOD_LIMIT, Region, plan_regions, measure_ops
+from jvm.runtime import Runtime, RUNTIME_CLASS_NAME, link_runtime, write_program
+from jvm.syscalls import SysCalls, SYSCALL_METHODS, WRITE_STREAM_METHODS
+from jvm.syscalls.streams import input_stream_method_instructions, output_stream_method_instructions, \
+    flush_stdout_method_instructions, flush_stdout
+from jvm.syscalls.syscall3 import syscall3_method_instructions, read_method_instructions, write_method_instructions
 from jvm.syscalls.syscall2 import syscall2_method_instructions
+from jvm.syscalls.syscall4 import syscall4_method_instructions
+from jvm.syscalls.syscall5 import syscall5_method_instructions
+from jvm.syscalls.syscall6 import syscall6_method_instructions
 from jvm.syscalls.syscall1 import syscall1_method_instructions
+from jvm.syscalls.files import CHANNEL_CLASS, FILE_CHANNEL_CLASS, grow_fds_method_instructions, \
+    allocate_fd_method_instructions, fd_entry_method_instructions, aliased_method_instructions, \
+    channel_method_instructions, file_channel_method_instructions, seek_append_method_instructions, \
+    open_method_instructions, lseek_method_instructions, fstat_method_instructions, mmap_method_instructions, \
+    close_method_instructions, dup_method_instructions, dup2_method_instructions, pipe_method_instructions, \
+    sendfile_method_instructions
+from jvm.syscalls.sockets import SELECTOR_CLASS, SOCKET_ADDRESS_CLASS, READABLE_CHANNEL_CLASS, \
+    WRITABLE_CHANNEL_CLASS, socket_address_method_instructions, socket_method_instructions, \
+    bind_method_instructions, listen_method_instructions, accept_method_instructions, connect_method_instructions, \
+    shutdown_method_instructions, setsockopt_method_instructions, transfer_method_instructions, \
+    poll_method_instructions
+from jvm.syscalls.native import MAX_SYSCALL_ARGUMENTS, native_syscall_method_instructions
 from porth.porth import Program, OpType, MemAddr, OpAddr, Intrinsic, Op, Token, TokenType, ParseContext, Proc
 
+# Branch that is taken if the comparison does not hold
+COMPARISON_NEGATED_BRANCHES: Dict[Intrinsic, Callable[[Instructions, LabelType], Instructions]] = {
+    Intrinsic.EQ: Instructions.branch_if_not_equal,
+    Intrinsic.NE: Instructions.branch_if_equal,
+    Intrinsic.GT: Instructions.branch_if_less_or_equal,
+    Intrinsic.GE: Instructions.branch_if_less,
+    Intrinsic.LT: Instructions.branch_if_greater_or_equal,
+    Intrinsic.LE: Instructions.branch_if_greater,
+}
+# Ops that consume a condition and jump if it is false
+CONDITIONAL_JUMPS = (OpType.IF, OpType.IFSTAR, OpType.DO)
+# Syscall intrinsic -> number of arguments
+SYSCALL_ARITIES = {
+    Intrinsic.SYSCALL0: 0,
+    Intrinsic.SYSCALL1: 1,
+    Intrinsic.SYSCALL2: 2,
+    Intrinsic.SYSCALL3: 3,
+    Intrinsic.SYSCALL4: 4,
+    Intrinsic.SYSCALL5: 5,
+    Intrinsic.SYSCALL6: 6,
+}
+# Ops whose operand is the address of a jump target
+JUMPS = (OpType.IF, OpType.IFSTAR, OpType.ELSE, OpType.END, OpType.DO)
+
 
 def generate_jvm_bytecode(parse_context: ParseContext, program: Program, out_file_path: str,
-                          input_path: str):
+                          input_path: str, memory_backend: MemoryBackend = MemoryBackend.BYTES,
+                          buffered_output: bool = False, peephole: bool = True,
+                          return_convention: ReturnConvention = ReturnConvention.SLOTS,
+                          runtime: Optional[Runtime] = None) -> GenerateContext:
+    """
+    Writes the class of the program to `out_file_path`, see `write_program`.
+    """
+    if runtime is None:
+        runtime = generate_runtime(memory_backend, buffered_output, peephole)
+
     context = GenerateContext()
     context.procedures = dict()
     context.strings = OrderedDict()
+    context.memory_backend = memory_backend
+    context.buffered_output = buffered_output
+    context.peephole = peephole
+    context.return_convention = return_convention
+    context.peephole_hits = Counter()
+    context.return_values_ref = None
+    context.return_values_size = 0
 
     if not program.ops:
         program.ops.append(
@@ -55,20 +123,18 @@ def generate_jvm_bytecode(parse_context: ParseContext, program: Program, out_fil
 
     cf.attributes.create(SourceFileAttribute).source_file = cf.constants.create_utf8(context.program_name)
 
-    add_fields(context)
-
-    add_utility_methods(context)
+    link_runtime(context, runtime)
 
     called_procedures = scan_called_procedures(parse_context)
+    context.uses_argv, context.uses_envp = scan_startup_requirements(parse_context, called_procedures)
+    # The method of a procedure may be renamed if it collides with another method
+    procedure_methods: Dict[str, Method] = {}
 
     for name in called_procedures:
         procedure = parse_context.procs[name]
-        method_name = name
-        signature = make_signature(procedure.contract)
-        while cf.methods.find_one(name=method_name, f=lambda m: m.descriptor.value == signature):
-            method_name = f"{name}{random.randint(-2 ** 32, 2 ** 32)}"
-
-        method = create_method_prototype(cf, method_name, signature)
+        signature = make_signature(procedure.contract, return_convention)
+        method = create_method_prototype(cf, unique_method_name(cf, name, signature), signature)
+        procedure_methods[name] = method
         context.procedures[name] = Procedure(name, procedure.local_memory_capacity,
                                              cf.constants.create_method_ref(context.cf.this.name.value,
                                                                             method.name.value,
@@ -79,9 +145,14 @@ def generate_jvm_bytecode(parse_context: ParseContext, program: Program, out_fil
             line_number_entry(0, program.ops[procedure.addr].token.loc[1]),
         ]
 
+    context.return_values_size = max((len(procedure.contract.outs) for procedure in context.procedures.values()),
+                                     default=0)
+    if return_convention == ReturnConvention.SLOTS and context.return_values_size > 1:
+        require_return_values(context, context.return_values_size)
+
     for (name, procedure) in context.procedures.items():
         proc = parse_context.procs[name]
-        create_method(context, cf.methods.find_one(name=name), proc, program.ops[proc.addr:])
+        create_method(context, procedure_methods[name], proc, program.ops[proc.addr:])
 
     create_method(context, main_method, None, program.ops)
 
@@ -89,50 +160,221 @@ def generate_jvm_bytecode(parse_context: ParseContext, program: Program, out_fil
     clinit_method = create_method_prototype(context.cf, "<clinit>", "()V")
     create_method_direct(clinit_method, clinit_method_instructions(context))
 
-    with open(out_file_path, "wb") as f:
-        cf.save(f)
+    class_file = BytesIO()
+    cf.save(class_file)
+    write_program(class_file.getvalue(), str(out_file_path), runtime)
+
+    return context
+
+
+@lru_cache(maxsize=None)
+def generate_runtime(memory_backend: MemoryBackend, buffered_output: bool, peephole: bool) -> Runtime:
+    context = GenerateContext()
+    context.memory_backend = memory_backend
+    context.buffered_output = buffered_output
+    context.peephole = peephole
+    context.peephole_hits = Counter()
+    context.return_values_ref = None
+    context.cf = DeduplicatingClassFile.create(RUNTIME_CLASS_NAME)
+
+    add_fields(context)
+    add_utility_methods(context)
+    clinit_method = create_method_prototype(context.cf, "<clinit>", "()V")
+    create_method_direct(clinit_method, runtime_clinit_method_instructions(context))
+
+    # The programs access the members from their own class
+    for member in chain(context.cf.fields, context.cf.methods):
+        if member.name.value != "<clinit>":
+            member.access_flags.acc_private = False
+            member.access_flags.acc_public = True
+
+    references = {attribute: ("field" if isinstance(reference, FieldReference) else "method",
+                              reference.name_and_type.name.value, reference.name_and_type.descriptor.value)
+                  for attribute, reference in vars(context).items()
+                  if isinstance(reference, (FieldReference, MethodReference))}
+    class_file = BytesIO()
+    context.cf.save(class_file)
+    return Runtime(class_file.getvalue(), references)
 
 
 def add_fields(context: GenerateContext):
-    context.memory_ref = add_field(context, "memory", "[B")
+    if context.memory_backend.is_segment:
+        context.memory_ref = add_field(context, "memory", f"L{SEGMENT_CLASS};")
+        context.memory_high_ref = add_field(context, "memory_high", "J")
+    else:
+        context.memory_ref = add_field(context, "memory", "[B")
+    context.memory_top_ref = add_field(context, "memory_top", "J")
+    if context.memory_backend != MemoryBackend.NATIVE:
+        context.memory_floor_ref = add_field(context, "memory_floor", "J")
     context.argc_ref = add_field(context, "argc", "J")
     context.argv_ref = add_field(context, "argv", "J")
     context.envp_ref = add_field(context, "environ", "J")
     context.fd_ref = add_field(context, "fds", "[Ljava/io/FileDescriptor;")
-
-
-def add_field(context: GenerateContext, name: str, descriptor: str):
+    if context.memory_backend != MemoryBackend.NATIVE:
+        context.channels_ref = add_field(context, "channels", f"[L{CHANNEL_CLASS};")
+        context.appending_ref = add_field(context, "appending", "Ljava/util/Set;")
+        context.selector_ref = add_field(context, "selector", f"L{SELECTOR_CLASS};")
+    context.input_streams_ref = add_field(context, "input_streams", "[Ljava/io/InputStream;")
+    context.output_streams_ref = add_field(context, "output_streams", "[Ljava/io/OutputStream;")
+
+    if context.memory_backend == MemoryBackend.VAR_HANDLE:
+        # The views have to be final for the JIT to treat them as constants and inline the accesses
+        context.long_view_ref = add_field(context, "long_view", "Ljava/lang/invoke/VarHandle;", final=True)
+        context.int_view_ref = add_field(context, "int_view", "Ljava/lang/invoke/VarHandle;", final=True)
+        context.short_view_ref = add_field(context, "short_view", "Ljava/lang/invoke/VarHandle;", final=True)
+    elif context.memory_backend.is_segment:
+        # Little-endian layouts, final for the same reason as the views
+        for attribute, name, type_ in (("long_layout_ref", "long_layout", "J"),
+                                       ("int_layout_ref", "int_layout", "I"),
+                                       ("short_layout_ref", "short_layout", "S")):
+            setattr(context, attribute, add_field(context, name, f"L{LAYOUTS[type_][1]};", final=True))
+    if context.memory_backend == MemoryBackend.NATIVE:
+        context.memory_base_ref = add_field(context, "memory_base", "J", final=True)
+        context.syscall_handle_ref = add_field(context, "syscall_handle", "Ljava/lang/invoke/MethodHandle;",
+                                               final=True)
+        context.call_state_ref = add_field(context, "call_state", f"L{SEGMENT_CLASS};", final=True)
+
+
+def add_field(context: GenerateContext, name: str, descriptor: str, final: bool = False):
     field = context.cf.fields.create(name, descriptor)
     field.access_flags.acc_public = False
     field.access_flags.acc_private = True
     field.access_flags.acc_static = True
+    field.access_flags.acc_final = final
     field.access_flags.acc_synthetic = True
     return context.cf.constants.create_field_ref(context.cf.this.name.value, field.name.value, field.descriptor.value)
 
 
 def add_utility_methods(context: GenerateContext):
+    context.input_stream_method = add_utility_method(context, "input_stream", "(I)Ljava/io/InputStream;",
+                                                     input_stream_method_instructions(context))
+    context.output_stream_method = add_utility_method(context, "output_stream", "(I)Ljava/io/OutputStream;",
+                                                      output_stream_method_instructions(context))
+    if context.buffered_output:
+        context.flush_stdout_method = add_utility_method(context, "flush_stdout", "()V",
+                                                         flush_stdout_method_instructions(context))
     context.print_long_method = add_utility_method(context, "print_long", "(J)V",
                                                    print_long_method_instructions(context))
-    context.load_64_method = add_utility_method(context, "load_64", "(J)J", load_64_method_instructions(context))
-    context.load_32_method = add_utility_method(context, "load_32", "(J)J", load_32_method_instructions(context))
-    context.load_16_method = add_utility_method(context, "load_16", "(J)J", load_16_method_instructions(context))
-    context.load_8_method = add_utility_method(context, "load_8", "(J)J", load_8_method_instructions(context))
-    context.extend_mem_method = add_utility_method(context, "extend_mem", "(I)J",
-                                                   extend_mem_method_instructions(context))
-    context.put_string_method = add_utility_method(context, "put_string", "(Ljava/lang/String;)J",
-                                                   put_string_method_instructions(context))
-    context.store_64_method = add_utility_method(context, "store_64", "(JJ)V", store_64_method_instructions(context))
+    if context.memory_backend == MemoryBackend.VAR_HANDLE:
+        context.load_64_method = add_utility_method(
+            context, "load_64", "(J)J", load_view_method_instructions(context, context.long_view_ref, "J"))
+        context.load_32_method = add_utility_method(
+            context, "load_32", "(J)J", load_view_method_instructions(context, context.int_view_ref, "I"))
+        context.load_16_method = add_utility_method(
+            context, "load_16", "(J)J", load_view_method_instructions(context, context.short_view_ref, "S"))
+    elif context.memory_backend.is_segment:
+        context.load_64_method = add_utility_method(
+            context, "load_64", "(J)J", load_segment_method_instructions(context, context.long_layout_ref, "J"))
+        context.load_32_method = add_utility_method(
+            context, "load_32", "(J)J", load_segment_method_instructions(context, context.int_layout_ref, "I"))
+        context.load_16_method = add_utility_method(
+            context, "load_16", "(J)J", load_segment_method_instructions(context, context.short_layout_ref, "S"))
+    else:
+        context.load_64_method = add_utility_method(context, "load_64", "(J)J", load_64_method_instructions(context))
+        context.load_32_method = add_utility_method(context, "load_32", "(J)J", load_32_method_instructions(context))
+        context.load_16_method = add_utility_method(context, "load_16", "(J)J", load_16_method_instructions(context))
+    if context.memory_backend.is_segment:
+        context.load_8_method = add_utility_method(
+            context, "load_8", "(J)J", load_segment_method_instructions(context, value_layout_ref(context, "B"), "B"))
+        context.extend_mem_method = add_utility_method(context, "extend_mem", "(I)J",
+                                                       extend_segment_method_instructions(context))
+    else:
+        context.load_8_method = add_utility_method(context, "load_8", "(J)J", load_8_method_instructions(context))
+        context.extend_mem_method = add_utility_method(context, "extend_mem", "(I)J",
+                                                       extend_mem_method_instructions(context))
+    if context.memory_backend == MemoryBackend.VAR_HANDLE:
+        context.store_64_method = add_utility_method(
+            context, "store_64", "(JJ)V", store_view_method_instructions(context, context.long_view_ref, "J"))
+        context.store_32_method = add_utility_method(
+            context, "store_32", "(JJ)V", store_view_method_instructions(context, context.int_view_ref, "I"))
+        context.store_16_method = add_utility_method(
+            context, "store_16", "(JJ)V", store_view_method_instructions(context, context.short_view_ref, "S"))
+    elif context.memory_backend.is_segment:
+        context.store_64_method = add_utility_method(
+            context, "store_64", "(JJ)V", store_segment_method_instructions(context, context.long_layout_ref, "J"))
+        context.store_32_method = add_utility_method(
+            context, "store_32", "(JJ)V", store_segment_method_instructions(context, context.int_layout_ref, "I"))
+        context.store_16_method = add_utility_method(
+            context, "store_16", "(JJ)V", store_segment_method_instructions(context, context.short_layout_ref, "S"))
+        context.store_8_method = add_utility_method(
+            context, "store_8", "(JJ)V",
+            store_segment_method_instructions(context, value_layout_ref(context, "B"), "B"))
+    else:
+        context.store_64_method = add_utility_method(context, "store_64", "(JJ)V",
+                                                     store_64_method_instructions(context))
+    context.put_strings_method = add_utility_method(context, "put_strings", "([Ljava/lang/String;)J",
+                                                    put_strings_method_instructions(context))
     context.cstring_to_string_method = add_utility_method(context, "cstring_to_string", "(J)Ljava/lang/String;",
                                                           cstring_to_string_method_instructions(context))
 
-    context.prepare_argv_method = add_utility_method(context, "prepare_argv", "([Ljava/lang/String;)V",
+    context.prepare_argv_method = add_utility_method(context, "prepare_argv",
+                                                     "([Ljava/lang/String;Ljava/lang/String;)V",
                                                      prepare_argv_method_instructions(context))
     context.prepare_envp_method = add_utility_method(context, "prepare_envp", "()V",
                                                      prepare_envp_method_instructions(context))
 
+    if context.memory_backend == MemoryBackend.NATIVE:
+        for arity in range(MAX_SYSCALL_ARGUMENTS + 1):
+            setattr(context, f"syscall{arity}_method",
+                    add_utility_method(context, f"syscall{arity}", "(" + "J" * (arity + 1) + ")J",
+                                       native_syscall_method_instructions(context, arity)))
+        return
+
+    context.grow_fds_method = add_utility_method(context, "grow_fds", "()V", grow_fds_method_instructions(context))
+    context.allocate_fd_method = add_utility_method(context, "allocate_fd", "()I",
+                                                    allocate_fd_method_instructions(context))
+    context.fd_entry_method = add_utility_method(context, "fd_entry", "(I)Ljava/lang/Object;",
+                                                 fd_entry_method_instructions(context))
+    context.aliased_method = add_utility_method(context, "aliased", "(I)Z", aliased_method_instructions(context))
+    context.channel_method = add_utility_method(context, "channel", f"(I)L{CHANNEL_CLASS};",
+                                                channel_method_instructions(context))
+    context.file_channel_method = add_utility_method(context, "file_channel", f"(I)L{FILE_CHANNEL_CLASS};",
+                                                     file_channel_method_instructions(context))
+    context.seek_append_method = add_utility_method(context, "seek_append", "(I)V",
+                                                    seek_append_method_instructions(context))
+    context.read_method = add_utility_method(context, "sys_read", "(JJJ)J", read_method_instructions(context))
+    context.write_method = add_utility_method(context, "sys_write", "(JJJ)J", write_method_instructions(context))
+    context.write_stdout_method = add_utility_method(context, "sys_write_stdout", "(JJ)J",
+                                                     write_method_instructions(context, 1))
+    context.write_stderr_method = add_utility_method(context, "sys_write_stderr", "(JJ)J",
+                                                     write_method_instructions(context, 2))
+    context.open_method = add_utility_method(context, "sys_open", "(JJJ)J", open_method_instructions(context))
+    context.lseek_method = add_utility_method(context, "sys_lseek", "(JJJ)J", lseek_method_instructions(context))
+    context.fstat_method = add_utility_method(context, "sys_fstat", "(JJ)J", fstat_method_instructions(context))
+    context.mmap_method = add_utility_method(context, "sys_mmap", "(JJJJJJ)J", mmap_method_instructions(context))
+    context.close_method = add_utility_method(context, "sys_close", "(J)J", close_method_instructions(context))
+    context.dup_method = add_utility_method(context, "sys_dup", "(J)J", dup_method_instructions(context))
+    context.dup2_method = add_utility_method(context, "sys_dup2", "(JJ)J", dup2_method_instructions(context))
+    context.pipe_method = add_utility_method(context, "sys_pipe", "(J)J", pipe_method_instructions(context))
+    context.sendfile_method = add_utility_method(context, "sys_sendfile", "(JJJJ)J",
+                                                 sendfile_method_instructions(context))
+    context.socket_address_method = add_utility_method(context, "socket_address", f"(J)L{SOCKET_ADDRESS_CLASS};",
+                                                       socket_address_method_instructions(context))
+    context.socket_method = add_utility_method(context, "sys_socket", "(JJJ)J", socket_method_instructions(context))
+    context.bind_method = add_utility_method(context, "sys_bind", "(JJJ)J", bind_method_instructions(context))
+    context.listen_method = add_utility_method(context, "sys_listen", "(JJ)J", listen_method_instructions(context))
+    context.accept_method = add_utility_method(context, "sys_accept", "(JJJ)J", accept_method_instructions(context))
+    context.connect_method = add_utility_method(context, "sys_connect", "(JJJ)J",
+                                                connect_method_instructions(context))
+    context.shutdown_method = add_utility_method(context, "sys_shutdown", "(JJ)J",
+                                                 shutdown_method_instructions(context))
+    context.setsockopt_method = add_utility_method(context, "sys_setsockopt", "(JJJJJ)J",
+                                                   setsockopt_method_instructions(context))
+    context.sendto_method = add_utility_method(
+        context, "sys_sendto", "(JJJJJJ)J", transfer_method_instructions(context, WRITABLE_CHANNEL_CLASS, "write"))
+    context.recvfrom_method = add_utility_method(
+        context, "sys_recvfrom", "(JJJJJJ)J", transfer_method_instructions(context, READABLE_CHANNEL_CLASS, "read"))
+    context.poll_method = add_utility_method(context, "sys_poll", "(JJJ)J", poll_method_instructions(context))
+
     context.syscall1_method = add_utility_method(context, "syscall1", "(JJ)J", syscall1_method_instructions(context))
     context.syscall2_method = add_utility_method(context, "syscall2", "(JJJ)J", syscall2_method_instructions(context))
     context.syscall3_method = add_utility_method(context, "syscall3", "(JJJJ)J", syscall3_method_instructions(context))
+    context.syscall4_method = add_utility_method(context, "syscall4", "(JJJJJ)J",
+                                                 syscall4_method_instructions(context))
+    context.syscall5_method = add_utility_method(context, "syscall5", "(JJJJJJ)J",
+                                                 syscall5_method_instructions(context))
+    context.syscall6_method = add_utility_method(context, "syscall6", "(JJJJJJJ)J",
+                                                 syscall6_method_instructions(context))
 
 
 def add_utility_method(context: GenerateContext, name: str, descriptor: str, instructions: Instructions):
@@ -142,6 +384,16 @@ def add_utility_method(context: GenerateContext, name: str, descriptor: str, ins
                                                   method.descriptor.value)
 
 
+def unique_method_name(cf: ClassFile, name: str, descriptor: str) -> str:
+    # Numbered in order of creation, so that the same program always generates the same class
+    method_name = name
+    suffix = 0
+    while cf.methods.find_one(name=method_name, f=lambda m: m.descriptor.value == descriptor):
+        suffix += 1
+        method_name = f"{name}_{suffix}"
+    return method_name
+
+
 def create_method_prototype(cf: ClassFile, name: str, descriptor: str):
     method = cf.methods.create(name, descriptor, code=True)
     method.access_flags.acc_public = False
@@ -152,30 +404,133 @@ def create_method_prototype(cf: ClassFile, name: str, descriptor: str):
 
 
 def create_method(context: GenerateContext, method: Method, procedure: Optional[Proc], ops: list[Op]):
+    first_ip = 0 if not procedure else procedure.addr
+    end_ip = first_ip + len(ops) if not procedure else scan_procedure_end(ops, first_ip)
+
+    instructions = method_instructions(context, method, procedure, ops, first_ip, end_ip, {})
+    if instructions.size() > HUGE_METHOD_LIMIT:
+        # Too large to be JIT-compiled, move parts of the method into separate methods
+        regions = plan_regions(context, procedure, ops, first_ip, first_ip + 1 if procedure else first_ip, end_ip,
+                               measure_ops(instructions.instructions))
+        for region in regions:
+            create_region_method(context, method, procedure, ops, first_ip, region)
+        instructions = method_instructions(context, method, procedure, ops, first_ip, end_ip,
+                                           {region.start: region for region in regions})
+
+    return create_method_direct(method, instructions)
+
+
+def method_instructions(context: GenerateContext, method: Method, procedure: Optional[Proc], ops: list[Op],
+                        first_ip: OpAddr, end_ip: OpAddr, regions: Dict[OpAddr, Region]) -> Instructions:
     # Variables:
     # 0: argument array
 
     instructions = Instructions(context)
-    current_proc: Optional[OpAddr] = None
 
     local_variable_index = count_locals(method.descriptor.value, ()) - 1
     local_memory_var: Optional[int] = None
 
     if not procedure:  # We are in the main method
-        instructions.load_reference(0)
-        instructions.invoke_static(context.prepare_argv_method)
-        instructions.invoke_static(context.prepare_envp_method)
+        if context.uses_argv:
+            instructions.load_reference(0)
+            instructions.push_constant(context.cf.constants.create_string(context.program_name))
+            instructions.invoke_static(context.prepare_argv_method)
+        if context.uses_envp:
+            instructions.invoke_static(context.prepare_envp_method)
         # print_memory(context, instructions)
 
     if procedure and procedure.local_memory_capacity != 0:
         local_memory_var = local_variable_index
-        local_variable_index += 1
+        local_variable_index += 2
         instructions.push_integer(procedure.local_memory_capacity)
         instructions.invoke_static(context.extend_mem_method)
-        instructions.convert_long_to_integer()
-        instructions.store_integer(local_memory_var)
+        instructions.store_long(local_memory_var)
+
+    generate_ops(context, instructions, procedure, ops, first_ip, first_ip, end_ip, regions, local_memory_var,
+                 local_variable_index)
+
+    instructions.label(f"addr_{end_ip}")
 
-    for ip, op in enumerate(ops, 0 if not procedure else procedure.addr):
+    if procedure and procedure.local_memory_capacity != 0:
+        # Release the local memory by resetting the top of the memory arena
+        instructions.load_long(local_memory_var)
+        if context.memory_backend != MemoryBackend.NATIVE:
+            # The memory of the files mapped by the procedure is never released
+            instructions.get_static_field(context.memory_floor_ref)
+            instructions.invoke_static(context.cf.constants.create_method_ref("java/lang/Math", "max", "(JJ)J"))
+        instructions.put_static_field(context.memory_top_ref)
+
+    if procedure:
+        if len(procedure.contract.outs) == 0:
+            instructions.return_void()
+        elif len(procedure.contract.outs) == 1:
+            instructions.return_long()
+        else:
+            store_return_values(context, instructions, len(procedure.contract.outs), context.return_convention)
+            if context.return_convention == ReturnConvention.SLOTS:
+                instructions.return_void()
+            else:
+                instructions.return_reference()
+
+    else:
+        flush_stdout(context, instructions)
+        instructions.return_void()
+
+    return instructions
+
+
+def create_region_method(context: GenerateContext, parent: Method, procedure: Optional[Proc], ops: list[Op],
+                         first_ip: OpAddr, region: Region):
+    local_memory = procedure is not None and procedure.local_memory_capacity != 0
+    descriptor = "(" + "J" * region.inputs + ("J" if local_memory else "") + ")" + ("J" if region.outputs == 1 else "V")
+    method = create_method_prototype(context.cf,
+                                     unique_method_name(context.cf, f"{parent.name.value}${region.start}", descriptor),
+                                     descriptor)
+    region.method_ref = context.cf.constants.create_method_ref(context.cf.this.name.value, method.name.value,
+                                                               method.descriptor.value)
+    line_numbers: LineNumberTableAttribute = method.code.attributes.create(LineNumberTableAttribute)
+    line_numbers.line_no = [
+        line_number_entry(0, ops[region.start - first_ip].token.loc[1]),
+    ]
+
+    instructions = Instructions(context)
+    for i in range(region.inputs):
+        instructions.load_long(i * 2)
+    # The local memory of the procedure is passed as the last parameter
+    local_memory_var = region.inputs * 2 if local_memory else None
+
+    generate_ops(context, instructions, procedure, ops, first_ip, region.start, region.end, {}, local_memory_var,
+                 count_locals(descriptor, ()) - 1)
+
+    instructions.label(f"addr_{region.end}")
+    if region.outputs == 0:
+        instructions.return_void()
+    elif region.outputs == 1:
+        instructions.return_long()
+    else:
+        require_return_values(context, region.outputs)
+        store_return_values(context, instructions, region.outputs, ReturnConvention.SLOTS)
+        instructions.return_void()
+
+    create_method_direct(method, instructions)
+
+
+def generate_ops(context: GenerateContext, instructions: Instructions, procedure: Optional[Proc], ops: list[Op],
+                 first_ip: OpAddr, start: OpAddr, end: OpAddr, regions: Dict[OpAddr, Region],
+                 local_memory_var: Optional[int], local_variable_index: int):
+    current_proc: Optional[OpAddr] = None
+    jump_targets = scan_jump_targets(ops)
+    # Jump targets of IF and IF*, the END of an IF or IF* without ELSE is followed by one
+    skip_targets = {op.operand for op in ops if op.typ in (OpType.IF, OpType.IFSTAR)}
+    # Address of the IF, IF* or DO whose condition is evaluated by the preceding comparison
+    fused_condition_ip: Optional[OpAddr] = None
+    # End of the region that is currently skipped because it is generated into a separate method
+    outlined_end: OpAddr = start
+    # Address of the syscall whose constant arguments are being skipped, and the helper that it calls
+    constant_syscall: Optional[Tuple[OpAddr, MethodReference]] = None
+
+    for ip in range(start, end):
+        op = ops[ip - first_ip]
         # print(ip, op)
         current_label = Label(f"addr_{ip}")
 
@@ -183,11 +538,28 @@ def create_method(context: GenerateContext, method: Method, procedure: Optional[
         if not procedure and current_proc and op.typ != OpType.RET:
             continue
 
+        if ip < outlined_end:
+            continue
+
+        if ip in regions:
+            instructions.label(current_label)
+            invoke_region(context, instructions, regions[ip], local_memory_var)
+            outlined_end = regions[ip].end
+            continue
+
+        if op.typ == OpType.INTRINSIC and op.operand in COMPARISON_NEGATED_BRANCHES \
+                and ip + 1 < end and ops[ip - first_ip + 1].typ in CONDITIONAL_JUMPS \
+                and ip + 1 not in jump_targets and ip + 1 not in regions:
+            fused_condition_ip = ip + 1
+
         instructions.label(current_label)
 
         if op.typ in [OpType.PUSH_INT, OpType.PUSH_PTR]:
             assert isinstance(op.operand, int), f"This could be a bug in the parsing step {op.operand}"
-            instructions.push_long(op.operand)
+            if constant_syscall is None and op.typ == OpType.PUSH_INT:
+                constant_syscall = scan_constant_syscall(context, ops, first_ip, ip, end, jump_targets, regions)
+            if constant_syscall is None:
+                instructions.push_long(op.operand)
         elif op.typ == OpType.PUSH_BOOL:
             assert isinstance(op.operand, int), f"This could be a bug in the parsing step {op.operand}"
             instructions.push_long(op.operand)
@@ -196,38 +568,33 @@ def create_method(context: GenerateContext, method: Method, procedure: Optional[
 
             offset = context.get_string(op.operand)
             instructions.push_long(len(op.operand.encode("utf-8")))
-            instructions.push_integer(context.program.memory_capacity)
-            instructions.push_integer(offset)
-            instructions.add_integer()
-            instructions.convert_integer_to_long()
+            # The strings are stored right after the memory of the program
+            push_address(context, instructions, context.program.memory_capacity + offset)
 
         elif op.typ == OpType.PUSH_CSTR:
             assert isinstance(op.operand, str), "This could be a bug in the parsing step"
 
             offset = context.get_string(op.operand + "\0")
-            instructions.push_integer(context.program.memory_capacity)
-            instructions.push_integer(offset)
-            instructions.add_integer()
-            instructions.convert_integer_to_long()
+            push_address(context, instructions, context.program.memory_capacity + offset)
 
         elif op.typ == OpType.PUSH_GLOBAL_MEM:
             assert isinstance(op.operand, MemAddr), "This could be a bug in the parsing step"
-            instructions.push_long(op.operand)
+            push_address(context, instructions, op.operand)
         elif op.typ == OpType.PUSH_LOCAL_MEM:
             assert isinstance(op.operand, MemAddr), "This could be a bug in the parsing step"
             assert procedure, "No local memory outside a procedure"
             assert local_memory_var is not None, "No local memory defined"
 
-            instructions.load_integer(local_memory_var)
-            instructions.push_integer(op.operand)
-            instructions.add_integer()
-            instructions.convert_integer_to_long()
+            instructions.load_long(local_memory_var)
+            instructions.push_long(op.operand)
+            instructions.add_long()
 
         elif op.typ in [OpType.IF, OpType.IFSTAR]:
             assert isinstance(op.operand, OpAddr), f"This could be a bug in the parsing step {op.operand}"
-            instructions.push_long(0)
-            instructions.compare_long()
-            instructions.branch_if_false(f"addr_{op.operand}")
+            if fused_condition_ip != ip:
+                instructions.push_long(0)
+                instructions.compare_long()
+                instructions.branch_if_false(f"addr_{op.operand}")
         elif op.typ == OpType.WHILE:
             pass
         elif op.typ == OpType.ELSE:
@@ -240,11 +607,16 @@ def create_method(context: GenerateContext, method: Method, procedure: Optional[
             if ip + 1 != op.operand:
                 instructions.end_branch()
                 instructions.branch(f"addr_{op.operand}")
+                instructions.end_branch()
+            elif ip + 1 in skip_targets:
+                # The IF or IF* without ELSE jumps here with the same stack
+                instructions.end_branch()
         elif op.typ == OpType.DO:
             assert isinstance(op.operand, int), "This could be a bug in the parsing step"
-            instructions.push_long(0)
-            instructions.compare_long()
-            instructions.branch_if_false(f"addr_{op.operand}")
+            if fused_condition_ip != ip:
+                instructions.push_long(0)
+                instructions.compare_long()
+                instructions.branch_if_false(f"addr_{op.operand}")
         elif op.typ == OpType.SKIP_PROC:
             assert isinstance(op.operand, OpAddr), f"This could be a bug in the parsing step: {op.operand}"
         elif op.typ == OpType.PREP_PROC:
@@ -263,12 +635,7 @@ def create_method(context: GenerateContext, method: Method, procedure: Optional[
             instructions.invoke_static(proc.method_ref)
 
             if len(proc.contract.outs) > 1:
-                for i in range(len(proc.contract.outs) - 1, -1, -1):
-                    instructions.duplicate_top_of_stack()
-                    instructions.push_integer(i)
-                    instructions.load_array_long()
-                    instructions.move_long_behind_short()
-                instructions.drop()
+                load_return_values(context, instructions, len(proc.contract.outs), context.return_convention)
 
         elif op.typ == OpType.RET:
             assert isinstance(op.operand, int)
@@ -324,54 +691,20 @@ def create_method(context: GenerateContext, method: Method, procedure: Optional[
                 instructions.subtract_long()
             elif op.operand == Intrinsic.PRINT:
                 instructions.invoke_static(context.print_long_method)
-            elif op.operand == Intrinsic.EQ:
-                instructions.compare_long()
-                instructions.branch_if_not_equal(f"ne_{ip}")
-                instructions.push_long(1)
-                instructions.branch(f"skip_{ip}")
-                instructions.label(f"ne_{ip}")
-                instructions.push_long(0)
-                instructions.label(f"skip_{ip}")
-            elif op.operand == Intrinsic.GT:
-                instructions.compare_long()
-                instructions.branch_if_less_or_equal(f"le_{ip}")
-                instructions.push_long(1)
-                instructions.branch(f"skip_{ip}")
-                instructions.label(f"le_{ip}")
-                instructions.push_long(0)
-                instructions.label(f"skip_{ip}")
-            elif op.operand == Intrinsic.LT:
-                instructions.compare_long()
-                instructions.branch_if_greater_or_equal(f"ge_{ip}")
-                instructions.push_long(1)
-                instructions.branch(f"skip_{ip}")
-                instructions.label(f"ge_{ip}")
-                instructions.push_long(0)
-                instructions.label(f"skip_{ip}")
-            elif op.operand == Intrinsic.GE:
+            elif op.operand in COMPARISON_NEGATED_BRANCHES:
                 instructions.compare_long()
-                instructions.branch_if_less(f"lt_{ip}")
-                instructions.push_long(1)
-                instructions.branch(f"skip_{ip}")
-                instructions.label(f"lt_{ip}")
-                instructions.push_long(0)
-                instructions.label(f"skip_{ip}")
-            elif op.operand == Intrinsic.LE:
-                instructions.compare_long()
-                instructions.branch_if_greater(f"gt_{ip}")
-                instructions.push_long(1)
-                instructions.branch(f"skip_{ip}")
-                instructions.label(f"gt_{ip}")
-                instructions.push_long(0)
-                instructions.label(f"skip_{ip}")
-            elif op.operand == Intrinsic.NE:
-                instructions.compare_long()
-                instructions.branch_if_equal(f"eq_{ip}")
-                instructions.push_long(1)
-                instructions.branch(f"skip_{ip}")
-                instructions.label(f"eq_{ip}")
-                instructions.push_long(0)
-                instructions.label(f"skip_{ip}")
+                if fused_condition_ip == ip + 1:
+                    # Jump directly to where the following IF, IF* or DO would jump to
+                    COMPARISON_NEGATED_BRANCHES[op.operand](instructions, f"addr_{ops[ip - first_ip + 1].operand}")
+                else:
+                    COMPARISON_NEGATED_BRANCHES[op.operand](instructions, f"false_{ip}")
+                    instructions.push_long(1)
+                    instructions.branch(f"skip_{ip}")
+                    instructions.end_branch()
+                    instructions.end_branch()
+                    instructions.label(f"false_{ip}")
+                    instructions.push_long(0)
+                    instructions.label(f"skip_{ip}")
             elif op.operand == Intrinsic.DUP:
                 instructions.duplicate_long()
             elif op.operand == Intrinsic.SWAP:
@@ -414,6 +747,11 @@ def create_method(context: GenerateContext, method: Method, procedure: Optional[
                 instructions.get_static_field(context.envp_ref)
             elif op.operand in [Intrinsic.CAST_PTR, Intrinsic.CAST_INT, Intrinsic.CAST_BOOL]:
                 pass
+            elif constant_syscall is not None and constant_syscall[0] == ip:
+                instructions.invoke_static(constant_syscall[1])
+                constant_syscall = None
+            elif context.memory_backend == MemoryBackend.NATIVE and op.operand in SYSCALL_ARITIES:
+                instructions.invoke_static(getattr(context, f"syscall{SYSCALL_ARITIES[op.operand]}_method"))
             elif op.operand == Intrinsic.SYSCALL0:
                 # raise NotImplementedError("SYSCALL0")
                 instructions.drop_long()
@@ -426,88 +764,179 @@ def create_method(context: GenerateContext, method: Method, procedure: Optional[
             elif op.operand == Intrinsic.SYSCALL3:
                 instructions.invoke_static(context.syscall3_method)
             elif op.operand == Intrinsic.SYSCALL4:
-                instructions.drop_long()
-                instructions.drop_long()
-                instructions.drop_long()
-                instructions.drop_long()
-                instructions.drop_long()
-                instructions.push_long(0)
-                pass
+                instructions.invoke_static(context.syscall4_method)
             elif op.operand == Intrinsic.SYSCALL5:
-                instructions.drop_long()
-                instructions.drop_long()
-                instructions.drop_long()
-                instructions.drop_long()
-                instructions.drop_long()
-                instructions.drop_long()
-                instructions.push_long(0)
-                pass
+                instructions.invoke_static(context.syscall5_method)
             elif op.operand == Intrinsic.SYSCALL6:
-                instructions.drop_long()
-                instructions.drop_long()
-                instructions.drop_long()
-                instructions.drop_long()
-                instructions.drop_long()
-                instructions.drop_long()
-                instructions.drop_long()
-                instructions.push_long(0)
-                pass
+                instructions.invoke_static(context.syscall6_method)
             elif op.operand == Intrinsic.STOP:
                 pass
             else:
                 raise NotImplementedError(op.operand)
 
-    instructions.label(f"addr_{len(ops)}")
 
-    if procedure and procedure.local_memory_capacity != 0:
-        instructions.get_static_field(context.memory_ref)
-        instructions.array_length()
-        instructions.load_integer(local_memory_var)
-        instructions.subtract_integer()
-        instructions.invoke_static(context.extend_mem_method)
-        instructions.drop_long()
+def invoke_region(context: GenerateContext, instructions: Instructions, region: Region,
+                  local_memory_var: Optional[int]):
+    if local_memory_var is not None:
+        instructions.load_long(local_memory_var)
+    instructions.invoke_static(region.method_ref)
+    if region.outputs > 1:
+        load_return_values(context, instructions, region.outputs, ReturnConvention.SLOTS)
+
+
+def load_return_values(context: GenerateContext, instructions: Instructions, count: int,
+                       return_convention: ReturnConvention):
+    if return_convention == ReturnConvention.SLOTS:
+        instructions.get_static_field(context.return_values_ref)
+    # Stack: return values
+    for i in range(count - 1, -1, -1):
+        instructions.duplicate_top_of_stack()
+        instructions.push_integer(i)
+        instructions.load_array_long()
+        instructions.move_long_behind_short()
+    instructions.drop()
+
+
+def store_return_values(context: GenerateContext, instructions: Instructions, count: int,
+                        return_convention: ReturnConvention):
+    if return_convention == ReturnConvention.SLOTS:
+        instructions.get_static_field(context.return_values_ref)
+    else:
+        instructions.push_integer(count)
+        instructions.new_array(OperandType.Long.array_type)
 
-    if procedure:
-        if len(procedure.contract.outs) == 0:
-            instructions.return_void()
-        elif len(procedure.contract.outs) == 1:
-            instructions.return_long()
-        else:
-            instructions.push_integer(len(procedure.contract.outs))
-            instructions.new_array(OperandType.Long.array_type)
+    # Stack: outputs, return values
+    for i in range(count):
+        instructions.duplicate_short_behind_long()
+        instructions.push_integer(i)
+        instructions.move_top_2_behind_long()
+        instructions.store_array_long()
 
-            for i in range(len(procedure.contract.outs)):
-                instructions.duplicate_short_behind_long()
-                instructions.push_integer(i)
-                instructions.move_top_2_behind_long()
-                instructions.store_array_long()
+    if return_convention == ReturnConvention.SLOTS:
+        instructions.drop()
 
-            instructions.return_reference()
 
-    else:
-        instructions.return_void()
+def require_return_values(context: GenerateContext, size: int):
+    if context.return_values_ref is None:
+        # Final for the JIT to treat the array reference as a constant
+        context.return_values_ref = add_field(context, "return_values", "[J", final=True)
+    context.return_values_size = max(context.return_values_size, size)
 
-    return create_method_direct(method, instructions)
+
+def scan_jump_targets(ops: List[Op]) -> Set[OpAddr]:
+    return {op.operand for op in ops if op.typ in JUMPS}
+
+
+def scan_procedure_end(ops: List[Op], first_ip: OpAddr) -> OpAddr:
+    # Address of the RET of the procedure starting at `first_ip`
+    return next(ip for ip, op in enumerate(ops, first_ip) if op.typ == OpType.RET)
 
 
 def create_method_direct(method: Method,
                          instructions: Instructions):
-    assembly = instructions.assemble()
-    method.code.assemble(assembly)
-    input_variable_count = sum(map(lambda op: op.size, get_method_input_types(method)))
-    method.code.max_locals = max(input_variable_count, instructions.stack.local_count)
-    method.code.max_stack = instructions.stack.max_stack_size
+    analysis = instructions.optimize().widen().analyze_frames(method.descriptor.value)
+    method.code.assemble(instructions.assemble())
+    method.code.max_locals = analysis.max_locals
+    method.code.max_stack = analysis.max_stack
+
+    frames = stack_map_frames(method.code.cf.constants, analysis)
+    if frames:
+        stack_map_table: PackingStackMapTableAttribute = method.code.attributes.create(PackingStackMapTableAttribute)
+        stack_map_table.initial_locals = encode_locals(method.code.cf.constants, [], analysis.initial.locals)
+        stack_map_table.entries = frames
 
 
-def make_signature(contract):
+def make_signature(contract, return_convention: ReturnConvention = ReturnConvention.ARRAY):
     if len(contract.outs) == 0:
         return "(" + "J" * len(contract.ins) + ")" + "V"
     elif len(contract.outs) == 1:
         return "(" + "J" * len(contract.ins) + ")" + "J"
+    elif return_convention == ReturnConvention.SLOTS:
+        # The outputs are passed in `return_values`
+        return "(" + "J" * len(contract.ins) + ")" + "V"
     else:
         return "(" + "J" * len(contract.ins) + ")" + "[J"
 
 
+def scan_constant_syscall(context: GenerateContext, ops: List[Op], first_ip: OpAddr, ip: OpAddr, end: OpAddr,
+                          jump_targets: Set[OpAddr], regions: Dict[OpAddr, Region]
+                          ) -> Optional[Tuple[OpAddr, MethodReference]]:
+    """
+    Syscall whose number is the constant pushed at `ip`, or a `write` to stdout or stderr whose file descriptor is the
+    constant pushed at `ip` and whose number follows. Returns the address of the syscall and the helper it calls
+    directly instead of dispatching in `syscall<n>`, the constants are then not pushed.
+    """
+    if context.memory_backend == MemoryBackend.NATIVE:
+        # The kernel does the dispatch
+        return None
+
+    def following_op(address: OpAddr) -> Optional[Op]:
+        # The constants and the syscall are only fused if no jump lands between them
+        if address >= end or address in jump_targets or address in regions:
+            return None
+        return ops[address - first_ip]
+
+    def syscall_arity(op: Optional[Op]) -> Optional[int]:
+        return SYSCALL_ARITIES.get(op.operand) if op is not None and op.typ == OpType.INTRINSIC else None
+
+    constant = ops[ip - first_ip].operand
+    next_op = following_op(ip + 1)
+    if constant in WRITE_STREAM_METHODS and next_op is not None and next_op.typ == OpType.PUSH_INT \
+            and next_op.operand == SysCalls.WRITE and syscall_arity(following_op(ip + 2)) == 3:
+        return ip + 2, getattr(context, WRITE_STREAM_METHODS[constant])
+
+    methods = SYSCALL_METHODS.get(syscall_arity(next_op), {})
+    if constant not in methods:
+        return None
+    return ip + 1, getattr(context, methods[constant])
+
+
+def scan_reachable_ops(context: ParseContext, called_procedures: List[str]) -> List[Tuple[OpAddr, Op]]:
+    """
+    Ops of the main method and of the called procedures, the other procedures are not generated.
+    """
+    procedures_by_addr: Dict[OpAddr, str] = {proc.addr: name for name, proc in context.procs.items()}
+    called = set(called_procedures)
+    reachable = []
+    current_proc: Optional[str] = None
+
+    for ip, op in enumerate(context.ops):
+        if op.typ == OpType.SKIP_PROC:
+            current_proc = procedures_by_addr[ip + 1]
+        elif op.typ == OpType.RET:
+            current_proc = None
+        elif current_proc is None or current_proc in called:
+            reachable.append((ip, op))
+
+    return reachable
+
+
+def scan_startup_requirements(context: ParseContext, called_procedures: List[str]) -> Tuple[bool, bool]:
+    """
+    Whether the program reads the arguments, and whether it reads the environment (`envp` or `execve`, which passes
+    the environment to the new process). The arguments and the environment are only copied to the memory if they are
+    used.
+    """
+    jump_targets = scan_jump_targets(context.ops)
+    uses_argv = False
+    uses_envp = False
+
+    for ip, op in scan_reachable_ops(context, called_procedures):
+        if op.typ != OpType.INTRINSIC:
+            continue
+        if op.operand in (Intrinsic.ARGC, Intrinsic.ARGV):
+            uses_argv = True
+        elif op.operand == Intrinsic.ENVP:
+            uses_envp = True
+        elif op.operand == Intrinsic.SYSCALL3:
+            # The syscall number is usually pushed right before the syscall, any other number cannot be `execve`
+            previous_op = context.ops[ip - 1]
+            if ip in jump_targets or previous_op.typ != OpType.PUSH_INT or previous_op.operand == SysCalls.EXECVE:
+                uses_envp = True
+
+    return uses_argv, uses_envp
+
+
 def scan_called_procedures(
         context: ParseContext,
 ) -> List[str]:
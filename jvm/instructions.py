@@ -4,10 +4,13 @@ from typing import NamedTuple, List, Dict, Union, Callable, Deque, Iterable
 from jawa.assemble import assemble, Label, Instruction as AssemblyInstruction
 from jawa.constants import FieldReference, MethodReference, Constant, ConstantClass, InvokeDynamic, InterfaceMethodRef
 
+from jvm.branches import code_size, widen_branches, MAX_BRANCH_OFFSET
 from jvm.context import GenerateContext
+from jvm.frames import FrameAnalysis, analyze
 from jvm.intrinsics import OperandType, InstructionsType, LabelType, Instruction, Operand, \
     get_method_input_types, get_field_type, get_method_return_type
 from jvm.intrinsics.stack import Stack
+from jvm.peephole import optimize
 
 
 class InstructionInfo(NamedTuple):
@@ -1288,9 +1291,40 @@ class Instructions(object):
         else:
             return Label(label)
 
+    def optimize(self) -> 'Instructions':
+        """
+        Applies the peephole rules to the instructions, if enabled.
+        The stack model is not updated, the maximum stack size remains an upper bound.
+        """
+        if self._context.peephole:
+            instructions, hits = optimize(self._context.cf.constants, self._instructions)
+            self._instructions = deque(instructions)
+            self._context.peephole_hits.update(hits)
+        return self
+
+    def widen(self) -> 'Instructions':
+        if code_size(self._instructions) > MAX_BRANCH_OFFSET:
+            # Not every branch target may be in the range of a 16-bit offset
+            self._instructions = deque(widen_branches(self._instructions))
+        return self
+
+    def analyze_frames(self, descriptor: str) -> FrameAnalysis:
+        """
+        Computes the frames of the `StackMapTable` and removes the unreachable instructions, which have no frame.
+        """
+        analysis = analyze(descriptor, self._instructions)
+        self._instructions = deque(analysis.instructions)
+        return analysis
+
     def assemble(self) -> List[AssemblyInstruction]:
         return assemble(self._instructions)
 
+    def size(self) -> int:
+        """
+        Estimated size of the code in bytes, before the peephole rules are applied.
+        """
+        return code_size(self._instructions)
+
     def append(self, instruction: Instruction, *operands: Operand) -> 'Instructions':
         if isinstance(instruction, Label):
             self._instructions.append(instruction)
@@ -1932,6 +1966,9 @@ class Instructions(object):
     def return_double(self) -> 'Instructions':
         return self.append("dreturn")
 
+    def throw_exception(self) -> 'Instructions':
+        return self.append("athrow")
+
     # </editor-fold>
 
     # <editor-fold desc="Field operations" defaultstate="collapsed">
@@ -1962,7 +1999,9 @@ class Instructions(object):
         return self.append("invokespecial", method)
 
     def invoke_interface(self, method: InterfaceMethodRef) -> 'Instructions':
-        return self.append("invokeinterface", method, 1, 0)
+        # The count operand includes the receiver
+        count = 1 + sum(operand.size for operand in get_method_input_types(method))
+        return self.append("invokeinterface", method, count, 0)
 
     def invoke_native(self, method: MethodReference) -> 'Instructions':
         return self.append("invokenative", method)
@@ -1980,6 +2019,9 @@ class Instructions(object):
     def check_cast(self, class_: ConstantClass) -> 'Instructions':
         return self.append("checkcast", class_)
 
+    def instance_of(self, class_: ConstantClass) -> 'Instructions':
+        return self.append("instanceof", class_)
+
     # </editor-fold>
 
     # <editor-fold desc="Convenience functions" defaultstate="collapsed">
@@ -1,13 +1,25 @@
-from jvm.context import GenerateContext
+from jvm.context import GenerateContext, MemoryBackend
 from jvm.instructions import Instructions
 from jvm.intrinsics import OperandType
+from jvm.intrinsics.memory import copy_to_memory, push_address, NULL_GUARD_SIZE
+from jvm.intrinsics.native import LAYOUTS, downcall_handle, value_layout_ref, SEGMENT_CLASS
+from jvm.syscalls.files import CHANNEL_CLASS
+from jvm.syscalls.native import link_syscall
 
+# Size of the address space reserved for the memory segment, halved until the OS accepts the reservation
+MEMORY_RESERVATION = 1 << 36
+MIN_MEMORY_RESERVATION = 1 << 24
+PROT_READ_WRITE = 0x3
+# MAP_PRIVATE | MAP_ANONYMOUS | MAP_NORESERVE: the pages are only committed when they are touched
+MAP_RESERVE = 0x4022
+MAX_LONG = (1 << 63) - 1
 
-def clinit_method_instructions(context: GenerateContext) -> Instructions:
+
+def runtime_clinit_method_instructions(context: GenerateContext) -> Instructions:
+    """
+    Initializes the state of the runtime class that does not depend on the program.
+    """
     instructions = (Instructions(context)
-                    .push_integer(context.program.memory_capacity + context.get_strings_size())
-                    .new_array(OperandType.Byte.array_type)
-                    .put_static_field(context.memory_ref)
                     .push_integer(3)
                     .new_reference_array(context.cf.constants.create_class("java/io/FileDescriptor"))
                     .duplicate_top_of_stack()
@@ -28,32 +40,223 @@ def clinit_method_instructions(context: GenerateContext) -> Instructions:
         context.cf.constants.create_field_ref("java/io/FileDescriptor", "err",
                                               "Ljava/io/FileDescriptor;"))
                     .store_array_reference()
-                    .put_static_field(context.fd_ref))
-
-    large_string = context.cf.constants.create_string("".join(context.strings.keys()))
-
-    instructions.push_constant(large_string)
-    instructions.string_get_bytes()
-    # Stack: string (as byte array)
-    instructions.duplicate_top_of_stack()
-    # Stack: string (as byte array), string (as byte array)
-    instructions.push_integer(0)
-    # Stack: string (as byte array), string (as byte array), 0
-    instructions.swap()
-    # Stack: string (as byte array), 0, string (as byte array)
-    instructions.array_length()
-    # Stack: string (as byte array), 0, length
-
-    instructions.get_static_field(context.memory_ref)
-    # Stack: string (as byte array), 0, length, memory
-    instructions.swap()
-    # Stack: string (as byte array), 0, memory, length
-    instructions.push_integer(context.program.memory_capacity)
-    # Stack: string (as byte array), 0, memory, length, capacity
-    instructions.swap()
-    # Stack: string (as byte array), 0, memory, capacity, length
-    instructions.array_copy()
-    # Stack: (empty)
+                    .put_static_field(context.fd_ref)
+                    .push_integer(3)
+                    .new_reference_array(context.cf.constants.create_class("java/io/InputStream"))
+                    .put_static_field(context.input_streams_ref)
+                    .push_integer(3)
+                    .new_reference_array(context.cf.constants.create_class("java/io/OutputStream"))
+                    .put_static_field(context.output_streams_ref))
+    if context.memory_backend != MemoryBackend.NATIVE:
+        (
+            instructions
+            .push_integer(3)
+            .new_reference_array(context.cf.constants.create_class(CHANNEL_CLASS))
+            .put_static_field(context.channels_ref)
+            .new(context.cf.constants.create_class("java/util/HashSet"))
+            .duplicate_top_of_stack()
+            .invoke_special(context.cf.constants.create_method_ref("java/util/HashSet", "<init>", "()V"))
+            .put_static_field(context.appending_ref)
+        )
+
+    if context.memory_backend == MemoryBackend.VAR_HANDLE:
+        for view_ref, array_type in ((context.long_view_ref, "[J"),
+                                     (context.int_view_ref, "[I"),
+                                     (context.short_view_ref, "[S")):
+            instructions.push_constant(context.cf.constants.create_class(array_type))
+            # Stack: array class
+            instructions.get_static_field(
+                context.cf.constants.create_field_ref("java/nio/ByteOrder", "LITTLE_ENDIAN", "Ljava/nio/ByteOrder;"))
+            # Stack: array class, byte order
+            instructions.invoke_static(context.cf.constants.create_method_ref(
+                "java/lang/invoke/MethodHandles",
+                "byteArrayViewVarHandle",
+                "(Ljava/lang/Class;Ljava/nio/ByteOrder;)Ljava/lang/invoke/VarHandle;"
+            ))
+            # Stack: view
+            instructions.put_static_field(view_ref)
+    elif context.memory_backend.is_segment:
+        for layout_ref, type_ in ((context.long_layout_ref, "J"),
+                                  (context.int_layout_ref, "I"),
+                                  (context.short_layout_ref, "S")):
+            layout_class = LAYOUTS[type_][1]
+            instructions.get_static_field(value_layout_ref(context, type_, unaligned=True))
+            instructions.get_static_field(
+                context.cf.constants.create_field_ref("java/nio/ByteOrder", "LITTLE_ENDIAN", "Ljava/nio/ByteOrder;"))
+            instructions.invoke_interface(context.cf.constants.create_interface_method_ref(
+                layout_class, "withOrder", f"(Ljava/nio/ByteOrder;)L{layout_class};"))
+            instructions.put_static_field(layout_ref)
+        reserve_memory(context, instructions)
+    if context.memory_backend == MemoryBackend.NATIVE:
+        link_syscall(context, instructions)
+
+    instructions.return_void()
+
+    return instructions
+
+
+def reserve_memory(context: GenerateContext, instructions: Instructions):
+    """
+    Maps the address space of the memory segment, the mapping is released when the segment is garbage collected.
+    """
+    # Variables:
+    # 0: mmap
+    # 1: size of the reservation (long)
+    # 3: address of the reservation (long)
+    mmap = 0
+    size = 1
+    address = 3
+
+    downcall_handle(context, instructions, "mmap", "(JJIIIJ)J")
+    (
+        instructions
+        .store_reference(mmap)
+        .push_long(MEMORY_RESERVATION)
+        .store_long(size)
+        .label("reserve")
+        .load_reference(mmap)
+        .push_long(0)
+        .load_long(size)
+        .push_integer(PROT_READ_WRITE)
+        .push_integer(MAP_RESERVE)
+        .push_integer(-1)
+        .push_long(0)
+        .invoke_virtual(context.cf.constants.create_method_ref("java/lang/invoke/MethodHandle", "invokeExact",
+                                                               "(JJIIIJ)J"))
+        .duplicate_long()
+        .store_long(address)
+        # Stack: address
+        .push_long(-1)  # MAP_FAILED
+        .compare_long()
+        .branch_if_not_equal("reserved")
+        .load_long(size)
+        .push_integer(1)
+        .shift_right_long()
+        .duplicate_long()
+        .store_long(size)
+        .push_long(MIN_MEMORY_RESERVATION)
+        .compare_long()
+        .branch_if_greater_or_equal("reserve")
+        .new(context.cf.constants.create_class("java/lang/OutOfMemoryError"))
+        .duplicate_top_of_stack()
+        .push_constant(context.cf.constants.create_string("Cannot reserve the memory"))
+        .invoke_special(context.cf.constants.create_method_ref("java/lang/OutOfMemoryError", "<init>",
+                                                               "(Ljava/lang/String;)V"))
+        .throw_exception()
+
+        .label("reserved")
+    )
+    if context.memory_backend == MemoryBackend.NATIVE:
+        # The segment covers the whole address space, so that the pointers are the native addresses
+        (
+            instructions
+            .load_long(address)
+            .put_static_field(context.memory_base_ref)
+            .push_long(0)
+            .invoke_static(context.cf.constants.create_interface_method_ref(SEGMENT_CLASS, "ofAddress",
+                                                                            f"(J)L{SEGMENT_CLASS};"))
+            .push_long(MAX_LONG)
+        )
+    else:
+        (
+            instructions
+            .load_long(address)
+            .invoke_static(context.cf.constants.create_interface_method_ref(SEGMENT_CLASS, "ofAddress",
+                                                                            f"(J)L{SEGMENT_CLASS};"))
+            .load_long(size)
+        )
+    (
+        instructions
+        .invoke_static(context.cf.constants.create_interface_method_ref("java/lang/foreign/Arena", "ofAuto",
+                                                                        "()Ljava/lang/foreign/Arena;"))
+        # Stack: segment, size, arena
+        # The cleanup action is `munmap` bound to the reservation, it must not reach the segment to let it be collected
+        .push_constant(context.cf.constants.create_class("java/util/function/Consumer"))
+    )
+    downcall_handle(context, instructions, "munmap", "(JJ)I")
+    object_class = context.cf.constants.create_class("java/lang/Object")
+    (
+        instructions
+        .push_integer(0)
+        .push_integer(2)
+        .new_reference_array(object_class)
+        .duplicate_top_of_stack()
+        .push_integer(0)
+        .load_long(address)
+        .invoke_static(context.cf.constants.create_method_ref("java/lang/Long", "valueOf", "(J)Ljava/lang/Long;"))
+        .store_array_reference()
+        .duplicate_top_of_stack()
+        .push_integer(1)
+        .load_long(size)
+        .invoke_static(context.cf.constants.create_method_ref("java/lang/Long", "valueOf", "(J)Ljava/lang/Long;"))
+        .store_array_reference()
+        # Stack: segment, size, arena, Consumer, munmap, 0, [address, size]
+        .invoke_static(context.cf.constants.create_method_ref(
+            "java/lang/invoke/MethodHandles", "insertArguments",
+            "(Ljava/lang/invoke/MethodHandle;I[Ljava/lang/Object;)Ljava/lang/invoke/MethodHandle;"))
+        .push_integer(0)
+        .push_integer(1)
+        .new_reference_array(context.cf.constants.create_class("java/lang/Class"))
+        .duplicate_top_of_stack()
+        .push_integer(0)
+        .push_constant(object_class)
+        .store_array_reference()
+        .invoke_static(context.cf.constants.create_method_ref(
+            "java/lang/invoke/MethodHandles", "dropArguments",
+            "(Ljava/lang/invoke/MethodHandle;I[Ljava/lang/Class;)Ljava/lang/invoke/MethodHandle;"))
+        # Stack: segment, size, arena, Consumer, (Object) -> munmap(address, size)
+        .invoke_static(context.cf.constants.create_method_ref(
+            "java/lang/invoke/MethodHandleProxies", "asInterfaceInstance",
+            "(Ljava/lang/Class;Ljava/lang/invoke/MethodHandle;)Ljava/lang/Object;"))
+        .check_cast(context.cf.constants.create_class("java/util/function/Consumer"))
+        .invoke_interface(context.cf.constants.create_interface_method_ref(
+            SEGMENT_CLASS, "reinterpret",
+            f"(JLjava/lang/foreign/Arena;Ljava/util/function/Consumer;)L{SEGMENT_CLASS};"))
+        .put_static_field(context.memory_ref)
+    )
+
+
+def clinit_method_instructions(context: GenerateContext) -> Instructions:
+    # Variables:
+    # 0: strings (as byte array)
+    strings = 0
+
+    memory_size = context.program.memory_capacity + context.get_strings_size()
+    instructions = Instructions(context)
+    if context.memory_backend.is_segment:
+        # The memory segment is reserved by the runtime, the memory of the program is the bottom of it
+        push_address(context, instructions, memory_size)
+        (
+            instructions
+            .duplicate_long()
+            .put_static_field(context.memory_top_ref)
+            .put_static_field(context.memory_high_ref)
+        )
+    else:
+        (
+            instructions
+            .push_integer(NULL_GUARD_SIZE + memory_size)
+            .duplicate_top_of_stack()
+            .convert_integer_to_long()
+            .put_static_field(context.memory_top_ref)
+            .new_array(OperandType.Byte.array_type)
+            .put_static_field(context.memory_ref)
+        )
+
+    if context.return_values_ref is not None:
+        instructions.push_integer(context.return_values_size)
+        instructions.new_array(OperandType.Long.array_type)
+        instructions.put_static_field(context.return_values_ref)
+
+    if len(context.strings) > 0:
+        large_string = context.cf.constants.create_string("".join(context.strings.keys()))
+        instructions.push_constant(large_string)
+        instructions.string_get_bytes()
+        instructions.store_reference(strings)
+        # The strings are stored right after the memory of the program
+        copy_to_memory(context, instructions, lambda: instructions.load_reference(strings),
+                       lambda: push_address(context, instructions, context.program.memory_capacity),
+                       lambda: instructions.load_reference(strings).array_length())
 
     instructions.return_void()
 
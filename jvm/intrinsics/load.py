@@ -1,5 +1,8 @@
+from jawa.constants import FieldReference
+
 from jvm.context import GenerateContext
 from jvm.instructions import Instructions
+from jvm.intrinsics.native import segment_method_ref, LAYOUTS
 
 
 def load_64_method_instructions(context: GenerateContext) -> Instructions:
@@ -98,3 +101,38 @@ def load_8_method_instructions(context: GenerateContext) -> Instructions:
         .convert_integer_to_long()
         .return_long()
     )
+
+
+def load_view_method_instructions(context: GenerateContext, view_ref: FieldReference, type_: str) -> Instructions:
+    # Loads a little-endian value of the given type (J, I or S) through a `VarHandle` view of the memory
+    instructions = (
+        Instructions(context)
+        .get_static_field(view_ref)
+        # Stack: view
+        .get_static_field(context.memory_ref)
+        # Stack: view, memory
+        .load_long(0)
+        .convert_long_to_integer()
+        # Stack: view, memory, index (as int)
+        .invoke_virtual(context.cf.constants.create_method_ref("java/lang/invoke/VarHandle", "get", f"([BI){type_}"))
+        # Stack: value
+    )
+    if type_ != "J":
+        instructions.convert_integer_to_long()
+    return instructions.return_long()
+
+
+def load_segment_method_instructions(context: GenerateContext, layout_ref: FieldReference, type_: str) -> Instructions:
+    # Loads a value of the given type (J, I, S or B) with the byte order of the layout from the memory segment
+    instructions = (
+        Instructions(context)
+        .get_static_field(context.memory_ref)
+        .get_static_field(layout_ref)
+        .load_long(0)
+        # Stack: memory, layout, address
+        .invoke_interface(segment_method_ref(context, "get", f"(L{LAYOUTS[type_][1]};J){type_}"))
+        # Stack: value
+    )
+    if type_ != "J":
+        instructions.convert_integer_to_long()
+    return instructions.return_long()
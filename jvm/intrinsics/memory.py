@@ -1,66 +1,307 @@
-from typing import MutableSequence
+from typing import MutableSequence, Callable
 
 from jawa.assemble import Label
 
 from jvm.commons import push_int, print_string, push_constant, print_long, \
     LONG_SIZE
-from jvm.context import GenerateContext
+from jvm.context import GenerateContext, MemoryBackend
 from jvm.instructions import Instructions
-from jvm.intrinsics import OperandType
+from jvm.intrinsics.native import SEGMENT_CLASS, segment_method_ref, value_layout_ref
+
+# The memory of the program starts above address 0, which is never a valid pointer and can stand for NULL in the
+# arguments of the syscalls, like it does on Linux
+NULL_GUARD_SIZE = LONG_SIZE
 
 
 def extend_mem_method_instructions(context: GenerateContext) -> Instructions:
+    # Memory is a stack-style arena: `memory_top` is the logical size of the memory and the backing array only
+    # ever grows (geometrically), so releasing memory is a plain store to `memory_top`.
+    # Variables:
+    # 0: size to reserve (may be negative to release memory)
+    # 1: previous top of the memory (returned as the pointer to the reserved memory)
+    previous_top = 1
+
     return (
         Instructions(context)
-        .get_static_field(context.memory_ref)
-        .array_length()
+        .get_static_field(context.memory_top_ref)
+        .convert_long_to_integer()
+        # Stack: top
         .duplicate_top_of_stack()
+        # Stack: top, top
+        .store_integer(previous_top)
+        # Stack: top
         .load_integer(0)
+        # Stack: top, size
         .add_integer()
-        .new_array(OperandType.Byte.array_type)
+        # Stack: top + size
         .duplicate_top_of_stack()
+        # Stack: top + size, top + size
+        .convert_integer_to_long()
+        .put_static_field(context.memory_top_ref)
+        # Stack: new top
         .get_static_field(context.memory_ref)
-        .swap()
-        .push_integer(0)
-        .swap()
-        .push_integer(0)
+        .array_length()
+        # Stack: new top, capacity
+        .branch_if_integer_less_or_equal("reserved")
+        # Stack: (empty)
+        .get_static_field(context.memory_ref)
+        # Stack: memory
         .get_static_field(context.memory_ref)
         .array_length()
-        .duplicate_top_of_stack()
-        .push_integer(0)
-        .add_integer()
-        .invoke_static(context.cf.constants.create_method_ref("java/lang/Math", "min", "(II)I"))
-        .array_copy()
+        .push_integer(2)
+        .multiply_integer()
+        # Stack: memory, capacity * 2
+        .get_static_field(context.memory_top_ref)
+        .convert_long_to_integer()
+        # Stack: memory, capacity * 2, new top
+        .invoke_static(context.cf.constants.create_method_ref("java/lang/Math", "max", "(II)I"))
+        # Stack: memory, new capacity
+        .invoke_static(context.cf.constants.create_method_ref("java/util/Arrays", "copyOf", "([BI)[B"))
+        # Stack: new memory
         .put_static_field(context.memory_ref)
+        # Stack: (empty)
+        .label("reserved")
+        .load_integer(0)
+        .branch_if_less_or_equal("return")
+        # Memory below the capacity may have been used before, clear it to hand out zeroed memory
+        .get_static_field(context.memory_ref)
+        .load_integer(previous_top)
+        .get_static_field(context.memory_top_ref)
+        .convert_long_to_integer()
+        .push_integer(0)
+        .convert_integer_to_byte()
+        # Stack: memory, top, new top, 0
+        .invoke_static(context.cf.constants.create_method_ref("java/util/Arrays", "fill", "([BIIB)V"))
+        .label("return")
+        .load_integer(previous_top)
         .convert_integer_to_long()
         .return_long()
     )
 
 
-def put_string_method_instructions(context: GenerateContext) -> Instructions:
+def extend_segment_method_instructions(context: GenerateContext) -> Instructions:
+    # The memory segment is reserved up front, reserving memory only moves `memory_top`. The pages above
+    # `memory_high` have never been touched and are still zeroed.
+    # Variables:
+    # 0: size to reserve (may be negative to release memory)
+    # 1: previous top of the memory (returned as the pointer to the reserved memory)
+    previous_top = 1
+
     return (
+        Instructions(context)
+        .get_static_field(context.memory_top_ref)
+        # Stack: top
+        .duplicate_long()
+        .store_long(previous_top)
+        .load_integer(0)
+        .convert_integer_to_long()
+        .add_long()
+        .put_static_field(context.memory_top_ref)
+        # Stack: (empty)
+        .load_integer(0)
+        .branch_if_less_or_equal("return")
+        .load_long(previous_top)
+        .get_static_field(context.memory_high_ref)
+        .compare_long()
+        .branch_if_greater_or_equal("untouched")
+        # Memory below the highest top may have been used before, clear it to hand out zeroed memory
+        .get_static_field(context.memory_ref)
+        .load_long(previous_top)
+        .get_static_field(context.memory_top_ref)
+        .get_static_field(context.memory_high_ref)
+        .invoke_static(context.cf.constants.create_method_ref("java/lang/Math", "min", "(JJ)J"))
+        .load_long(previous_top)
+        .subtract_long()
+        # Stack: memory, top, min(new top, highest top) - top
+        .invoke_interface(segment_method_ref(context, "asSlice", f"(JJ)L{SEGMENT_CLASS};"))
+        .push_integer(0)
+        .invoke_interface(segment_method_ref(context, "fill", f"(B)L{SEGMENT_CLASS};"))
+        .pop()
+        .label("untouched")
+        .get_static_field(context.memory_top_ref)
+        .get_static_field(context.memory_high_ref)
+        .invoke_static(context.cf.constants.create_method_ref("java/lang/Math", "max", "(JJ)J"))
+        .put_static_field(context.memory_high_ref)
+        .label("return")
+        .load_long(previous_top)
+        .return_long()
+    )
+
+
+def push_address(context: GenerateContext, instructions: Instructions, offset: int):
+    """
+    Pushes the pointer (as long) to the given offset of the memory of the program.
+    """
+    if context.memory_backend == MemoryBackend.NATIVE:
+        # Pointers are native addresses, the memory of the program starts at the bottom of the reservation
+        instructions.push_long(offset)
+        instructions.get_static_field(context.memory_base_ref)
+        instructions.add_long()
+    else:
+        instructions.push_long(NULL_GUARD_SIZE + offset)
+
+
+def copy_to_memory(context: GenerateContext, instructions: Instructions, push_array: Callable[[], Instructions],
+                   push_pointer: Callable[[], Instructions], push_length: Callable[[], Instructions]):
+    """
+    Copies a byte array to the memory, the callbacks push the array, the pointer (as long) and the length.
+    """
+    push_array()
+    instructions.push_integer(0)
+    instructions.get_static_field(context.memory_ref)
+    if context.memory_backend.is_segment:
+        instructions.get_static_field(value_layout_ref(context, "B"))
+        push_pointer()
+        push_length()
+        # Stack: byte array, 0, memory, layout, pointer, length
+        instructions.invoke_static(context.cf.constants.create_interface_method_ref(
+            SEGMENT_CLASS, "copy", f"(Ljava/lang/Object;IL{SEGMENT_CLASS};Ljava/lang/foreign/ValueLayout;JI)V"))
+    else:
+        push_pointer()
+        instructions.convert_long_to_integer()
+        push_length()
+        # Stack: byte array, 0, memory, pointer (as int), length
+        instructions.array_copy()
+
+
+def push_memory_buffer(context: GenerateContext, instructions: Instructions, push_pointer: Callable[[], Instructions],
+                       push_length: Callable[[], Instructions]):
+    """
+    Pushes a `ByteBuffer` over the memory, the callbacks push the pointer and the length (as longs). The segment
+    backends give a direct buffer that the channels read and write without an intermediate copy.
+    """
+    instructions.get_static_field(context.memory_ref)
+    push_pointer()
+    if context.memory_backend.is_segment:
+        push_length()
+        instructions.invoke_interface(segment_method_ref(context, "asSlice", f"(JJ)L{SEGMENT_CLASS};"))
+        instructions.invoke_interface(segment_method_ref(context, "asByteBuffer", "()Ljava/nio/ByteBuffer;"))
+    else:
+        instructions.convert_long_to_integer()
+        push_length()
+        instructions.convert_long_to_integer()
+        instructions.invoke_static(context.cf.constants.create_method_ref("java/nio/ByteBuffer", "wrap",
+                                                                          "([BII)Ljava/nio/ByteBuffer;"))
+
+
+def put_strings_method_instructions(context: GenerateContext) -> Instructions:
+    # Lays out the strings in a single reservation of the memory: a null-terminated table of pointers followed by the
+    # null-terminated strings. Returns the pointer to the table.
+    # Variables:
+    # 0: string array
+    # 1: encoded strings
+    # 2: size of the table and the strings
+    # 3: counter
+    # 4: pointer to the table (long)
+    # 6: pointer to the next string (long)
+    encoded = 1
+    size = 2
+    counter = 3
+    table = 4
+    pointer = 6
+
+    instructions = (
         Instructions(context)
         .load_reference(0)
-        .invoke_virtual(context.cf.constants.create_method_ref(
-            "java/lang/String",
-            "getBytes",
-            "()[B"
-        ))
-        .duplicate_top_of_stack()
         .array_length()
         .duplicate_top_of_stack()
-        .invoke_static(context.extend_mem_method)
-        .convert_long_to_integer()
-        .duplicate_behind_top_2_of_stack()
-        .swap()
+        # Stack: string count, string count
+        .new_reference_array(context.cf.constants.create_class("[B"))
+        .store_reference(encoded)
+        # Stack: string count
+        .push_integer(1)
+        .add_integer()
+        .push_integer(LONG_SIZE)
+        .multiply_integer()
+        .store_integer(size)
+        # Stack: (empty)
         .push_integer(0)
+        .store_integer(counter)
+
+        .label("size_loop")
+        .load_integer(counter)
+        .load_reference(0)
+        .array_length()
+        .branch_if_integer_greater_or_equal("size_loop_exit")
+        .load_reference(encoded)
+        .load_integer(counter)
+        .load_reference(0)
+        .load_integer(counter)
+        .load_array_reference()
+        .string_get_bytes()
+        # Stack: encoded strings, counter, string (as byte array)
         .duplicate_behind_top_2_of_stack()
-        .pop()
-        .get_static_field(context.memory_ref)
-        .duplicate_behind_top_2_of_stack()
-        .pop()
-        .array_copy()
+        .store_array_reference()
+        # Stack: string (as byte array)
+        .array_length()
+        .push_integer(1)
+        .add_integer()
+        .load_integer(size)
+        .add_integer()
+        .store_integer(size)
+        .increment_integer(counter)
+        .branch("size_loop")
+        .label("size_loop_exit")
+
+        # The reserved memory is zeroed, so the null terminators and the null pointer are already in place
+        .load_integer(size)
+        .invoke_static(context.extend_mem_method)
+        .duplicate_long()
+        .store_long(table)
+        # Stack: table
+        .load_reference(0)
+        .array_length()
+        .push_integer(1)
+        .add_integer()
+        .push_integer(LONG_SIZE)
+        .multiply_integer()
+        .convert_integer_to_long()
+        .add_long()
+        .store_long(pointer)
+        # Stack: (empty)
+        .push_integer(0)
+        .store_integer(counter)
+
+        .label("copy_loop")
+        .load_integer(counter)
+        .load_reference(0)
+        .array_length()
+        .branch_if_integer_greater_or_equal("copy_loop_exit")
+    )
+
+    def push_encoded() -> Instructions:
+        return instructions.load_reference(encoded).load_integer(counter).load_array_reference()
+
+    copy_to_memory(context, instructions, push_encoded, lambda: instructions.load_long(pointer),
+                   lambda: push_encoded().array_length())
+
+    return (
+        instructions
+        # Stack: (empty)
+        .load_long(pointer)
+        .load_long(table)
+        .load_integer(counter)
+        .push_integer(LONG_SIZE)
+        .multiply_integer()
         .convert_integer_to_long()
+        .add_long()
+        # Stack: pointer, table + counter * 8
+        .invoke_static(context.store_64_method)
+        .load_reference(encoded)
+        .load_integer(counter)
+        .load_array_reference()
+        .array_length()
+        .push_integer(1)
+        .add_integer()
+        .convert_integer_to_long()
+        .load_long(pointer)
+        .add_long()
+        .store_long(pointer)
+        .increment_integer(counter)
+        .branch("copy_loop")
+        .label("copy_loop_exit")
+
+        .load_long(table)
         .return_long()
     )
 
@@ -185,6 +426,16 @@ def print_memory(context: GenerateContext, instructions: MutableSequence):
 
 
 def cstring_to_string_method_instructions(context: GenerateContext) -> Instructions:
+    if context.memory_backend.is_segment:
+        # Reads the null-terminated UTF-8 string
+        return (
+            Instructions(context)
+            .get_static_field(context.memory_ref)
+            .load_long(0)
+            .invoke_interface(segment_method_ref(context, "getString", "(J)Ljava/lang/String;"))
+            .return_reference()
+        )
+
     return (
         Instructions(context)
         .load_long(0)
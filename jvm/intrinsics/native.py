@@ -0,0 +1,119 @@
+"""
+Calls into the C library through the Foreign Function & Memory API (Java 22+).
+
+The restricted methods of the API print a warning unless the JVM runs with `--enable-native-access=ALL-UNNAMED`.
+"""
+from typing import Optional
+
+from jawa.constants import FieldReference, InterfaceMethodRef
+
+from jvm.context import GenerateContext
+from jvm.instructions import Instructions
+
+NATIVE_ACCESS_OPTION = "--enable-native-access=ALL-UNNAMED"
+
+SEGMENT_CLASS = "java/lang/foreign/MemorySegment"
+LAYOUT_CLASS = "java/lang/foreign/ValueLayout"
+OPTION_CLASS = "java/lang/foreign/Linker$Option"
+# Field descriptor type -> (constant of `ValueLayout`, class of the constant)
+LAYOUTS = {
+    "J": ("JAVA_LONG", "java/lang/foreign/ValueLayout$OfLong"),
+    "I": ("JAVA_INT", "java/lang/foreign/ValueLayout$OfInt"),
+    "S": ("JAVA_SHORT", "java/lang/foreign/ValueLayout$OfShort"),
+    "B": ("JAVA_BYTE", "java/lang/foreign/ValueLayout$OfByte"),
+}
+
+
+def segment_method_ref(context: GenerateContext, name: str, descriptor: str) -> InterfaceMethodRef:
+    return context.cf.constants.create_interface_method_ref(SEGMENT_CLASS, name, descriptor)
+
+
+def value_layout_ref(context: GenerateContext, type_: str, unaligned: bool = False) -> FieldReference:
+    """
+    Native order layout of the given type (J, I, S or B).
+    """
+    name, class_name = LAYOUTS[type_]
+    if unaligned and type_ != "B":
+        name += "_UNALIGNED"
+    return context.cf.constants.create_field_ref(LAYOUT_CLASS, name, f"L{class_name};")
+
+
+def downcall_handle(context: GenerateContext, instructions: Instructions, name: str, descriptor: str,
+                    first_variadic_arg: Optional[int] = None, capture_errno: bool = False):
+    """
+    Pushes a method handle of the C function `name`, invoked with `invokeExact` and the given descriptor whose types
+    are J (long, pointer or size) and I (int).
+    The parameters from `first_variadic_arg` on are the variadic ones. If `capture_errno` is set, the handle takes a
+    leading segment of `Linker.Option.captureStateLayout()` that receives the `errno` of the call.
+    """
+    parameters, result = descriptor[1:].split(")")
+
+    def linker_method(method: str, method_descriptor: str) -> InterfaceMethodRef:
+        return context.cf.constants.create_interface_method_ref("java/lang/foreign/Linker", method, method_descriptor)
+
+    def option_method(method: str, parameters_descriptor: str) -> InterfaceMethodRef:
+        return context.cf.constants.create_interface_method_ref(OPTION_CLASS, method,
+                                                                f"{parameters_descriptor}L{OPTION_CLASS};")
+
+    layout_class = context.cf.constants.create_class("java/lang/foreign/MemoryLayout")
+
+    (
+        instructions
+        .invoke_static(linker_method("nativeLinker", "()Ljava/lang/foreign/Linker;"))
+        .duplicate_top_of_stack()
+        .invoke_interface(linker_method("defaultLookup", "()Ljava/lang/foreign/SymbolLookup;"))
+        .push_constant(context.cf.constants.create_string(name))
+        .invoke_interface(context.cf.constants.create_interface_method_ref(
+            "java/lang/foreign/SymbolLookup", "find", "(Ljava/lang/String;)Ljava/util/Optional;"))
+        .invoke_virtual(context.cf.constants.create_method_ref("java/util/Optional", "orElseThrow",
+                                                               "()Ljava/lang/Object;"))
+        .check_cast(context.cf.constants.create_class(SEGMENT_CLASS))
+        # Stack: linker, address of the function
+        .get_static_field(value_layout_ref(context, result))
+        .push_integer(len(parameters))
+        .new_reference_array(layout_class)
+    )
+    for i, parameter in enumerate(parameters):
+        (
+            instructions
+            .duplicate_top_of_stack()
+            .push_integer(i)
+            .get_static_field(value_layout_ref(context, parameter))
+            .store_array_reference()
+        )
+    (
+        instructions
+        # Stack: linker, address of the function, result layout, parameter layouts
+        .invoke_static(context.cf.constants.create_interface_method_ref(
+            "java/lang/foreign/FunctionDescriptor", "of",
+            "(Ljava/lang/foreign/MemoryLayout;[Ljava/lang/foreign/MemoryLayout;)"
+            "Ljava/lang/foreign/FunctionDescriptor;"))
+    )
+    options = []
+    if first_variadic_arg is not None:
+        options.append(lambda: (instructions
+                                .push_integer(first_variadic_arg)
+                                .invoke_static(option_method("firstVariadicArg", "(I)"))))
+    if capture_errno:
+        options.append(lambda: (instructions
+                                .push_integer(1)
+                                .new_reference_array(context.cf.constants.create_class("java/lang/String"))
+                                .duplicate_top_of_stack()
+                                .push_integer(0)
+                                .push_constant(context.cf.constants.create_string("errno"))
+                                .store_array_reference()
+                                .invoke_static(option_method("captureCallState", "([Ljava/lang/String;)"))))
+    instructions.push_integer(len(options))
+    instructions.new_reference_array(context.cf.constants.create_class(OPTION_CLASS))
+    for i, push_option in enumerate(options):
+        instructions.duplicate_top_of_stack()
+        instructions.push_integer(i)
+        push_option()
+        instructions.store_array_reference()
+    (
+        instructions
+        .invoke_interface(linker_method(
+            "downcallHandle", f"(L{SEGMENT_CLASS};Ljava/lang/foreign/FunctionDescriptor;"
+                              f"[L{OPTION_CLASS};)Ljava/lang/invoke/MethodHandle;"))
+        # Stack: method handle
+    )
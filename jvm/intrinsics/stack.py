@@ -1,6 +1,6 @@
 import inspect
 from collections import deque
-from typing import Deque, Dict, Callable, Union, TypeAlias, Tuple, Optional, Set
+from typing import Deque, Dict, Callable, Union, Tuple, Optional, Set, Iterable
 
 from jawa.constants import FieldReference, InvokeDynamic, InterfaceMethodRef, MethodReference, Constant, Integer, Float, \
     String, ConstantClass, MethodHandle, MethodType, Number, Long, Double
@@ -8,7 +8,28 @@ from jawa.constants import FieldReference, InvokeDynamic, InterfaceMethodRef, Me
 from jvm.intrinsics import Operand, INTEGER_TYPES, get_field_type, get_method_input_types, \
     get_method_return_type, Instruction, OperandType
 
-OperandStack: TypeAlias = Deque[OperandType]
+
+class OperandStack(deque):
+    """
+    Deque of operand types that keeps track of the total size of its operands (in stack slots).
+    """
+    size: int
+
+    def __init__(self, iterable: Iterable[OperandType] = ()):
+        super().__init__(iterable)
+        self.size = sum(operand.size for operand in self)
+
+    def append(self, operand: OperandType) -> None:
+        super().append(operand)
+        self.size += operand.size
+
+    def pop(self) -> OperandType:
+        operand = super().pop()
+        self.size -= operand.size
+        return operand
+
+    def copy(self) -> 'OperandStack':
+        return OperandStack(self)
 
 
 # <editor-fold desc="Stack operations">
@@ -367,13 +388,15 @@ def invoke_static(stack: OperandStack, operands: Tuple[Operand]) -> None:
     if len(operands) < 1:
         raise Exception(f"invoke_static expected at least 1 operand, got {len(operands)}")
     invocation = operands[0]
-    if not isinstance(invocation, (MethodReference, InvokeDynamic)):
+    # Static methods of interfaces are referenced by an `InterfaceMethodRef`
+    if not isinstance(invocation, (MethodReference, InterfaceMethodRef, InvokeDynamic)):
         raise Exception(f"invoke_static expected operand to be a static method reference, got {invocation}")
     input_types = get_method_input_types(invocation)
     return_type = get_method_return_type(invocation)[0]
 
     for input_type in reversed(input_types):
-        if stack[-1] != input_type:
+        # Booleans, bytes, shorts and chars are passed as ints
+        if stack[-1] != input_type and (stack[-1] not in INTEGER_TYPES or input_type not in INTEGER_TYPES):
             raise Exception(f"invoke_static expected operand to be {input_type}, got {stack[-1]}")
         else:
             stack.pop()
@@ -395,7 +418,8 @@ def invoke_instance(stack: OperandStack, operands: Tuple[Operand]) -> None:
         raise Exception(f"invoke_instance expected at least {len(input_types) + 1} operands on stack, got {len(stack)}")
 
     for input_type in reversed(input_types):
-        if stack[-1] != input_type:
+        # Booleans, bytes, shorts and chars are passed as ints
+        if stack[-1] != input_type and (stack[-1] not in INTEGER_TYPES or input_type not in INTEGER_TYPES):
             raise Exception(f"invoke_instance expected operand to be {input_type}, got {stack[-1]}")
         else:
             stack.pop()
@@ -720,6 +744,20 @@ INSTRUCTION_TO_STACK_MODIFICATION: Dict[
     "wide": no_stack_modification,
 }
 
+
+def _takes_operands(stack_modification: Callable) -> bool:
+    arg_count = len(inspect.getfullargspec(stack_modification).args)
+    if arg_count not in (1, 2):
+        raise Exception("Unsupported stack modification")
+    return arg_count == 2
+
+
+# Whether the stack modification of an instruction takes the instruction's operands, resolved once at import time
+STACK_MODIFICATION_TAKES_OPERANDS: Dict[str, bool] = {
+    instruction: _takes_operands(stack_modification)
+    for instruction, stack_modification in INSTRUCTION_TO_STACK_MODIFICATION.items()
+}
+
 INSTRUCTION_TO_LOCAL_COUNT: Dict[str, Optional[int]] = {
     "aload": None,
     "astore": None,
@@ -803,13 +841,17 @@ class Stack(object):
     _local_count: int
     _branch_depth: int
 
-    def __init__(self):
-        self._stack = deque()
+    def __init__(self, operands: Iterable[OperandType] = ()):
+        self._stack = OperandStack(operands)
         self._saved_stacks = deque()
-        self._max_stack_size = 0
+        self._max_stack_size = self._stack.size
         self._local_count = 0
         self._branch_depth = 0
 
+    @property
+    def operands(self) -> Tuple[OperandType, ...]:
+        return tuple(self._stack)
+
     @property
     def max_stack_size(self) -> int:
         return self._max_stack_size
@@ -821,18 +863,15 @@ class Stack(object):
     def update_stack(self, instruction: Instruction, *operands: Operand):
         if instruction in INSTRUCTION_TO_STACK_MODIFICATION:
             stack_modification = INSTRUCTION_TO_STACK_MODIFICATION[instruction]
-            arg_spec = inspect.getfullargspec(stack_modification)
 
-            if len(arg_spec.args) == 1:
-                stack_modification(self._stack)
-            elif len(arg_spec.args) == 2:
+            if STACK_MODIFICATION_TAKES_OPERANDS[instruction]:
                 stack_modification(self._stack, operands)
             else:
-                raise Exception("Unsupported stack modification")
+                stack_modification(self._stack)
 
             # Update max stack size
-            self._max_stack_size = max(self._max_stack_size,
-                                       sum(map(lambda op: op.size, self._stack)))
+            if self._stack.size > self._max_stack_size:
+                self._max_stack_size = self._stack.size
         else:
             raise NotImplementedError(f"No stack modification for instruction {instruction}!")
 
@@ -849,9 +888,12 @@ class Stack(object):
                     self._local_count = max(self._local_count, operands[0] + 1)
 
         if instruction in BRANCHES:
-            if instruction in ("lookupswitch", "tablewitch"):
+            if instruction == "lookupswitch" and operands:
                 for _ in range(len(operands[0])):
                     self._saved_stacks.append(self._stack.copy())
+            elif instruction == "tableswitch" and operands:
+                for _ in range(len(operands) - 3):
+                    self._saved_stacks.append(self._stack.copy())
             self._saved_stacks.append(self._stack.copy())
 
     def restore_stack(self):
@@ -1,5 +1,8 @@
-from jvm.context import GenerateContext
+from jawa.constants import FieldReference
+
+from jvm.context import GenerateContext, MemoryBackend
 from jvm.instructions import Instructions
+from jvm.intrinsics.native import segment_method_ref, LAYOUTS
 
 
 def store_64_method_instructions(context: GenerateContext) -> Instructions:
@@ -41,7 +44,60 @@ def store_64_method_instructions(context: GenerateContext) -> Instructions:
     )
 
 
+def store_view_method_instructions(context: GenerateContext, view_ref: FieldReference, type_: str) -> Instructions:
+    # Stores the value as a little-endian value of the given type (J, I or S) through a `VarHandle` view of the memory
+    instructions = (
+        Instructions(context)
+        .get_static_field(view_ref)
+        # Stack: view
+        .get_static_field(context.memory_ref)
+        # Stack: view, memory
+        .load_long(2)
+        .convert_long_to_integer()
+        # Stack: view, memory, index (as int)
+        .load_long(0)
+        # Stack: view, memory, index, value (as long)
+    )
+    if type_ != "J":
+        instructions.convert_long_to_integer()
+    if type_ == "S":
+        instructions.convert_integer_to_short()
+    return (
+        instructions
+        .invoke_virtual(context.cf.constants.create_method_ref("java/lang/invoke/VarHandle", "set", f"([BI{type_})V"))
+        .return_void()
+    )
+
+
+def store_segment_method_instructions(context: GenerateContext, layout_ref: FieldReference, type_: str) \
+        -> Instructions:
+    # Stores the value as a value of the given type (J, I, S or B) with the byte order of the layout in the memory
+    # segment
+    instructions = (
+        Instructions(context)
+        .get_static_field(context.memory_ref)
+        .get_static_field(layout_ref)
+        .load_long(2)
+        .load_long(0)
+        # Stack: memory, layout, address, value (as long)
+    )
+    if type_ != "J":
+        instructions.convert_long_to_integer()
+    if type_ == "S":
+        instructions.convert_integer_to_short()
+    elif type_ == "B":
+        instructions.convert_integer_to_byte()
+    return (
+        instructions
+        .invoke_interface(segment_method_ref(context, "set", f"(L{LAYOUTS[type_][1]};J{type_})V"))
+        .return_void()
+    )
+
+
 def store_32(context: GenerateContext, instructions: Instructions):
+    if context.memory_backend != MemoryBackend.BYTES:
+        instructions.invoke_static(context.store_32_method)
+        return
     # Stack: int (as long), index (as long)
     instructions.convert_long_to_integer()
     # Stack: int (as long), index (as int)
@@ -66,6 +122,9 @@ def store_32(context: GenerateContext, instructions: Instructions):
 
 
 def store_16(context: GenerateContext, instructions: Instructions):
+    if context.memory_backend != MemoryBackend.BYTES:
+        instructions.invoke_static(context.store_16_method)
+        return
     # Stack: short (as long), index (as long)
     instructions.convert_long_to_integer()
     # Stack: short (as long), index (as int)
@@ -82,6 +141,9 @@ def store_16(context: GenerateContext, instructions: Instructions):
 
 
 def store_8(context: GenerateContext, instructions: Instructions):
+    if context.memory_backend.is_segment:
+        instructions.invoke_static(context.store_8_method)
+        return
     # Stack: byte (as long), index (as long)
     instructions.convert_long_to_integer()
     # Stack: byte (as int), index
@@ -0,0 +1,260 @@
+from dataclasses import dataclass
+from typing import Optional, Dict, List, Tuple, Iterable
+
+from jawa.assemble import Label
+from jawa.constants import MethodReference
+
+from jvm.branches import instruction_size
+from jvm.context import GenerateContext
+from jvm.intrinsics import InstructionsType
+from porth.porth import OpType, OpAddr, Intrinsic, Op, Proc
+
+# HotSpot does not JIT-compile methods with more bytes of bytecode (-XX:HugeMethodLimit)
+HUGE_METHOD_LIMIT = 8000
+# Maximum size of the ops of a region, leaves room for loading the parameters and returning the outputs
+OUTLINE_LIMIT = 6000
+# Smaller regions are not worth the call
+MIN_REGION_SIZE = 32
+# Maximum number of parameter slots of a static method
+MAX_PARAMETER_SLOTS = 255
+
+# Number of operands popped and pushed
+INTRINSIC_STACK_EFFECTS: Dict[Intrinsic, Tuple[int, int]] = {
+    Intrinsic.PLUS: (2, 1),
+    Intrinsic.MINUS: (2, 1),
+    Intrinsic.MUL: (2, 1),
+    Intrinsic.DIVMOD: (2, 2),
+    Intrinsic.MAX: (2, 1),
+    Intrinsic.EQ: (2, 1),
+    Intrinsic.GT: (2, 1),
+    Intrinsic.LT: (2, 1),
+    Intrinsic.GE: (2, 1),
+    Intrinsic.LE: (2, 1),
+    Intrinsic.NE: (2, 1),
+    Intrinsic.SHR: (2, 1),
+    Intrinsic.SHL: (2, 1),
+    Intrinsic.OR: (2, 1),
+    Intrinsic.AND: (2, 1),
+    Intrinsic.NOT: (1, 1),
+    Intrinsic.PRINT: (1, 0),
+    Intrinsic.DUP: (1, 2),
+    Intrinsic.SWAP: (2, 2),
+    Intrinsic.DROP: (1, 0),
+    Intrinsic.OVER: (2, 3),
+    Intrinsic.ROT: (3, 3),
+    Intrinsic.LOAD8: (1, 1),
+    Intrinsic.STORE8: (2, 0),
+    Intrinsic.LOAD16: (1, 1),
+    Intrinsic.STORE16: (2, 0),
+    Intrinsic.LOAD32: (1, 1),
+    Intrinsic.STORE32: (2, 0),
+    Intrinsic.LOAD64: (1, 1),
+    Intrinsic.STORE64: (2, 0),
+    Intrinsic.CAST_PTR: (1, 1),
+    Intrinsic.CAST_INT: (1, 1),
+    Intrinsic.CAST_BOOL: (1, 1),
+    Intrinsic.ARGC: (0, 1),
+    Intrinsic.ARGV: (0, 1),
+    Intrinsic.ENVP: (0, 1),
+    Intrinsic.SYSCALL0: (1, 1),
+    Intrinsic.SYSCALL1: (2, 1),
+    Intrinsic.SYSCALL2: (3, 1),
+    Intrinsic.SYSCALL3: (4, 1),
+    Intrinsic.SYSCALL4: (5, 1),
+    Intrinsic.SYSCALL5: (6, 1),
+    Intrinsic.SYSCALL6: (7, 1),
+    Intrinsic.STOP: (0, 0),
+}
+
+
+@dataclass
+class Region:
+    """
+    Ops [start, end) that are generated into a separate method.
+    The method takes the top `inputs` operands of the stack as parameters and returns `outputs` operands.
+    """
+    start: OpAddr
+    end: OpAddr
+    inputs: int
+    outputs: int
+    size: int
+    method_ref: Optional[MethodReference] = None
+
+
+def op_stack_effect(context: GenerateContext, procedure: Optional[Proc], op: Op) -> Tuple[int, int]:
+    if op.typ in (OpType.PUSH_INT, OpType.PUSH_PTR, OpType.PUSH_BOOL, OpType.PUSH_CSTR, OpType.PUSH_GLOBAL_MEM,
+                  OpType.PUSH_LOCAL_MEM):
+        return 0, 1
+    elif op.typ == OpType.PUSH_STR:
+        return 0, 2
+    elif op.typ in (OpType.IF, OpType.IFSTAR, OpType.DO):
+        return 1, 0
+    elif op.typ == OpType.PREP_PROC:
+        return 0, len(procedure.contract.ins) if procedure else 0
+    elif op.typ == OpType.CALL:
+        contract = context.procedures[op.token.value].contract
+        return len(contract.ins), len(contract.outs)
+    elif op.typ == OpType.INTRINSIC:
+        return INTRINSIC_STACK_EFFECTS[op.operand]
+    return 0, 0
+
+
+def scan_stack_depths(context: GenerateContext, procedure: Optional[Proc], ops: List[Op], first_ip: OpAddr,
+                      end: OpAddr) -> Dict[OpAddr, int]:
+    """
+    Depth of the operand stack before every op, relative to the start of the method.
+    Procedures inside the ops are skipped.
+    """
+    depths: Dict[OpAddr, int] = {}
+    # Depths at the targets of forward jumps
+    targets: Dict[OpAddr, int] = {}
+    depth: Optional[int] = 0
+    ip = first_ip
+    while ip < end:
+        op = ops[ip - first_ip]
+        if depth is None:
+            # Only reachable by a jump
+            depth = targets[ip]
+        depths[ip] = depth
+
+        if op.typ == OpType.SKIP_PROC:
+            ip = op.operand
+            continue
+
+        pops, pushes = op_stack_effect(context, procedure, op)
+        depth += pushes - pops
+        if op.typ in (OpType.IF, OpType.IFSTAR, OpType.DO):
+            targets[op.operand] = depth
+        elif op.typ == OpType.ELSE:
+            targets[op.operand] = depth
+            depth = None
+        elif op.typ == OpType.END and op.operand != ip + 1:
+            # End of a while loop
+            depth = None
+        ip += 1
+
+    depths[end] = depth if depth is not None else targets[end]
+    return depths
+
+
+def measure_ops(instructions: Iterable[InstructionsType]) -> Dict[OpAddr, int]:
+    """
+    Size in bytes of the code generated for every op, delimited by the `addr_<ip>` labels.
+    """
+    sizes: Dict[OpAddr, int] = {}
+    ip: Optional[OpAddr] = None
+    for instruction in instructions:
+        if isinstance(instruction, Label):
+            if instruction.name.startswith("addr_"):
+                ip = int(instruction.name[len("addr_"):])
+                sizes.setdefault(ip, 0)
+        elif ip is not None:
+            sizes[ip] += instruction_size(instruction)
+    return sizes
+
+
+def scan_items(ops: List[Op], first_ip: OpAddr, start: OpAddr, end: OpAddr) -> List[Tuple[OpAddr, OpAddr]]:
+    """
+    Splits the ops into single ops, blocks and procedures. No jump leaves an item except to its end.
+    """
+    items = []
+    ip = start
+    while ip < end:
+        op = ops[ip - first_ip]
+        if op.typ == OpType.SKIP_PROC:
+            item_end = op.operand
+        elif op.typ in (OpType.IF, OpType.WHILE):
+            item_end = block_controls(ops, first_ip, ip)[-1] + 1
+        else:
+            item_end = ip + 1
+        items.append((ip, item_end))
+        ip = item_end
+    return items
+
+
+def block_controls(ops: List[Op], first_ip: OpAddr, start: OpAddr) -> List[OpAddr]:
+    # Addresses of the IF or WHILE starting the block and of its ELSE, IF*, DO and END
+    controls = []
+    level = 0
+    ip = start
+    while True:
+        op = ops[ip - first_ip]
+        if op.typ in (OpType.IF, OpType.WHILE):
+            level += 1
+        if level == 1 and op.typ in (OpType.IF, OpType.WHILE, OpType.IFSTAR, OpType.ELSE, OpType.DO, OpType.END):
+            controls.append(ip)
+        if op.typ == OpType.END:
+            level -= 1
+            if level == 0:
+                return controls
+        ip += 1
+
+
+def plan_regions(context: GenerateContext, procedure: Optional[Proc], ops: List[Op], first_ip: OpAddr,
+                 start: OpAddr, end: OpAddr, sizes: Dict[OpAddr, int]) -> List[Region]:
+    """
+    Chooses regions of the ops [start, end) to outline until the rest of the method is below `OUTLINE_LIMIT`.
+    Blocks are outlined as a whole if they are small enough, otherwise their branches and loop bodies are split.
+    """
+    depths = scan_stack_depths(context, procedure, ops, first_ip, end)
+    candidates: List[Region] = []
+    _plan_level(context, procedure, ops, first_ip, start, end, sizes, depths, candidates)
+
+    method_size = sum(sizes.values())
+    regions = []
+    # Outline the largest regions first to keep the number of calls low
+    for region in sorted(candidates, key=lambda r: r.size, reverse=True):
+        if method_size <= OUTLINE_LIMIT:
+            break
+        regions.append(region)
+        method_size -= region.size
+    return sorted(regions, key=lambda r: r.start)
+
+
+def _plan_level(context: GenerateContext, procedure: Optional[Proc], ops: List[Op], first_ip: OpAddr,
+                start: OpAddr, end: OpAddr, sizes: Dict[OpAddr, int], depths: Dict[OpAddr, int],
+                candidates: List[Region]):
+    chunk: List[Tuple[OpAddr, OpAddr]] = []
+    chunk_size = 0
+
+    def flush():
+        nonlocal chunk, chunk_size
+        if chunk and chunk_size >= MIN_REGION_SIZE:
+            region = _make_region(context, procedure, ops, first_ip, chunk[0][0], chunk[-1][1], chunk_size, depths)
+            if region:
+                candidates.append(region)
+        chunk = []
+        chunk_size = 0
+
+    for item_start, item_end in scan_items(ops, first_ip, start, end):
+        size = sum(sizes.get(ip, 0) for ip in range(item_start, item_end))
+        if size > OUTLINE_LIMIT:
+            flush()
+            if ops[item_start - first_ip].typ in (OpType.IF, OpType.WHILE):
+                controls = block_controls(ops, first_ip, item_start)
+                for segment_start, segment_end in zip(controls, controls[1:]):
+                    _plan_level(context, procedure, ops, first_ip, segment_start + 1, segment_end, sizes, depths,
+                                candidates)
+            continue
+
+        if chunk_size + size > OUTLINE_LIMIT:
+            flush()
+        chunk.append((item_start, item_end))
+        chunk_size += size
+    flush()
+
+
+def _make_region(context: GenerateContext, procedure: Optional[Proc], ops: List[Op], first_ip: OpAddr,
+                 start: OpAddr, end: OpAddr, size: int, depths: Dict[OpAddr, int]) -> Optional[Region]:
+    # Lowest depth of the stack inside the region, the operands below are not touched
+    low = depths[end]
+    for ip in range(start, end):
+        if ip in depths:
+            low = min(low, depths[ip] - op_stack_effect(context, procedure, ops[ip - first_ip])[0])
+
+    inputs = depths[start] - low
+    # The local memory pointer is passed as a long
+    local_memory = procedure is not None and procedure.local_memory_capacity != 0
+    if (inputs + local_memory) * 2 > MAX_PARAMETER_SLOTS:
+        return None
+    return Region(start, end, inputs, depths[end] - low, size)
@@ -0,0 +1,239 @@
+from collections import Counter
+from typing import NamedTuple, Tuple, FrozenSet, Callable, Optional, List, Iterable, Set
+
+from jawa.assemble import Label
+from jawa.constants import Integer, ConstantPool
+
+from jvm.intrinsics import OperandType, InstructionsType
+from jvm.intrinsics.stack import Stack
+
+Rewrite = Callable[[ConstantPool, List[tuple]], Optional[List[InstructionsType]]]
+
+
+class PeepholeRule(NamedTuple):
+    name: str
+    # Accepted opcodes for every instruction of the window
+    pattern: Tuple[FrozenSet[str], ...]
+    # Operand stack consumed by the window, used to verify the rewrite with the stack model
+    inputs: Tuple[OperandType, ...]
+    # Returns the replacement of the matched window or None if the window does not match after all
+    rewrite: Rewrite
+
+
+def _opcodes(opcodes: str) -> FrozenSet[str]:
+    return frozenset(opcodes.split())
+
+
+INTEGER_CONSTANTS = _opcodes("iconst_m1 iconst_0 iconst_1 iconst_2 iconst_3 iconst_4 iconst_5 bipush sipush ldc ldc_w")
+PUSH_ONE = INTEGER_CONSTANTS | _opcodes("aconst_null fconst_0 fconst_1 fconst_2 iload aload fload")
+PUSH_TWO = _opcodes("lconst_0 lconst_1 dconst_0 dconst_1 ldc2_w lload dload")
+ZERO_BRANCHES = _opcodes("ifeq ifne iflt ifge ifgt ifle")
+
+
+def _integer_value(instruction: tuple) -> Optional[int]:
+    opcode = instruction[0]
+    if opcode.startswith("iconst_"):
+        return -1 if opcode == "iconst_m1" else int(opcode[len("iconst_"):])
+    elif opcode in ("bipush", "sipush"):
+        return instruction[1]
+    elif opcode in ("ldc", "ldc_w") and isinstance(instruction[1], Integer):
+        return instruction[1].value
+    return None
+
+
+def _push_integer(constants: ConstantPool, integer: int) -> InstructionsType:
+    # Same encoding as `Instructions.push_integer`
+    if integer == -1:
+        return "iconst_m1",
+    elif 0 <= integer <= 5:
+        return f"iconst_{integer}",
+    elif -128 <= integer <= 127:
+        return "bipush", integer
+    elif -32768 <= integer <= 32767:
+        return "sipush", integer
+    constant = constants.create_integer(integer)
+    return ("ldc" if constant.index <= 255 else "ldc_w"), constant
+
+
+# <editor-fold desc="Rewrites" defaultstate="collapsed">
+# noinspection PyUnusedLocal
+def _remove(constants: ConstantPool, window: List[tuple]) -> Optional[List[InstructionsType]]:
+    return []
+
+
+# noinspection PyUnusedLocal
+def _keep_last(constants: ConstantPool, window: List[tuple]) -> Optional[List[InstructionsType]]:
+    return [window[-1]]
+
+
+# noinspection PyUnusedLocal
+def _pop_input(constants: ConstantPool, window: List[tuple]) -> Optional[List[InstructionsType]]:
+    # Drop the input of the conversion instead of its result
+    return [("pop2",) if window[0][0] == "l2i" else ("pop",)]
+
+
+def _remove_pushed_integer(constants: ConstantPool, window: List[tuple]) -> Optional[List[InstructionsType]]:
+    if window[0][0] in ("ldc", "ldc_w") and _integer_value(window[0]) is None:
+        # Only integer constants are certain to be of size one
+        return None
+    return []
+
+
+def _fold_integer_addition(constants: ConstantPool, window: List[tuple]) -> Optional[List[InstructionsType]]:
+    left, right = _integer_value(window[0]), _integer_value(window[1])
+    if left is None or right is None:
+        return None
+    # Wrap around like `iadd`
+    return [_push_integer(constants, (left + right + 2 ** 31) % 2 ** 32 - 2 ** 31)]
+
+
+# noinspection PyUnusedLocal
+def _integer_to_long_constant(constants: ConstantPool, window: List[tuple]) -> Optional[List[InstructionsType]]:
+    value = _integer_value(window[0])
+    if value not in (0, 1):
+        return None
+    return [(f"lconst_{value}",)]
+
+
+# noinspection PyUnusedLocal
+def _identity_long_operation(constants: ConstantPool, window: List[tuple]) -> Optional[List[InstructionsType]]:
+    if window[0][0] == "lconst_0" and window[1][0] in ("ladd", "lsub", "lor", "lxor"):
+        return []
+    if window[0][0] == "lconst_1" and window[1][0] in ("lmul", "ldiv"):
+        return []
+    return None
+
+
+# noinspection PyUnusedLocal
+def _compare_integer_with_zero(constants: ConstantPool, window: List[tuple]) -> Optional[List[InstructionsType]]:
+    # A sign extended integer has the same sign as the integer itself
+    return [window[-1]]
+
+
+# </editor-fold>
+
+RULES: Tuple[PeepholeRule, ...] = (
+    PeepholeRule("integer-to-long-to-integer", (_opcodes("i2l"), _opcodes("l2i")),
+                 (OperandType.Integer,), _remove),
+    PeepholeRule("swap-swap", (_opcodes("swap"), _opcodes("swap")),
+                 (OperandType.Integer, OperandType.Integer), _remove),
+    # SWAP of two longs is `dup2_x2 pop2`
+    PeepholeRule("swap-longs-swap-longs",
+                 (_opcodes("dup2_x2"), _opcodes("pop2"), _opcodes("dup2_x2"), _opcodes("pop2")),
+                 (OperandType.Long, OperandType.Long), _remove),
+    PeepholeRule("swap-longs-commutative", (_opcodes("dup2_x2"), _opcodes("pop2"), _opcodes("ladd lmul land lor lxor")),
+                 (OperandType.Long, OperandType.Long), _keep_last),
+    PeepholeRule("push-pop", (PUSH_ONE, _opcodes("pop")), (), _remove_pushed_integer),
+    PeepholeRule("push-long-pop", (PUSH_TWO, _opcodes("pop2")), (), _remove),
+    PeepholeRule("dup-pop", (_opcodes("dup"), _opcodes("pop")), (OperandType.Integer,), _remove),
+    PeepholeRule("dup-long-pop", (_opcodes("dup2"), _opcodes("pop2")), (OperandType.Long,), _remove),
+    PeepholeRule("convert-integer-pop", (_opcodes("i2l i2d"), _opcodes("pop2")), (OperandType.Integer,), _pop_input),
+    PeepholeRule("convert-long-pop", (_opcodes("l2i"), _opcodes("pop")), (OperandType.Long,), _pop_input),
+    PeepholeRule("fold-integer-addition", (INTEGER_CONSTANTS, INTEGER_CONSTANTS, _opcodes("iadd")), (),
+                 _fold_integer_addition),
+    PeepholeRule("integer-to-long-constant", (INTEGER_CONSTANTS, _opcodes("i2l")), (), _integer_to_long_constant),
+    PeepholeRule("identity-long-operation", (_opcodes("lconst_0 lconst_1"), _opcodes("ladd lsub lor lxor lmul ldiv")),
+                 (OperandType.Long,), _identity_long_operation),
+    PeepholeRule("compare-integer-with-zero", (_opcodes("i2l"), _opcodes("lconst_0"), _opcodes("lcmp"), ZERO_BRANCHES),
+                 (OperandType.Integer,), _compare_integer_with_zero),
+)
+
+MAX_WINDOW = max(len(rule.pattern) for rule in RULES)
+
+
+def verify_rewrite(rule: PeepholeRule, window: Iterable[InstructionsType], replacement: Iterable[InstructionsType]):
+    """
+    Checks with the stack model that the replacement leaves the same operands on the stack as the window
+    and does not need more stack space.
+    """
+    before = Stack(rule.inputs)
+    after = Stack(rule.inputs)
+    for stack, instructions in ((before, window), (after, replacement)):
+        for instruction in instructions:
+            if not isinstance(instruction, Label):
+                stack.update_stack(*instruction)
+    if before.operands != after.operands:
+        raise Exception(f"Peephole rule {rule.name} changes the stack from {before.operands} to {after.operands}")
+    if after.max_stack_size > before.max_stack_size:
+        raise Exception(f"Peephole rule {rule.name} increases the maximum stack size")
+
+
+def branch_targets(instructions: Iterable[InstructionsType]) -> Set[str]:
+    targets = set()
+    for instruction in instructions:
+        if isinstance(instruction, Label):
+            continue
+        for operand in instruction[1:]:
+            if isinstance(operand, Label):
+                targets.add(operand.name)
+            elif isinstance(operand, dict):
+                targets.update(label.name for label in operand.values())
+    return targets
+
+
+def optimize(constants: ConstantPool, instructions: Iterable[InstructionsType]) \
+        -> Tuple[List[InstructionsType], Counter]:
+    """
+    Rewrites short instruction sequences according to `RULES`.
+    A window never spans a label that is the target of a branch, other labels are ignored.
+    Returns the optimized instructions and the number of applications of every rule.
+    """
+    instructions = list(instructions)
+    targets = branch_targets(instructions)
+    hits = Counter()
+    optimized: List[InstructionsType] = []
+
+    for instruction in instructions:
+        if isinstance(instruction, Label) and instruction.name in targets:
+            # A jump to the next instruction
+            previous = _window(optimized, targets, 1)
+            if previous and optimized[previous[0]][0] == "goto" and optimized[previous[0]][1].name == instruction.name:
+                del optimized[previous[0]]
+                hits["goto-next"] += 1
+
+        optimized.append(instruction)
+
+        # Rewrites may enable further rewrites ending at the same instruction
+        while _rewrite(constants, optimized, targets, hits):
+            pass
+
+    return optimized, hits
+
+
+def _window(instructions: List[InstructionsType], targets: Set[str], size: int) -> List[int]:
+    # Indices of the last `size` instructions that are not separated by a branch target
+    indices = []
+    index = len(instructions) - 1
+    while index >= 0 and len(indices) < size:
+        instruction = instructions[index]
+        if isinstance(instruction, Label):
+            if instruction.name in targets:
+                break
+        else:
+            indices.append(index)
+        index -= 1
+    indices.reverse()
+    return indices
+
+
+def _rewrite(constants: ConstantPool, instructions: List[InstructionsType], targets: Set[str],
+             hits: Counter) -> bool:
+    indices = _window(instructions, targets, MAX_WINDOW)
+    for rule in RULES:
+        if len(rule.pattern) > len(indices):
+            continue
+        rule_indices = indices[-len(rule.pattern):]
+        window = [instructions[index] for index in rule_indices]
+        if not all(instruction[0] in opcodes for instruction, opcodes in zip(window, rule.pattern)):
+            continue
+        replacement = rule.rewrite(constants, window)
+        if replacement is None:
+            continue
+
+        verify_rewrite(rule, window, replacement)
+        for index in reversed(rule_indices):
+            del instructions[index]
+        instructions[rule_indices[0]:rule_indices[0]] = replacement
+        hits[rule.name] += 1
+        return True
+    return False
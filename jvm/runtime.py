@@ -0,0 +1,96 @@
+"""
+Runtime support class shared by the generated programs.
+
+The utility methods and the state they work on (the memory, the arguments, the streams...) only depend on the codegen
+options, so they are generated once into `PorthRuntime` and the programs call into it. A program is written either
+as a JAR that contains both classes, or as a class file with `PorthRuntime.class` next to it.
+"""
+import hashlib
+import json
+import zipfile
+from os import path
+from typing import Dict, NamedTuple, Tuple, Iterable, Callable
+
+from jvm.cache import compiler_version, write_atomic
+from jvm.context import GenerateContext
+
+RUNTIME_CLASS_NAME = "PorthRuntime"
+JAR_EXT = ".jar"
+# Fixed timestamp of the JAR entries, so that the same program always generates the same JAR
+JAR_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+class Runtime(NamedTuple):
+    class_file: bytes
+    # Attribute of `GenerateContext` -> ("field" or "method", name, descriptor) of the member of the runtime class
+    references: Dict[str, Tuple[str, str, str]]
+
+
+def link_runtime(context: GenerateContext, runtime: Runtime):
+    """
+    Points the field and method references of the context at the members of the runtime class, the references are
+    created when they are first used.
+    """
+    context.runtime_class_name = RUNTIME_CLASS_NAME
+    context.runtime_references = runtime.references
+
+
+def write_runtime(directory: str, runtime: Runtime):
+    # Programs compiled concurrently into the same directory share the runtime class
+    write_atomic(path.join(directory, RUNTIME_CLASS_NAME + ".class"), runtime.class_file)
+
+
+def write_program(class_file: bytes, out_file_path: str, runtime: Runtime):
+    class_name = path.splitext(path.basename(out_file_path))[0]
+    if out_file_path.endswith(JAR_EXT):
+        with zipfile.ZipFile(out_file_path, "w", zipfile.ZIP_DEFLATED) as jar:
+            for name, content in (("META-INF/MANIFEST.MF", f"Manifest-Version: 1.0\nMain-Class: {class_name}\n\n"),
+                                  (class_name + ".class", class_file),
+                                  (RUNTIME_CLASS_NAME + ".class", runtime.class_file)):
+                jar.writestr(zipfile.ZipInfo(name, JAR_DATE_TIME), content, zipfile.ZIP_DEFLATED)
+    else:
+        with open(out_file_path, "wb") as f:
+            f.write(class_file)
+        write_runtime(path.dirname(out_file_path), runtime)
+
+
+def read_program(program_path: str) -> Dict[str, bytes]:
+    """
+    Class name -> class file of the classes of a program written by `write_program`.
+    """
+    if program_path.endswith(JAR_EXT):
+        with zipfile.ZipFile(program_path) as jar:
+            return {name[:-len(".class")]: jar.read(name) for name in jar.namelist() if name.endswith(".class")}
+    classes = {}
+    for class_path in (program_path, path.join(path.dirname(program_path), RUNTIME_CLASS_NAME + ".class")):
+        with open(class_path, "rb") as f:
+            classes[path.splitext(path.basename(class_path))[0]] = f.read()
+    return classes
+
+
+class RuntimeCache:
+    def __init__(self, directory: str, options: Iterable[str]):
+        key = hashlib.sha256()
+        for part in (compiler_version(), *options):
+            key.update(part.encode())
+            key.update(b"\0")
+        self.class_path = path.join(directory, "runtime", key.hexdigest() + ".class")
+        self.references_path = path.join(directory, "runtime", key.hexdigest() + ".json")
+
+    def load(self, generate: Callable[[], Runtime]) -> Runtime:
+        """
+        Returns the cached runtime, it is generated and stored on the first use.
+        """
+        try:
+            with open(self.class_path, "rb") as f:
+                class_file = f.read()
+            with open(self.references_path) as f:
+                references = {attribute: tuple(reference) for attribute, reference in json.load(f).items()}
+            return Runtime(class_file, references)
+        except (FileNotFoundError, ValueError):
+            pass
+
+        runtime = generate()
+        write_atomic(self.class_path, runtime.class_file)
+        write_atomic(self.references_path, json.dumps(runtime.references, indent=1).encode())
+        return runtime
@@ -0,0 +1,525 @@
+"""
+Warm JVM that runs the classes generated by `porth-jvm.py com -r`.
+
+The server is a class generated like the programs themselves. It listens on a Unix socket and every run opens four
+connections, in order: the request, stdin, stdout and stderr. The client copies the classes of the program to a
+temporary directory, with the `System.exit` call redirected to `PorthRunServer.exit`, and the request is that directory,
+the name of the main class and the arguments. The classes are loaded by a new class loader, so each run gets fresh
+static state, and `main` is invoked on a new thread whose standard streams are the connections.
+When the program returns or exits, the exit code is written to the request connection. The runs are sequential, the
+connections of the next run wait in the backlog of the socket.
+
+Unix sockets require Java 16 or later.
+"""
+import fcntl
+import os
+import selectors
+import socket
+import struct
+import sys
+import tempfile
+import threading
+from io import BytesIO
+from os import path
+from typing import Optional, List
+
+from jawa.constants import ConstantPool, MethodReference, MethodHandleKind
+
+from extensions.DeduplicatingClassFile import DeduplicatingClassFile
+from jvm.context import GenerateContext
+from jvm.generator import create_method_direct
+from jvm.instructions import Instructions
+from jvm.intrinsics import OperandType
+from jvm.runtime import RUNTIME_CLASS_NAME, read_program
+
+SERVER_CLASS_NAME = "PorthRunServer"
+SOCKET_PATH_ENV = "PORTH_JVM_SERVER"
+
+# Order of the connections of a run
+REQUEST, STDIN, STDOUT, STDERR = range(4)
+
+CLASS_FILE_MAGIC = b"\xca\xfe\xba\xbe"
+
+
+def default_socket_path() -> str:
+    return os.environ.get(SOCKET_PATH_ENV) or (
+        path.join(os.environ["XDG_RUNTIME_DIR"], "porth-jvm.sock") if os.environ.get("XDG_RUNTIME_DIR")
+        else path.join(tempfile.gettempdir(), "porth-jvm-%d.sock" % os.getuid()))
+
+
+def server_context() -> GenerateContext:
+    context = GenerateContext()
+    context.cf = DeduplicatingClassFile.create(SERVER_CLASS_NAME)
+    context.peephole = False
+    return context
+
+
+def create_server_method(context: GenerateContext, name: str, descriptor: str, instructions: Instructions):
+    method = context.cf.methods.create(name, descriptor, code=True)
+    method.access_flags.acc_public = True
+    method.access_flags.acc_static = True
+    create_method_direct(method, instructions)
+
+
+def generate_server_class(out_directory: str) -> str:
+    """
+    Writes `PorthRunServer.class` into `out_directory` and returns its path. The class loaders of the runs delegate
+    to the class path of the server first, so `out_directory` must not contain the classes of programs.
+    """
+    context = server_context()
+    cf = context.cf
+    constants = cf.constants
+
+    for name, descriptor in (("exit_error", "Ljava/lang/Error;"),
+                             ("connections", "[Ljava/nio/channels/SocketChannel;"),
+                             ("exit_code", "I")):
+        field = cf.fields.create(name, descriptor)
+        field.access_flags.acc_public = False
+        field.access_flags.acc_private = True
+        field.access_flags.acc_static = True
+    # Thrown by `exit` to unwind the program, the run is then finished by `uncaught`
+    exit_error_ref = constants.create_field_ref(SERVER_CLASS_NAME, "exit_error", "Ljava/lang/Error;")
+    # Connections of the current run
+    connections_ref = constants.create_field_ref(SERVER_CLASS_NAME, "connections",
+                                                 "[Ljava/nio/channels/SocketChannel;")
+    # Exit code passed to `exit`
+    exit_code_ref = constants.create_field_ref(SERVER_CLASS_NAME, "exit_code", "I")
+
+    close = constants.create_method_ref("java/nio/channels/SocketChannel", "close", "()V")
+    new_input_stream = constants.create_method_ref("java/nio/channels/Channels", "newInputStream",
+                                                   "(Ljava/nio/channels/ReadableByteChannel;)Ljava/io/InputStream;")
+    new_output_stream = constants.create_method_ref("java/nio/channels/Channels", "newOutputStream",
+                                                    "(Ljava/nio/channels/WritableByteChannel;)Ljava/io/OutputStream;")
+    as_interface_instance = constants.create_method_ref("java/lang/invoke/MethodHandleProxies", "asInterfaceInstance",
+                                                        "(Ljava/lang/Class;Ljava/lang/invoke/MethodHandle;)"
+                                                        "Ljava/lang/Object;")
+    read_int = constants.create_method_ref("java/io/DataInputStream", "readInt", "()I")
+    public_lookup = constants.create_method_ref("java/lang/invoke/MethodHandles", "publicLookup",
+                                                "()Ljava/lang/invoke/MethodHandles$Lookup;")
+    for_name = constants.create_method_ref("java/lang/Class", "forName",
+                                           "(Ljava/lang/String;ZLjava/lang/ClassLoader;)Ljava/lang/Class;")
+
+    def method_handle(name: str, descriptor: str):
+        return constants.create_method_handle(MethodHandleKind.INVOKE_STATIC, SERVER_CLASS_NAME, name, descriptor)
+
+    create_server_method(context, "<clinit>", "()V", (
+        Instructions(context)
+        .new(constants.create_class("java/lang/Error"))
+        .duplicate_top_of_stack()
+        .push_constant(constants.create_string("exit"))
+        .invoke_special(constants.create_method_ref("java/lang/Error", "<init>", "(Ljava/lang/String;)V"))
+        .put_static_field(exit_error_ref)
+        .return_void()
+    ))
+
+    # Replaces `System.exit` in the programs
+    create_server_method(context, "exit", "(I)V", (
+        Instructions(context)
+        .load_integer(0)
+        .put_static_field(exit_code_ref)
+        .get_static_field(exit_error_ref)
+        .throw_exception()
+    ))
+
+    # Variables:
+    # 0: exit code
+    finish_instructions = Instructions(context)
+    for connection in (STDERR, STDOUT, STDIN):
+        (
+            finish_instructions
+            .get_static_field(connections_ref)
+            .push_integer(connection)
+            .load_array_reference()
+            .invoke_virtual(close)
+        )
+    (
+        finish_instructions
+        .new(constants.create_class("java/io/DataOutputStream"))
+        .duplicate_top_of_stack()
+        .get_static_field(connections_ref)
+        .push_integer(REQUEST)
+        .load_array_reference()
+        .invoke_static(new_output_stream)
+        .invoke_special(constants.create_method_ref("java/io/DataOutputStream", "<init>", "(Ljava/io/OutputStream;)V"))
+        .load_integer(0)
+        .invoke_virtual(constants.create_method_ref("java/io/DataOutputStream", "writeInt", "(I)V"))
+        .get_static_field(connections_ref)
+        .push_integer(REQUEST)
+        .load_array_reference()
+        .invoke_virtual(close)
+        .return_void()
+    )
+    create_server_method(context, "finish", "(I)V", finish_instructions)
+    finish = constants.create_method_ref(SERVER_CLASS_NAME, "finish", "(I)V")
+
+    # Variables:
+    # 0: request stream
+    # 1: bytes
+    create_server_method(context, "read_string", "(Ljava/io/DataInputStream;)Ljava/lang/String;", (
+        Instructions(context)
+        .load_reference(0)
+        .invoke_virtual(read_int)
+        .new_array(OperandType.Byte.array_type)
+        .store_reference(1)
+        .load_reference(0)
+        .load_reference(1)
+        .invoke_virtual(constants.create_method_ref("java/io/DataInputStream", "readFully", "([B)V"))
+        .new(constants.create_class("java/lang/String"))
+        .duplicate_top_of_stack()
+        .load_reference(1)
+        .get_static_field(constants.create_field_ref("java/nio/charset/StandardCharsets", "UTF_8",
+                                                     "Ljava/nio/charset/Charset;"))
+        .invoke_special(constants.create_method_ref("java/lang/String", "<init>", "([BLjava/nio/charset/Charset;)V"))
+        .return_reference()
+    ))
+    read_string = constants.create_method_ref(SERVER_CLASS_NAME, "read_string",
+                                              "(Ljava/io/DataInputStream;)Ljava/lang/String;")
+
+    # Variables:
+    # 0: request stream
+    # 1: class directory
+    # 2: class name
+    # 3: arguments
+    # 4: argument index
+    # 5: class loader
+    class_loader = 5
+    serve_instructions = Instructions(context)
+    # `print` writes to `System.out` directly
+    for connection, set_stream in ((STDOUT, "setOut"), (STDERR, "setErr")):
+        (
+            serve_instructions
+            .new(constants.create_class("java/io/PrintStream"))
+            .duplicate_top_of_stack()
+            .new(constants.create_class("java/io/BufferedOutputStream"))
+            .duplicate_top_of_stack()
+            .get_static_field(connections_ref)
+            .push_integer(connection)
+            .load_array_reference()
+            .invoke_static(new_output_stream)
+            .invoke_special(constants.create_method_ref("java/io/BufferedOutputStream", "<init>",
+                                                        "(Ljava/io/OutputStream;)V"))
+            .push_integer(1)
+            # Stack: print stream, print stream, buffered stream, auto flush
+            .invoke_special(constants.create_method_ref("java/io/PrintStream", "<init>",
+                                                        "(Ljava/io/OutputStream;Z)V"))
+            .invoke_static(constants.create_method_ref("java/lang/System", set_stream, "(Ljava/io/PrintStream;)V"))
+        )
+    (
+        serve_instructions
+        .new(constants.create_class("java/io/DataInputStream"))
+        .duplicate_top_of_stack()
+        .get_static_field(connections_ref)
+        .push_integer(REQUEST)
+        .load_array_reference()
+        .invoke_static(new_input_stream)
+        .invoke_special(constants.create_method_ref("java/io/DataInputStream", "<init>", "(Ljava/io/InputStream;)V"))
+        .store_reference(0)
+        .load_reference(0)
+        .invoke_static(read_string)
+        .store_reference(1)
+        .load_reference(0)
+        .invoke_static(read_string)
+        .store_reference(2)
+        .load_reference(0)
+        .invoke_virtual(read_int)
+        .new_reference_array(constants.create_class("java/lang/String"))
+        .store_reference(3)
+        .push_integer(0)
+        .store_integer(4)
+
+        .label("argument_loop")
+        .load_integer(4)
+        .load_reference(3)
+        .array_length()
+        .branch_if_integer_greater_or_equal("load")
+        .load_reference(3)
+        .load_integer(4)
+        .load_reference(0)
+        .invoke_static(read_string)
+        .store_array_reference()
+        .increment_integer(4, 1)
+        .branch("argument_loop")
+
+        .label("load")
+        .new(constants.create_class("java/net/URLClassLoader"))
+        .duplicate_top_of_stack()
+        .push_integer(1)
+        .new_reference_array(constants.create_class("java/net/URL"))
+        .duplicate_top_of_stack()
+        .push_integer(0)
+        .new(constants.create_class("java/io/File"))
+        .duplicate_top_of_stack()
+        .load_reference(1)
+        .invoke_special(constants.create_method_ref("java/io/File", "<init>", "(Ljava/lang/String;)V"))
+        .invoke_virtual(constants.create_method_ref("java/io/File", "toURI", "()Ljava/net/URI;"))
+        .invoke_virtual(constants.create_method_ref("java/net/URI", "toURL", "()Ljava/net/URL;"))
+        .store_array_reference()
+        # Stack: class loader, class loader, class path
+        .invoke_special(constants.create_method_ref("java/net/URLClassLoader", "<init>", "([Ljava/net/URL;)V"))
+        .store_reference(class_loader)
+    )
+    # The streams of the program are created lazily, the standard ones are set to the connections first
+    for field, array_type, index, connection, new_stream in (
+            ("input_streams", "[Ljava/io/InputStream;", 0, STDIN, new_input_stream),
+            ("output_streams", "[Ljava/io/OutputStream;", 1, STDOUT, new_output_stream),
+            ("output_streams", "[Ljava/io/OutputStream;", 2, STDERR, new_output_stream)):
+        (
+            serve_instructions
+            .invoke_static(public_lookup)
+            .push_constant(constants.create_string(RUNTIME_CLASS_NAME))
+            .push_integer(1)
+            .load_reference(class_loader)
+            .invoke_static(for_name)
+            .push_constant(constants.create_string(field))
+            .push_constant(constants.create_class(array_type))
+            .invoke_virtual(constants.create_method_ref(
+                "java/lang/invoke/MethodHandles$Lookup", "findStaticGetter",
+                "(Ljava/lang/Class;Ljava/lang/String;Ljava/lang/Class;)Ljava/lang/invoke/MethodHandle;"))
+            .invoke_virtual(constants.create_method_ref("java/lang/invoke/MethodHandle", "invokeExact",
+                                                        "()" + array_type))
+            # Stack: streams
+            .push_integer(index)
+            .get_static_field(connections_ref)
+            .push_integer(connection)
+            .load_array_reference()
+            .invoke_static(new_stream)
+            .store_array_reference()
+        )
+    (
+        serve_instructions
+        .invoke_static(public_lookup)
+        .load_reference(2)
+        .push_integer(1)
+        .load_reference(class_loader)
+        .invoke_static(for_name)
+        .push_constant(constants.create_string("main"))
+        .get_static_field(constants.create_field_ref("java/lang/Void", "TYPE", "Ljava/lang/Class;"))
+        .push_constant(constants.create_class("[Ljava/lang/String;"))
+        .invoke_static(constants.create_method_ref("java/lang/invoke/MethodType", "methodType",
+                                                   "(Ljava/lang/Class;Ljava/lang/Class;)"
+                                                   "Ljava/lang/invoke/MethodType;"))
+        .invoke_virtual(constants.create_method_ref(
+            "java/lang/invoke/MethodHandles$Lookup", "findStatic",
+            "(Ljava/lang/Class;Ljava/lang/String;Ljava/lang/invoke/MethodType;)Ljava/lang/invoke/MethodHandle;"))
+        .load_reference(3)
+        .invoke_virtual(constants.create_method_ref("java/lang/invoke/MethodHandle", "invokeExact",
+                                                    "([Ljava/lang/String;)V"))
+        # The program returned normally
+        .push_integer(0)
+        .invoke_static(finish)
+        .return_void()
+    )
+    create_server_method(context, "serve", "()V", serve_instructions)
+
+    # Variables:
+    # 0: thread
+    # 1: exception
+    create_server_method(context, "uncaught", "(Ljava/lang/Thread;Ljava/lang/Throwable;)V", (
+        Instructions(context)
+        .load_reference(1)
+        .get_static_field(exit_error_ref)
+        .branch_if_reference_not_equal("failure")
+        .get_static_field(exit_code_ref)
+        .invoke_static(finish)
+        .return_void()
+
+        .label("failure")
+        # Reported on the stderr of the program like an uncaught exception of `java`
+        .load_reference(1)
+        .invoke_virtual(constants.create_method_ref("java/lang/Throwable", "printStackTrace", "()V"))
+        .push_integer(1)
+        .invoke_static(finish)
+        .return_void()
+    ))
+
+    # Variables:
+    # 0: arguments, the socket path
+    # 1: address
+    # 2: server channel
+    # 3: uncaught exception handler
+    # 4: thread
+    main_instructions = (
+        Instructions(context)
+        .load_reference(0)
+        .push_integer(0)
+        .load_array_reference()
+        .invoke_static(constants.create_method_ref("java/net/UnixDomainSocketAddress", "of",
+                                                   "(Ljava/lang/String;)Ljava/net/UnixDomainSocketAddress;"))
+        .store_reference(1)
+        # The socket file of a previous server is left behind
+        .load_reference(1)
+        .invoke_virtual(constants.create_method_ref("java/net/UnixDomainSocketAddress", "getPath",
+                                                    "()Ljava/nio/file/Path;"))
+        .invoke_static(constants.create_method_ref("java/nio/file/Files", "deleteIfExists", "(Ljava/nio/file/Path;)Z"))
+        .pop()
+        .get_static_field(constants.create_field_ref("java/net/StandardProtocolFamily", "UNIX",
+                                                     "Ljava/net/StandardProtocolFamily;"))
+        .invoke_static(constants.create_method_ref("java/nio/channels/ServerSocketChannel", "open",
+                                                   "(Ljava/net/ProtocolFamily;)"
+                                                   "Ljava/nio/channels/ServerSocketChannel;"))
+        .load_reference(1)
+        .invoke_virtual(constants.create_method_ref("java/nio/channels/ServerSocketChannel", "bind",
+                                                    "(Ljava/net/SocketAddress;)"
+                                                    "Ljava/nio/channels/ServerSocketChannel;"))
+        .store_reference(2)
+        .push_constant(constants.create_class("java/lang/Thread$UncaughtExceptionHandler"))
+        .push_constant(method_handle("uncaught", "(Ljava/lang/Thread;Ljava/lang/Throwable;)V"))
+        .invoke_static(as_interface_instance)
+        .check_cast(constants.create_class("java/lang/Thread$UncaughtExceptionHandler"))
+        .store_reference(3)
+
+        .label("accept_loop")
+        .push_integer(4)
+        .new_reference_array(constants.create_class("java/nio/channels/SocketChannel"))
+        .put_static_field(connections_ref)
+    )
+    # The client holds a lock while it connects, so the connections of a run are accepted together
+    for connection in (REQUEST, STDIN, STDOUT, STDERR):
+        (
+            main_instructions
+            .get_static_field(connections_ref)
+            .push_integer(connection)
+            .load_reference(2)
+            .invoke_virtual(constants.create_method_ref("java/nio/channels/ServerSocketChannel", "accept",
+                                                        "()Ljava/nio/channels/SocketChannel;"))
+            .store_array_reference()
+        )
+    # The run is on a new thread, the uncaught exception handler finishes it if the program exits or fails
+    (
+        main_instructions
+        .new(constants.create_class("java/lang/Thread"))
+        .duplicate_top_of_stack()
+        .push_constant(constants.create_class("java/lang/Runnable"))
+        .push_constant(method_handle("serve", "()V"))
+        .invoke_static(as_interface_instance)
+        .check_cast(constants.create_class("java/lang/Runnable"))
+        .invoke_special(constants.create_method_ref("java/lang/Thread", "<init>", "(Ljava/lang/Runnable;)V"))
+        .store_reference(4)
+        .load_reference(4)
+        .load_reference(3)
+        .invoke_virtual(constants.create_method_ref("java/lang/Thread", "setUncaughtExceptionHandler",
+                                                    "(Ljava/lang/Thread$UncaughtExceptionHandler;)V"))
+        .load_reference(4)
+        .invoke_virtual(constants.create_method_ref("java/lang/Thread", "start", "()V"))
+        # The runs share `System.out` and `System.err`, so they do not overlap
+        .load_reference(4)
+        .invoke_virtual(constants.create_method_ref("java/lang/Thread", "join", "()V"))
+        .branch("accept_loop")
+    )
+    create_server_method(context, "main", "([Ljava/lang/String;)V", main_instructions)
+
+    out_file_path = path.join(out_directory, SERVER_CLASS_NAME + ".class")
+    with open(out_file_path, "wb") as f:
+        cf.save(f)
+    return out_file_path
+
+
+def redirect_exit(class_file: bytes) -> bytes:
+    """
+    Points the `System.exit(int)` reference of the class at `PorthRunServer.exit(int)`.
+    """
+    assert class_file[:4] == CLASS_FILE_MAGIC, "Not a class file"
+    # The constants follow the magic and the version
+    source = BytesIO(class_file[8:])
+    constants = ConstantPool()
+    constants.unpack(source)
+    rest = source.read()
+
+    for constant in list(constants):
+        if isinstance(constant, MethodReference) and constant.class_.name.value == "java/lang/System" \
+                and constant.name_and_type.name.value == "exit" \
+                and constant.name_and_type.descriptor.value == "(I)V":
+            constant.class_index = constants.create_class(SERVER_CLASS_NAME).index
+
+    patched = BytesIO()
+    patched.write(class_file[:8])
+    constants.pack(patched)
+    patched.write(rest)
+    return patched.getvalue()
+
+
+def _pump(source_fd: int, connection: socket.socket):
+    # Forwards stdin until its end, the program may exit before reading it
+    try:
+        while data := os.read(source_fd, 64 * 1024):
+            connection.sendall(data)
+        connection.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass
+
+
+def _write_string(request: BytesIO, string: str):
+    encoded = string.encode()
+    request.write(struct.pack(">i", len(encoded)))
+    request.write(encoded)
+
+
+def run_on_server(program_path: str, args: List[str], socket_path: Optional[str] = None,
+                  stdin: int = 0, stdout: int = 1, stderr: int = 2) -> Optional[int]:
+    """
+    Runs the program, a JAR or a class file, on the server listening on `socket_path` with the given file descriptors
+    as its standard streams. Returns the exit code of the program, or None if no server is listening.
+    """
+    if socket_path is None:
+        socket_path = default_socket_path()
+    if not path.exists(socket_path):
+        return None
+    classes = {class_name: redirect_exit(class_file) for class_name, class_file in read_program(program_path).items()}
+
+    connections = []
+    try:
+        with open(socket_path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            for _ in (REQUEST, STDIN, STDOUT, STDERR):
+                connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                connections.append(connection)
+                connection.connect(socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        # The socket file of a server that is not running anymore
+        for connection in connections:
+            connection.close()
+        return None
+
+    # The directory is only read before `main` is invoked, it is removed once the program exits
+    with tempfile.TemporaryDirectory(prefix="porth-jvm-run-") as class_directory:
+        for class_name, class_file in classes.items():
+            with open(path.join(class_directory, class_name + ".class"), "wb") as f:
+                f.write(class_file)
+        return _run(connections, class_directory, path.splitext(path.basename(program_path))[0], args,
+                    stdin, stdout, stderr)
+
+
+def _run(connections: List[socket.socket], class_directory: str, class_name: str, args: List[str],
+         stdin: int, stdout: int, stderr: int) -> int:
+    request = BytesIO()
+    _write_string(request, class_directory)
+    _write_string(request, class_name)
+    request.write(struct.pack(">i", len(args)))
+    for arg in args:
+        _write_string(request, arg)
+    connections[REQUEST].sendall(request.getvalue())
+
+    threading.Thread(target=_pump, args=(stdin, connections[STDIN]), daemon=True).start()
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with selectors.DefaultSelector() as selector:
+        selector.register(connections[STDOUT], selectors.EVENT_READ, stdout)
+        selector.register(connections[STDERR], selectors.EVENT_READ, stderr)
+        while selector.get_map():
+            for key, _ in selector.select():
+                data = key.fileobj.recv(64 * 1024)
+                if data:
+                    while data:
+                        data = data[os.write(key.data, data):]
+                else:
+                    selector.unregister(key.fileobj)
+
+    exit_code = b""
+    while len(exit_code) < 4 and (data := connections[REQUEST].recv(4 - len(exit_code))):
+        exit_code += data
+    for connection in connections:
+        connection.close()
+    if len(exit_code) < 4:
+        raise ConnectionError("The run server closed the connection before the program exited")
+    return struct.unpack(">i", exit_code)[0]
@@ -1,4 +1,5 @@
 from enum import IntEnum
+from typing import Dict
 
 
 class SysCalls(IntEnum):
@@ -319,6 +320,7 @@ class SysCalls(IntEnum):
 
 
 class OpenModes(IntEnum):
+    O_ACCMODE = 3
     O_RDONLY = 0
     O_WRONLY = 1
     O_RDWR = 2
@@ -337,3 +339,47 @@ class AtModes(IntEnum):
     AT_SYMLINK_NOFOLLOW = 0x100
     AT_REMOVEDIR = 0x200
     AT_SYMLINK_FOLLOW = 0x400
+
+
+# Syscalls emulated by a single helper that takes the arguments like `syscall<n>` does, the last one first:
+# number of arguments -> syscall -> attribute of the helper in `GenerateContext`
+SYSCALL_METHODS: Dict[int, Dict[SysCalls, str]] = {
+    1: {
+        SysCalls.CLOSE: "close_method",
+        SysCalls.PIPE: "pipe_method",
+        SysCalls.DUP: "dup_method",
+    },
+    2: {
+        SysCalls.FSTAT: "fstat_method",
+        SysCalls.DUP2: "dup2_method",
+        SysCalls.SHUTDOWN: "shutdown_method",
+        SysCalls.LISTEN: "listen_method",
+    },
+    3: {
+        SysCalls.READ: "read_method",
+        SysCalls.WRITE: "write_method",
+        SysCalls.OPEN: "open_method",
+        SysCalls.LSEEK: "lseek_method",
+        SysCalls.POLL: "poll_method",
+        SysCalls.SOCKET: "socket_method",
+        SysCalls.CONNECT: "connect_method",
+        SysCalls.ACCEPT: "accept_method",
+        SysCalls.BIND: "bind_method",
+    },
+    4: {
+        SysCalls.SENDFILE: "sendfile_method",
+    },
+    5: {
+        SysCalls.SETSOCKOPT: "setsockopt_method",
+    },
+    6: {
+        SysCalls.MMAP: "mmap_method",
+        SysCalls.SENDTO: "sendto_method",
+        SysCalls.RECVFROM: "recvfrom_method",
+    },
+}
+# `write` to a standard stream: file descriptor -> attribute of the helper, which takes the count and the buffer
+WRITE_STREAM_METHODS: Dict[int, str] = {
+    1: "write_stdout_method",
+    2: "write_stderr_method",
+}
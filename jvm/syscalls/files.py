@@ -0,0 +1,1124 @@
+"""
+Files opened by the program, emulated with `FileChannel`s.
+
+The file descriptors index the `fds` table of the standard streams and the `channels` table of the opened files and
+sockets, only one of them is set for an open file descriptor. Both tables (and the caches of the streams) grow
+together.
+"""
+from typing import Callable
+
+from jvm.context import GenerateContext
+from jvm.instructions import Instructions
+from jvm.intrinsics.native import SEGMENT_CLASS
+from jvm.intrinsics.store import store_32
+from jvm.syscalls import OpenModes
+from jvm.syscalls.streams import flush_stdout
+
+CHANNEL_CLASS = "java/nio/channels/Channel"
+FILE_CHANNEL_CLASS = "java/nio/channels/FileChannel"
+PIPE_CLASS = "java/nio/channels/Pipe"
+OPEN_OPTION_CLASS = "java/nio/file/StandardOpenOption"
+# Tables indexed by the file descriptors, as (attribute of the context, component class)
+FD_TABLES = (
+    ("fd_ref", "java/io/FileDescriptor"),
+    ("channels_ref", CHANNEL_CLASS),
+    ("input_streams_ref", "java/io/InputStream"),
+    ("output_streams_ref", "java/io/OutputStream"),
+)
+
+# Limit of the file descriptors of `dup2`, the tables grow up to it
+FD_LIMIT = 1 << 20
+
+SEEK_SET = 0
+SEEK_CUR = 1
+SEEK_END = 2
+
+MAP_ANONYMOUS = 0x20
+
+ENOENT = 2
+EBADF = 9
+EACCES = 13
+EEXIST = 17
+EINVAL = 22
+ESPIPE = 29
+
+# struct stat of x86_64 Linux
+STAT_SIZE = 144
+STAT_NLINK_OFFSET = 16
+STAT_MODE_OFFSET = 24
+STAT_SIZE_OFFSET = 48
+STAT_BLKSIZE_OFFSET = 56
+STAT_BLOCKS_OFFSET = 64
+S_IFREG_0644 = 0o100644
+S_IFCHR_0620 = 0o020620
+S_IFIFO_0600 = 0o010600
+S_IFSOCK_0777 = 0o140777
+# Class of the channel -> type and permissions of `fstat` for the channels that are not files
+CHANNEL_MODES = {
+    f"{PIPE_CLASS}$SourceChannel": S_IFIFO_0600,
+    f"{PIPE_CLASS}$SinkChannel": S_IFIFO_0600,
+    "java/nio/channels/NetworkChannel": S_IFSOCK_0777,
+}
+BLOCK_SIZE = 4096
+
+
+def store_64(context: GenerateContext, instructions: Instructions):
+    instructions.invoke_static(context.store_64_method)
+
+
+def grow_fds_method_instructions(context: GenerateContext) -> Instructions:
+    # Doubles the tables indexed by the file descriptors
+    instructions = Instructions(context)
+    for attribute, component_class in FD_TABLES:
+        table_ref = getattr(context, attribute)
+        (
+            instructions
+            .get_static_field(table_ref)
+            .get_static_field(table_ref)
+            .array_length()
+            .push_integer(2)
+            .multiply_integer()
+            .invoke_static(context.cf.constants.create_method_ref("java/util/Arrays", "copyOf",
+                                                                  "([Ljava/lang/Object;I)[Ljava/lang/Object;"))
+            .check_cast(context.cf.constants.create_class(f"[L{component_class};"))
+            .put_static_field(table_ref)
+        )
+    return instructions.return_void()
+
+
+def allocate_fd_method_instructions(context: GenerateContext) -> Instructions:
+    # Returns the lowest free file descriptor, the tables are doubled if they are full
+    # Variables:
+    # 0: file descriptor (as int)
+    fd = 0
+
+    return (
+        Instructions(context)
+        .push_integer(0)
+        .store_integer(fd)
+        .label("loop")
+        .load_integer(fd)
+        .get_static_field(context.fd_ref)
+        .array_length()
+        .branch_if_integer_greater_or_equal("grow")
+        .get_static_field(context.fd_ref)
+        .load_integer(fd)
+        .load_array_reference()
+        .branch_if_reference_is_not_null("next")
+        .get_static_field(context.channels_ref)
+        .load_integer(fd)
+        .load_array_reference()
+        .branch_if_reference_is_not_null("next")
+        .load_integer(fd)
+        .return_integer()
+        .label("next")
+        .increment_integer(fd, 1)
+        .branch("loop")
+
+        .label("grow")
+        .invoke_static(context.grow_fds_method)
+        # The first new entry is free
+        .load_integer(fd)
+        .return_integer()
+    )
+
+
+def fd_entry_method_instructions(context: GenerateContext) -> Instructions:
+    # Returns the descriptor or the channel of the file descriptor, null if it is not open
+    # Variables:
+    # 0: file descriptor (as int)
+    return (
+        Instructions(context)
+        .load_integer(0)
+        .branch_if_less("null")
+        .load_integer(0)
+        .get_static_field(context.fd_ref)
+        .array_length()
+        .branch_if_integer_greater_or_equal("null")
+        .get_static_field(context.fd_ref)
+        .load_integer(0)
+        .load_array_reference()
+        .branch_if_reference_is_null("channel")
+        .get_static_field(context.fd_ref)
+        .load_integer(0)
+        .load_array_reference()
+        .return_reference()
+        .label("channel")
+        .get_static_field(context.channels_ref)
+        .load_integer(0)
+        .load_array_reference()
+        .return_reference()
+        .label("null")
+        .push_null()
+        .return_reference()
+    )
+
+
+def aliased_method_instructions(context: GenerateContext) -> Instructions:
+    # Returns whether another file descriptor refers to the same entry (see `dup`), the entry is only closed with the
+    # last of them
+    # Variables:
+    # 0: file descriptor (as int)
+    # 1: entry
+    # 2: other file descriptor (as int)
+    fd = 0
+    entry = 1
+    other = 2
+
+    instructions = (
+        Instructions(context)
+        .load_integer(fd)
+        .invoke_static(context.fd_entry_method)
+        .store_reference(entry)
+        .load_reference(entry)
+        .branch_if_reference_is_null("false")
+        .push_integer(0)
+        .store_integer(other)
+        .label("loop")
+        .load_integer(other)
+        .get_static_field(context.fd_ref)
+        .array_length()
+        .branch_if_integer_greater_or_equal("false")
+        .load_integer(other)
+        .load_integer(fd)
+        .branch_if_integer_equal("next")
+    )
+    for table_ref in (context.fd_ref, context.channels_ref):
+        (
+            instructions
+            .get_static_field(table_ref)
+            .load_integer(other)
+            .load_array_reference()
+            .load_reference(entry)
+            .branch_if_reference_equal("true")
+        )
+    return (
+        instructions
+        .label("next")
+        .increment_integer(other, 1)
+        .branch("loop")
+
+        .label("true")
+        .push_integer(1)
+        .return_integer()
+        .label("false")
+        .push_integer(0)
+        .return_integer()
+    )
+
+
+def copy_fd(context: GenerateContext, instructions: Instructions, old_fd: int, new_fd: int):
+    # Makes the new file descriptor an alias of the old one, including the cached streams that keep the buffered
+    # output in order (int variables)
+    for attribute, _ in FD_TABLES:
+        table_ref = getattr(context, attribute)
+        (
+            instructions
+            .get_static_field(table_ref)
+            .load_integer(new_fd)
+            .get_static_field(table_ref)
+            .load_integer(old_fd)
+            .load_array_reference()
+            .store_array_reference()
+        )
+
+
+def channel_method_instructions(context: GenerateContext) -> Instructions:
+    # Returns the channel of the file descriptor, null if it is not an opened file or socket
+    # Variables:
+    # 0: file descriptor (as int)
+    return (
+        Instructions(context)
+        .load_integer(0)
+        .branch_if_less("null")
+        .load_integer(0)
+        .get_static_field(context.channels_ref)
+        .array_length()
+        .branch_if_integer_greater_or_equal("null")
+        .get_static_field(context.channels_ref)
+        .load_integer(0)
+        .load_array_reference()
+        .return_reference()
+        .label("null")
+        .push_null()
+        .return_reference()
+    )
+
+
+def file_channel_method_instructions(context: GenerateContext) -> Instructions:
+    # Returns the channel of the file descriptor, null if it is not an opened file
+    # Variables:
+    # 0: file descriptor (as int)
+    # 1: channel
+    channel = 1
+
+    file_channel_class = context.cf.constants.create_class(FILE_CHANNEL_CLASS)
+    return (
+        Instructions(context)
+        .load_integer(0)
+        .invoke_static(context.channel_method)
+        .store_reference(channel)
+        .load_reference(channel)
+        .instance_of(file_channel_class)
+        .branch_if_false("null")
+        .load_reference(channel)
+        .check_cast(file_channel_class)
+        .return_reference()
+        .label("null")
+        .push_null()
+        .return_reference()
+    )
+
+
+def seek_append_method_instructions(context: GenerateContext) -> Instructions:
+    # Moves the channel of the file descriptor to the end of its file if it was opened with O_APPEND, before a write
+    # Variables:
+    # 0: file descriptor (as int)
+    # 1: channel
+    channel = 1
+
+    return (
+        Instructions(context)
+        .get_static_field(context.appending_ref)
+        .invoke_interface(context.cf.constants.create_interface_method_ref("java/util/Set", "isEmpty", "()Z"))
+        .branch_if_true("return")
+        .load_integer(0)
+        .invoke_static(context.file_channel_method)
+        .store_reference(channel)
+        .get_static_field(context.appending_ref)
+        .load_reference(channel)
+        .invoke_interface(context.cf.constants.create_interface_method_ref("java/util/Set", "contains",
+                                                                           "(Ljava/lang/Object;)Z"))
+        .branch_if_false("return")
+        .load_reference(channel)
+        .load_reference(channel)
+        .invoke_virtual(context.cf.constants.create_method_ref(FILE_CHANNEL_CLASS, "size", "()J"))
+        .invoke_virtual(context.cf.constants.create_method_ref(FILE_CHANNEL_CLASS, "position",
+                                                               f"(J)L{FILE_CHANNEL_CLASS};"))
+        .pop()
+        .label("return")
+        .return_void()
+    )
+
+
+def open_method_instructions(context: GenerateContext) -> Instructions:
+    # Variables:
+    # 0: mode (ignored, the files are created with the default permissions)
+    # 2: flags
+    # 4: pathname pointer
+    # 6: path
+    # 7: options
+    # 8: file descriptor (as int)
+    # 9: channel
+    flags = 2
+    pathname = 4
+    path = 6
+    options = 7
+    fd = 8
+    channel = 9
+
+    path_class = "java/nio/file/Path"
+    set_add = context.cf.constants.create_interface_method_ref("java/util/Set", "add", "(Ljava/lang/Object;)Z")
+    link_option_class = context.cf.constants.create_class("java/nio/file/LinkOption")
+
+    def add_option(name: str):
+        (
+            instructions
+            .load_reference(options)
+            .get_static_field(context.cf.constants.create_field_ref(OPEN_OPTION_CLASS, name,
+                                                                    f"L{OPEN_OPTION_CLASS};"))
+            .invoke_interface(set_add)
+            .pop()
+        )
+
+    def branch_if_flag_clear(flag: int, label: str):
+        (
+            instructions
+            .load_long(flags)
+            .push_long(flag)
+            .and_long()
+            .push_long(0)
+            .compare_long()
+            .branch_if_equal(label)
+        )
+
+    def branch_if_access_mode(access_mode: int, label: str):
+        (
+            instructions
+            .load_long(flags)
+            .push_long(OpenModes.O_ACCMODE)
+            .and_long()
+            .push_long(access_mode)
+            .compare_long()
+            .branch_if_equal(label)
+        )
+
+    def files_check(method: str, label: str):
+        # Branches to the label if the check of `Files` fails
+        (
+            instructions
+            .load_reference(path)
+            .invoke_static(context.cf.constants.create_method_ref("java/nio/file/Files", method,
+                                                                  f"(L{path_class};)Z"))
+            .branch_if_false(label)
+        )
+
+    instructions = (
+        Instructions(context)
+        .load_long(pathname)
+        .invoke_static(context.cstring_to_string_method)
+        .push_integer(0)
+        .new_reference_array(context.cf.constants.create_class("java/lang/String"))
+        .invoke_static(context.cf.constants.create_method_ref("java/nio/file/Paths", "get",
+                                                              f"(Ljava/lang/String;[Ljava/lang/String;)L{path_class};"))
+        .store_reference(path)
+        .new(context.cf.constants.create_class("java/util/HashSet"))
+        .duplicate_top_of_stack()
+        .invoke_special(context.cf.constants.create_method_ref("java/util/HashSet", "<init>", "()V"))
+        .store_reference(options)
+    )
+    branch_if_access_mode(OpenModes.O_WRONLY, "write")
+    add_option("READ")
+    instructions.label("write")
+    branch_if_access_mode(OpenModes.O_RDONLY, "exists")
+    add_option("WRITE")
+
+    # The failures are detected up front, `FileChannel.open` throws. The creation, the truncation and the append mode
+    # are emulated too: `FileChannel.open` only creates the files it opens for writing and rejects the combinations of
+    # APPEND with READ or TRUNCATE_EXISTING.
+    (
+        instructions
+        .label("exists")
+        .load_reference(path)
+        .push_integer(0)
+        .new_reference_array(link_option_class)
+        .invoke_static(context.cf.constants.create_method_ref("java/nio/file/Files", "exists",
+                                                              f"(L{path_class};[Ljava/nio/file/LinkOption;)Z"))
+        .branch_if_true("found")
+    )
+    branch_if_flag_clear(OpenModes.O_CREAT, "enoent")
+    (
+        instructions
+        .load_reference(path)
+        .invoke_interface(context.cf.constants.create_interface_method_ref(path_class, "toAbsolutePath",
+                                                                           f"()L{path_class};"))
+        .invoke_interface(context.cf.constants.create_interface_method_ref(path_class, "getParent",
+                                                                           f"()L{path_class};"))
+        .push_integer(0)
+        .new_reference_array(link_option_class)
+        .invoke_static(context.cf.constants.create_method_ref("java/nio/file/Files", "isDirectory",
+                                                              f"(L{path_class};[Ljava/nio/file/LinkOption;)Z"))
+        .branch_if_false("enoent")
+        .load_reference(path)
+        .push_integer(0)
+        .new_reference_array(context.cf.constants.create_class("java/nio/file/attribute/FileAttribute"))
+        .invoke_static(context.cf.constants.create_method_ref(
+            "java/nio/file/Files", "createFile",
+            f"(L{path_class};[Ljava/nio/file/attribute/FileAttribute;)L{path_class};"))
+        .pop()
+        .branch("open")
+    )
+
+    instructions.label("found")
+    branch_if_flag_clear(OpenModes.O_CREAT, "access")
+    branch_if_flag_clear(OpenModes.O_EXCL, "access")
+    instructions.branch("eexist")
+
+    instructions.label("access")
+    branch_if_access_mode(OpenModes.O_WRONLY, "writable")
+    files_check("isReadable", "eacces")
+    instructions.label("writable")
+    branch_if_access_mode(OpenModes.O_RDONLY, "open")
+    files_check("isWritable", "eacces")
+
+    (
+        instructions
+        .label("open")
+        .load_reference(path)
+        .load_reference(options)
+        .push_integer(0)
+        .new_reference_array(context.cf.constants.create_class("java/nio/file/attribute/FileAttribute"))
+        .invoke_static(context.cf.constants.create_method_ref(
+            FILE_CHANNEL_CLASS, "open",
+            f"(L{path_class};Ljava/util/Set;[Ljava/nio/file/attribute/FileAttribute;)L{FILE_CHANNEL_CLASS};"))
+        .store_reference(channel)
+    )
+    # A file opened read-only is neither truncated nor appended to
+    branch_if_access_mode(OpenModes.O_RDONLY, "allocate")
+    branch_if_flag_clear(OpenModes.O_TRUNC, "append")
+    (
+        instructions
+        .load_reference(channel)
+        .push_long(0)
+        .invoke_virtual(context.cf.constants.create_method_ref(FILE_CHANNEL_CLASS, "truncate",
+                                                               f"(J)L{FILE_CHANNEL_CLASS};"))
+        .pop()
+        .label("append")
+    )
+    branch_if_flag_clear(OpenModes.O_APPEND, "allocate")
+    return (
+        instructions
+        .get_static_field(context.appending_ref)
+        .load_reference(channel)
+        .invoke_interface(set_add)
+        .pop()
+
+        .label("allocate")
+        .invoke_static(context.allocate_fd_method)
+        .store_integer(fd)
+        .get_static_field(context.channels_ref)
+        .load_integer(fd)
+        .load_reference(channel)
+        .store_array_reference()
+        .load_integer(fd)
+        .convert_integer_to_long()
+        .return_long()
+
+        .label("enoent")
+        .push_long(-ENOENT)
+        .return_long()
+        .label("eexist")
+        .push_long(-EEXIST)
+        .return_long()
+        .label("eacces")
+        .push_long(-EACCES)
+        .return_long()
+    )
+
+
+def lseek_method_instructions(context: GenerateContext) -> Instructions:
+    # Variables:
+    # 0: whence
+    # 2: offset
+    # 4: file descriptor
+    # 6: channel
+    # 7: new position (long)
+    whence = 0
+    offset = 2
+    fd = 4
+    channel = 6
+    position = 7
+
+    return (
+        Instructions(context)
+        .load_long(fd)
+        .convert_long_to_integer()
+        .invoke_static(context.file_channel_method)
+        .duplicate_top_of_stack()
+        .store_reference(channel)
+        # Only the opened files can be repositioned, the standard streams may be pipes
+        .branch_if_reference_is_null("espipe")
+        .load_long(whence)
+        .convert_long_to_integer()
+        .lookup_switch("einval", {SEEK_SET: "set", SEEK_CUR: "cur", SEEK_END: "end"})
+        .label("set")
+        .push_long(0)
+        .branch("seek")
+        .label("cur")
+        .load_reference(channel)
+        .invoke_virtual(context.cf.constants.create_method_ref(FILE_CHANNEL_CLASS, "position", "()J"))
+        .branch("seek")
+        .label("end")
+        .load_reference(channel)
+        .invoke_virtual(context.cf.constants.create_method_ref(FILE_CHANNEL_CLASS, "size", "()J"))
+        .label("seek")
+        # Stack: base of the offset
+        .load_long(offset)
+        .add_long()
+        .duplicate_long()
+        .store_long(position)
+        .push_long(0)
+        .compare_long()
+        .branch_if_less("einval")
+        .load_reference(channel)
+        .load_long(position)
+        .invoke_virtual(context.cf.constants.create_method_ref(FILE_CHANNEL_CLASS, "position",
+                                                               f"(J)L{FILE_CHANNEL_CLASS};"))
+        .pop()
+        .load_long(position)
+        .return_long()
+
+        .label("espipe")
+        .load_long(fd)
+        .convert_long_to_integer()
+        .invoke_static(context.fd_entry_method)
+        .branch_if_reference_is_null("ebadf")
+        .push_long(-ESPIPE)
+        .return_long()
+        .label("ebadf")
+        .push_long(-EBADF)
+        .return_long()
+        .label("einval")
+        .push_long(-EINVAL)
+        .return_long()
+    )
+
+
+def fstat_method_instructions(context: GenerateContext) -> Instructions:
+    # Fills the type and the size of the file, the other fields are zeroed
+    # Variables:
+    # 0: statbuf pointer
+    # 2: file descriptor
+    # 4: channel
+    # 5: size of the file (long)
+    # 7: other channel
+    statbuf = 0
+    fd = 2
+    channel = 4
+    size = 5
+    other = 7
+
+    def store(offset: int, store_value: Callable[[GenerateContext, Instructions], None]):
+        # Stack: value (as long)
+        instructions.load_long(statbuf)
+        instructions.push_long(offset)
+        instructions.add_long()
+        store_value(context, instructions)
+
+    instructions = (
+        Instructions(context)
+        .load_long(fd)
+        .convert_long_to_integer()
+        .invoke_static(context.fd_entry_method)
+        .branch_if_reference_is_null("ebadf")
+        .load_long(fd)
+        .convert_long_to_integer()
+        .invoke_static(context.file_channel_method)
+        .store_reference(channel)
+    )
+    for offset in range(0, STAT_SIZE, 8):
+        instructions.push_long(0)
+        store(offset, store_64)
+    instructions.push_long(1)
+    store(STAT_NLINK_OFFSET, store_64)
+    instructions.push_long(BLOCK_SIZE)
+    store(STAT_BLKSIZE_OFFSET, store_64)
+    (
+        instructions
+        .load_reference(channel)
+        .branch_if_reference_is_not_null("file")
+        .load_long(fd)
+        .convert_long_to_integer()
+        .invoke_static(context.channel_method)
+        .store_reference(other)
+    )
+    for i, (class_, mode) in enumerate(CHANNEL_MODES.items()):
+        (
+            instructions
+            .load_reference(other)
+            .instance_of(context.cf.constants.create_class(class_))
+            .branch_if_false(f"other_{i}")
+            .push_long(mode)
+        )
+        store(STAT_MODE_OFFSET, store_32)
+        (
+            instructions
+            .push_long(0)
+            .return_long()
+            .label(f"other_{i}")
+        )
+    # The standard streams are reported as character devices
+    instructions.push_long(S_IFCHR_0620)
+    store(STAT_MODE_OFFSET, store_32)
+    (
+        instructions
+        .push_long(0)
+        .return_long()
+
+        .label("file")
+        .push_long(S_IFREG_0644)
+    )
+    store(STAT_MODE_OFFSET, store_32)
+    (
+        instructions
+        .load_reference(channel)
+        .invoke_virtual(context.cf.constants.create_method_ref(FILE_CHANNEL_CLASS, "size", "()J"))
+        .store_long(size)
+        .load_long(size)
+    )
+    store(STAT_SIZE_OFFSET, store_64)
+    (
+        instructions
+        .load_long(size)
+        .push_long(511)
+        .add_long()
+        .push_long(512)
+        .divide_long()
+    )
+    store(STAT_BLOCKS_OFFSET, store_64)
+    return (
+        instructions
+        .push_long(0)
+        .return_long()
+
+        .label("ebadf")
+        .push_long(-EBADF)
+        .return_long()
+    )
+
+
+def mmap_method_instructions(context: GenerateContext) -> Instructions:
+    # The memory of the program is one region addressed by offsets, so the file cannot be mapped in place: it is
+    # mapped with `FileChannel.map` and copied into the memory in bulk. The mapping is private, the writes of the
+    # program are not written back to the file.
+    # Variables:
+    # 0: offset
+    # 2: file descriptor
+    # 4: flags
+    # 6: prot (ignored)
+    # 8: length
+    # 10: addr (ignored, the memory is never mapped at a fixed address)
+    # 12: pointer to the mapping (long)
+    # 14: channel
+    # 15: mapped size (as int)
+    offset = 0
+    fd = 2
+    flags = 4
+    length = 8
+    pointer = 12
+    channel = 14
+    mapped = 15
+
+    instructions = (
+        Instructions(context)
+        .push_null()
+        .store_reference(channel)
+        .load_long(length)
+        .push_long(0)
+        .compare_long()
+        .branch_if_less_or_equal("einval")
+        .load_long(flags)
+        .push_long(MAP_ANONYMOUS)
+        .and_long()
+        .push_long(0)
+        .compare_long()
+        .branch_if_not_equal("map")
+        .load_long(fd)
+        .convert_long_to_integer()
+        .invoke_static(context.file_channel_method)
+        .duplicate_top_of_stack()
+        .store_reference(channel)
+        .branch_if_reference_is_null("ebadf")
+        .label("map")
+        .load_long(length)
+        .convert_long_to_integer()
+        .invoke_static(context.extend_mem_method)
+        .store_long(pointer)
+        # The mapping is never released, the memory below the new top is not handed out again
+        .get_static_field(context.memory_top_ref)
+        .put_static_field(context.memory_floor_ref)
+        # Anonymous memory is zeroed by `extend_mem`
+        .load_long(flags)
+        .push_long(MAP_ANONYMOUS)
+        .and_long()
+        .push_long(0)
+        .compare_long()
+        .branch_if_not_equal("return")
+        # The part of the mapping past the end of the file stays zeroed
+        .load_reference(channel)
+        .invoke_virtual(context.cf.constants.create_method_ref(FILE_CHANNEL_CLASS, "size", "()J"))
+        .load_long(offset)
+        .subtract_long()
+        .load_long(length)
+        .invoke_static(context.cf.constants.create_method_ref("java/lang/Math", "min", "(JJ)J"))
+        .convert_long_to_integer()
+        .duplicate_top_of_stack()
+        .store_integer(mapped)
+        .branch_if_less_or_equal("return")
+        .load_reference(channel)
+        .get_static_field(context.cf.constants.create_field_ref(f"{FILE_CHANNEL_CLASS}$MapMode", "READ_ONLY",
+                                                                f"L{FILE_CHANNEL_CLASS}$MapMode;"))
+        .load_long(offset)
+        .load_integer(mapped)
+        .convert_integer_to_long()
+        .invoke_virtual(context.cf.constants.create_method_ref(
+            FILE_CHANNEL_CLASS, "map", f"(L{FILE_CHANNEL_CLASS}$MapMode;JJ)Ljava/nio/MappedByteBuffer;"))
+        # Stack: mapped buffer
+    )
+    if context.memory_backend.is_segment:
+        (
+            instructions
+            .invoke_static(context.cf.constants.create_interface_method_ref(
+                SEGMENT_CLASS, "ofBuffer", f"(Ljava/nio/Buffer;)L{SEGMENT_CLASS};"))
+            .push_long(0)
+            .get_static_field(context.memory_ref)
+            .load_long(pointer)
+            .load_integer(mapped)
+            .convert_integer_to_long()
+            # Stack: mapped segment, 0, memory, pointer, mapped size
+            .invoke_static(context.cf.constants.create_interface_method_ref(
+                SEGMENT_CLASS, "copy", f"(L{SEGMENT_CLASS};JL{SEGMENT_CLASS};JJ)V"))
+        )
+    else:
+        (
+            instructions
+            .get_static_field(context.memory_ref)
+            .load_long(pointer)
+            .convert_long_to_integer()
+            .load_integer(mapped)
+            # Stack: mapped buffer, memory, pointer (as int), mapped size
+            .invoke_virtual(context.cf.constants.create_method_ref("java/nio/ByteBuffer", "get",
+                                                                   "([BII)Ljava/nio/ByteBuffer;"))
+            .pop()
+        )
+    return (
+        instructions
+        .label("return")
+        .load_long(pointer)
+        .return_long()
+
+        .label("ebadf")
+        .push_long(-EBADF)
+        .return_long()
+        .label("einval")
+        .push_long(-EINVAL)
+        .return_long()
+    )
+
+
+def close_method_instructions(context: GenerateContext) -> Instructions:
+    # Variables:
+    # 0: file descriptor
+    # 2: channel
+    fd = 0
+    channel = 2
+
+    instructions = (
+        Instructions(context)
+        .load_long(fd)
+        .convert_long_to_integer()
+        .invoke_static(context.fd_entry_method)
+        .branch_if_reference_is_null("ebadf")
+    )
+    flush_stdout(context, instructions)
+    (
+        instructions
+        .load_long(fd)
+        .convert_long_to_integer()
+        .invoke_static(context.channel_method)
+        .store_reference(channel)
+        # The file or the stream stays open while another file descriptor refers to it
+        .load_long(fd)
+        .convert_long_to_integer()
+        .invoke_static(context.aliased_method)
+        .branch_if_true("release")
+        .load_reference(channel)
+        .branch_if_reference_is_null("descriptor")
+        .load_reference(channel)
+        .invoke_interface(context.cf.constants.create_interface_method_ref(CHANNEL_CLASS, "close", "()V"))
+        .get_static_field(context.appending_ref)
+        .load_reference(channel)
+        .invoke_interface(context.cf.constants.create_interface_method_ref("java/util/Set", "remove",
+                                                                           "(Ljava/lang/Object;)Z"))
+        .pop()
+        .branch("release")
+
+        .label("descriptor")
+    )
+    # The standard streams of the JVM stay open, `dup2` onto 0, 1 or 2 only replaces them in the table
+    for stream in ("in", "out", "err"):
+        (
+            instructions
+            .get_static_field(context.fd_ref)
+            .load_long(fd)
+            .convert_long_to_integer()
+            .load_array_reference()
+            .get_static_field(context.cf.constants.create_field_ref("java/io/FileDescriptor", stream,
+                                                                    "Ljava/io/FileDescriptor;"))
+            .branch_if_reference_equal("release")
+        )
+    (
+        instructions
+        .new(context.cf.constants.create_class("java/io/FileInputStream"))
+        .duplicate_top_of_stack()
+        .get_static_field(context.fd_ref)
+        .load_long(fd)
+        .convert_long_to_integer()
+        .load_array_reference()
+        .invoke_special(context.cf.constants.create_method_ref("java/io/FileInputStream", "<init>",
+                                                               "(Ljava/io/FileDescriptor;)V"))
+        .invoke_virtual(context.cf.constants.create_method_ref("java/io/FileInputStream", "close", "()V"))
+
+        .label("release")
+    )
+    # Drop the entry and the cached streams of the closed file descriptor
+    for attribute, _ in FD_TABLES:
+        (
+            instructions
+            .get_static_field(getattr(context, attribute))
+            .load_long(fd)
+            .convert_long_to_integer()
+            .push_null()
+            .store_array_reference()
+        )
+    return (
+        instructions
+        .push_long(0)
+        .return_long()
+
+        .label("ebadf")
+        .push_long(-EBADF)
+        .return_long()
+    )
+
+
+def dup_method_instructions(context: GenerateContext) -> Instructions:
+    # Variables:
+    # 0: old file descriptor
+    # 2: old file descriptor (as int)
+    # 3: new file descriptor (as int)
+    old_fd = 2
+    new_fd = 3
+
+    instructions = (
+        Instructions(context)
+        .load_long(0)
+        .convert_long_to_integer()
+        .store_integer(old_fd)
+        .load_integer(old_fd)
+        .invoke_static(context.fd_entry_method)
+        .branch_if_reference_is_null("ebadf")
+        .invoke_static(context.allocate_fd_method)
+        .store_integer(new_fd)
+    )
+    copy_fd(context, instructions, old_fd, new_fd)
+    return (
+        instructions
+        .load_integer(new_fd)
+        .convert_integer_to_long()
+        .return_long()
+
+        .label("ebadf")
+        .push_long(-EBADF)
+        .return_long()
+    )
+
+
+def dup2_method_instructions(context: GenerateContext) -> Instructions:
+    # Variables:
+    # 0: new file descriptor
+    # 2: old file descriptor
+    # 4: old file descriptor (as int)
+    # 5: new file descriptor (as int)
+    old_fd = 4
+    new_fd = 5
+
+    instructions = (
+        Instructions(context)
+        .load_long(0)
+        .push_long(0)
+        .compare_long()
+        .branch_if_less("ebadf")
+        .load_long(0)
+        .push_long(FD_LIMIT)
+        .compare_long()
+        .branch_if_greater_or_equal("ebadf")
+        .load_long(0)
+        .convert_long_to_integer()
+        .store_integer(new_fd)
+        .load_long(2)
+        .convert_long_to_integer()
+        .store_integer(old_fd)
+        .load_integer(old_fd)
+        .invoke_static(context.fd_entry_method)
+        .branch_if_reference_is_null("ebadf")
+        .load_integer(old_fd)
+        .load_integer(new_fd)
+        .branch_if_integer_equal("return")
+        # The new file descriptor is closed first if it is open
+        .load_integer(new_fd)
+        .invoke_static(context.fd_entry_method)
+        .branch_if_reference_is_null("grow")
+        .load_long(0)
+        .invoke_static(context.close_method)
+        .drop_long()
+        .label("grow")
+        .load_integer(new_fd)
+        .get_static_field(context.fd_ref)
+        .array_length()
+        .branch_if_integer_less("copy")
+        .invoke_static(context.grow_fds_method)
+        .branch("grow")
+        .label("copy")
+    )
+    copy_fd(context, instructions, old_fd, new_fd)
+    return (
+        instructions
+        .label("return")
+        .load_long(0)
+        .return_long()
+
+        .label("ebadf")
+        .push_long(-EBADF)
+        .return_long()
+    )
+
+
+def pipe_method_instructions(context: GenerateContext) -> Instructions:
+    # Variables:
+    # 0: pipefd pointer
+    # 2: pipe
+    # 3: file descriptor (as int)
+    pipefd = 0
+    pipe = 2
+    fd = 3
+
+    instructions = (
+        Instructions(context)
+        .invoke_static(context.cf.constants.create_method_ref(PIPE_CLASS, "open", f"()L{PIPE_CLASS};"))
+        .store_reference(pipe)
+    )
+    # The read end, then the write end
+    for i, (method, channel_class) in enumerate((("source", f"{PIPE_CLASS}$SourceChannel"),
+                                                 ("sink", f"{PIPE_CLASS}$SinkChannel"))):
+        (
+            instructions
+            .invoke_static(context.allocate_fd_method)
+            .store_integer(fd)
+            .get_static_field(context.channels_ref)
+            .load_integer(fd)
+            .load_reference(pipe)
+            .invoke_virtual(context.cf.constants.create_method_ref(PIPE_CLASS, method, f"()L{channel_class};"))
+            .store_array_reference()
+            .load_integer(fd)
+            .convert_integer_to_long()
+            .load_long(pipefd)
+            .push_long(4 * i)
+            .add_long()
+        )
+        store_32(context, instructions)
+    return (
+        instructions
+        .push_long(0)
+        .return_long()
+    )
+
+
+def sendfile_method_instructions(context: GenerateContext) -> Instructions:
+    # `FileChannel.transferTo` copies in the kernel if the target is a file or a socket, the other targets (the
+    # standard streams, the pipes) are written through their stream
+    # Variables:
+    # 0: count
+    # 2: offset pointer (null to use and update the position of the input file)
+    # 4: input file descriptor
+    # 6: output file descriptor
+    # 8: input channel
+    # 9: target channel
+    # 10: position (long)
+    # 12: number of bytes transferred (long)
+    count = 0
+    offset = 2
+    in_fd = 4
+    out_fd = 6
+    input_ = 8
+    target = 9
+    position = 10
+    transferred = 12
+
+    writable_class = context.cf.constants.create_class("java/nio/channels/WritableByteChannel")
+
+    instructions = Instructions(context)
+    if context.buffered_output:
+        # Keep the order of output written to stdout and other descriptors, like `write`
+        (
+            instructions
+            .load_long(out_fd)
+            .convert_long_to_integer()
+            .push_integer(1)
+            .branch_if_integer_equal("transfer")
+        )
+        flush_stdout(context, instructions)
+        instructions.label("transfer")
+    (
+        instructions
+        .load_long(in_fd)
+        .convert_long_to_integer()
+        .invoke_static(context.fd_entry_method)
+        .branch_if_reference_is_null("ebadf")
+        # Only the files can be mapped, and so sent
+        .load_long(in_fd)
+        .convert_long_to_integer()
+        .invoke_static(context.file_channel_method)
+        .store_reference(input_)
+        .load_reference(input_)
+        .branch_if_reference_is_null("einval")
+        .load_long(out_fd)
+        .convert_long_to_integer()
+        .invoke_static(context.fd_entry_method)
+        .store_reference(target)
+        .load_reference(target)
+        .branch_if_reference_is_null("ebadf")
+        .load_reference(target)
+        .instance_of(writable_class)
+        .branch_if_false("stream")
+        .load_reference(target)
+        .check_cast(writable_class)
+        .store_reference(target)
+        .branch("position")
+        .label("stream")
+        .load_long(out_fd)
+        .convert_long_to_integer()
+        .invoke_static(context.output_stream_method)
+        .invoke_static(context.cf.constants.create_method_ref(
+            "java/nio/channels/Channels", "newChannel",
+            "(Ljava/io/OutputStream;)Ljava/nio/channels/WritableByteChannel;"))
+        .store_reference(target)
+
+        .label("position")
+        .load_long(out_fd)
+        .convert_long_to_integer()
+        .invoke_static(context.seek_append_method)
+        # A NULL offset pointer uses and advances the file position, the memory of the program starts above it
+        .load_long(offset)
+        .push_long(0)
+        .compare_long()
+        .branch_if_equal("file_position")
+        .load_long(offset)
+        .invoke_static(context.load_64_method)
+        .store_long(position)
+        .branch("transfer_to")
+        .label("file_position")
+        .load_reference(input_)
+        .invoke_virtual(context.cf.constants.create_method_ref(FILE_CHANNEL_CLASS, "position", "()J"))
+        .store_long(position)
+
+        .label("transfer_to")
+        .load_reference(input_)
+        .load_long(position)
+        .load_long(count)
+        .load_reference(target)
+        .invoke_virtual(context.cf.constants.create_method_ref(FILE_CHANNEL_CLASS, "transferTo",
+                                                               "(JJLjava/nio/channels/WritableByteChannel;)J"))
+        .store_long(transferred)
+        .load_long(position)
+        .load_long(transferred)
+        .add_long()
+        .store_long(position)
+        .load_long(offset)
+        .push_long(0)
+        .compare_long()
+        .branch_if_equal("update_file_position")
+        .load_long(position)
+        .load_long(offset)
+    )
+    store_64(context, instructions)
+    return (
+        instructions
+        .branch("return")
+        .label("update_file_position")
+        .load_reference(input_)
+        .load_long(position)
+        .invoke_virtual(context.cf.constants.create_method_ref(FILE_CHANNEL_CLASS, "position",
+                                                               f"(J)L{FILE_CHANNEL_CLASS};"))
+        .pop()
+        .label("return")
+        .load_long(transferred)
+        .return_long()
+
+        .label("ebadf")
+        .push_long(-EBADF)
+        .return_long()
+        .label("einval")
+        .push_long(-EINVAL)
+        .return_long()
+    )
@@ -0,0 +1,98 @@
+"""
+Syscalls of the native backend, passed to the kernel through the `syscall` function of the C library.
+"""
+from jvm.context import GenerateContext
+from jvm.instructions import Instructions
+from jvm.intrinsics.native import SEGMENT_CLASS, downcall_handle, segment_method_ref, value_layout_ref, OPTION_CLASS
+from jvm.syscalls import SysCalls
+from jvm.syscalls.streams import flush_stdout
+
+MAX_SYSCALL_ARGUMENTS = 6
+# `syscall(number, ...)` with the capture segment of `errno` in front, the unused arguments are passed as 0
+SYSCALL_DESCRIPTOR = f"(L{SEGMENT_CLASS};{'J' * (MAX_SYSCALL_ARGUMENTS + 1)})J"
+
+
+def link_syscall(context: GenerateContext, instructions: Instructions):
+    """
+    Initializes the handle of `syscall` and the segment that receives the `errno` of the calls.
+    A single handle serves every arity: the kernel ignores the arguments that a syscall does not take.
+    """
+    downcall_handle(context, instructions, "syscall", "(" + "J" * (MAX_SYSCALL_ARGUMENTS + 1) + ")J",
+                    first_variadic_arg=1, capture_errno=True)
+    (
+        instructions
+        .put_static_field(context.syscall_handle_ref)
+        .invoke_static(context.cf.constants.create_interface_method_ref("java/lang/foreign/Arena", "global",
+                                                                        "()Ljava/lang/foreign/Arena;"))
+        .invoke_static(context.cf.constants.create_interface_method_ref(OPTION_CLASS, "captureStateLayout",
+                                                                        "()Ljava/lang/foreign/StructLayout;"))
+        .invoke_interface(context.cf.constants.create_interface_method_ref(
+            "java/lang/foreign/Arena", "allocate", f"(Ljava/lang/foreign/MemoryLayout;)L{SEGMENT_CLASS};"))
+        .put_static_field(context.call_state_ref)
+    )
+
+
+def native_syscall_method_instructions(context: GenerateContext, arity: int) -> Instructions:
+    """
+    Body of `syscall<arity>`, returns the result of the syscall or the negated `errno` like the raw syscall does.
+    """
+    # Variables:
+    # 0 .. 2 * arity - 2: arguments, the last one first (long)
+    # 2 * arity: syscall number (long)
+    # 2 * arity + 2: result (long)
+    number = 2 * arity
+    result = number + 2
+
+    instructions = Instructions(context)
+    # The output that is still buffered has been written before the syscall
+    flush_stdout(context, instructions)
+    if arity == 1:
+        # `exit` only ends the calling thread, the JVM would keep running
+        (
+            instructions
+            .load_long(number)
+            .push_long(int(SysCalls.EXIT))
+            .compare_long()
+            .branch_if_equal("exit")
+            .load_long(number)
+            .push_long(int(SysCalls.EXIT_GROUP))
+            .compare_long()
+            .branch_if_not_equal("syscall")
+            .label("exit")
+            .load_long(0)
+            .convert_long_to_integer()
+            .invoke_static(context.cf.constants.create_method_ref("java/lang/System", "exit", "(I)V"))
+            .label("syscall")
+        )
+
+    (
+        instructions
+        .get_static_field(context.syscall_handle_ref)
+        .get_static_field(context.call_state_ref)
+        .load_long(number)
+    )
+    for argument in range(arity):
+        instructions.load_long(2 * (arity - 1 - argument))
+    for _ in range(arity, MAX_SYSCALL_ARGUMENTS):
+        instructions.push_long(0)
+    return (
+        instructions
+        .invoke_virtual(context.cf.constants.create_method_ref("java/lang/invoke/MethodHandle", "invokeExact",
+                                                               SYSCALL_DESCRIPTOR))
+        .store_long(result)
+        .load_long(result)
+        .push_long(-1)
+        .compare_long()
+        .branch_if_not_equal("return")
+        # Linux: `errno` is the only member of the capture state
+        .get_static_field(context.call_state_ref)
+        .get_static_field(value_layout_ref(context, "I"))
+        .push_long(0)
+        .invoke_interface(segment_method_ref(context, "get", "(Ljava/lang/foreign/ValueLayout$OfInt;J)I"))
+        .negate_integer()
+        .convert_integer_to_long()
+        .store_long(result)
+        .label("return")
+        .load_long(result)
+        .return_long()
+    )
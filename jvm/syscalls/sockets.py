@@ -0,0 +1,795 @@
+"""
+Sockets of the program, emulated with the channels of `java.nio`.
+
+Only the TCP sockets of IPv4 (AF_INET, SOCK_STREAM) are supported. They share the `channels` table with the opened
+files: `socket` stores an unconnected `SocketChannel`, which `bind` replaces with a `ServerSocketChannel` that listens
+right away, so `listen` has nothing left to do. The channels are in blocking mode, except during `poll`.
+Java reports the failures of the network (an address in use, a refused connection...) with exceptions, which end the
+program.
+"""
+from jvm.context import GenerateContext
+from jvm.instructions import Instructions
+from jvm.intrinsics import OperandType
+from jvm.intrinsics.memory import push_memory_buffer
+from jvm.intrinsics.store import store_8, store_16, store_32
+from jvm.syscalls.files import EBADF, EINVAL, store_64
+
+SOCKET_CHANNEL_CLASS = "java/nio/channels/SocketChannel"
+SERVER_SOCKET_CHANNEL_CLASS = "java/nio/channels/ServerSocketChannel"
+SELECTABLE_CHANNEL_CLASS = "java/nio/channels/SelectableChannel"
+SELECTOR_CLASS = "java/nio/channels/Selector"
+SELECTION_KEY_CLASS = "java/nio/channels/SelectionKey"
+READABLE_CHANNEL_CLASS = "java/nio/channels/ReadableByteChannel"
+WRITABLE_CHANNEL_CLASS = "java/nio/channels/WritableByteChannel"
+NETWORK_CHANNEL_CLASS = "java/nio/channels/NetworkChannel"
+SOCKET_ADDRESS_CLASS = "java/net/InetSocketAddress"
+
+AF_INET = 2
+SOCK_STREAM = 1
+# The flags of the type (SOCK_NONBLOCK, SOCK_CLOEXEC) are ignored
+SOCK_TYPE_MASK = 0xf
+SHUT_RD = 0
+SHUT_WR = 1
+SHUT_RDWR = 2
+
+# struct sockaddr_in: family (16 bits), port (16 bits, big-endian), address (32 bits, big-endian), padding
+SOCKADDR_IN_SIZE = 16
+SOCKADDR_PORT_OFFSET = 2
+SOCKADDR_ADDRESS_OFFSET = 4
+SOCKADDR_PADDING_OFFSET = 8
+
+# struct pollfd: fd (32 bits), events (16 bits), revents (16 bits)
+POLLFD_SIZE = 8
+POLLFD_EVENTS_OFFSET = 4
+POLLFD_REVENTS_OFFSET = 6
+POLLIN = 0x1
+POLLOUT = 0x4
+POLLNVAL = 0x20
+
+OP_READ = 1
+OP_WRITE = 4
+OP_ACCEPT = 16
+
+ENOTSOCK = 88
+EPROTONOSUPPORT = 93
+EAFNOSUPPORT = 97
+ENOTCONN = 107
+
+
+def load_channel(context: GenerateContext, instructions: Instructions, fd: int, channel: int, channel_class: str,
+                 label: str):
+    # Stores the channel of the file descriptor (long variable) in the variable. Branches to "ebadf" if the file
+    # descriptor is not open, to "enotsock" if it is not a socket (see `socket_errors`) and to the label if the socket
+    # is not an instance of the class.
+    class_ = context.cf.constants.create_class(channel_class)
+    (
+        instructions
+        .load_long(fd)
+        .convert_long_to_integer()
+        .invoke_static(context.fd_entry_method)
+        .branch_if_reference_is_null("ebadf")
+        .load_long(fd)
+        .convert_long_to_integer()
+        .invoke_static(context.channel_method)
+        .store_reference(channel)
+        .load_reference(channel)
+        .instance_of(context.cf.constants.create_class(NETWORK_CHANNEL_CLASS))
+        .branch_if_false("enotsock")
+        .load_reference(channel)
+        .instance_of(class_)
+        .branch_if_false(label)
+        .load_reference(channel)
+        .check_cast(class_)
+        .store_reference(channel)
+    )
+
+
+def socket_errors(instructions: Instructions) -> Instructions:
+    # The returns of the labels of `load_channel`
+    return (
+        instructions
+        .label("ebadf")
+        .push_long(-EBADF)
+        .return_long()
+        .label("enotsock")
+        .push_long(-ENOTSOCK)
+        .return_long()
+    )
+
+
+def add_fd(context: GenerateContext, instructions: Instructions, channel: int, fd: int):
+    # Stores the channel (reference variable) at a new file descriptor (int variable)
+    (
+        instructions
+        .invoke_static(context.allocate_fd_method)
+        .store_integer(fd)
+        .get_static_field(context.channels_ref)
+        .load_integer(fd)
+        .load_reference(channel)
+        .store_array_reference()
+    )
+
+
+def socket_address_method_instructions(context: GenerateContext) -> Instructions:
+    # Returns the address of a struct sockaddr_in
+    # Variables:
+    # 0: sockaddr pointer
+    # 2: address bytes
+    sockaddr = 0
+    address = 2
+
+    instructions = (
+        Instructions(context)
+        .push_integer(4)
+        .new_array(OperandType.Byte.array_type)
+        .store_reference(address)
+    )
+    for i in range(4):
+        (
+            instructions
+            .load_reference(address)
+            .push_integer(i)
+            .load_long(sockaddr)
+            .push_long(SOCKADDR_ADDRESS_OFFSET + i)
+            .add_long()
+            .invoke_static(context.load_8_method)
+            .convert_long_to_integer()
+            .convert_integer_to_byte()
+            .store_array_byte()
+        )
+    return (
+        instructions
+        .new(context.cf.constants.create_class(SOCKET_ADDRESS_CLASS))
+        .duplicate_top_of_stack()
+        .load_reference(address)
+        .invoke_static(context.cf.constants.create_method_ref("java/net/InetAddress", "getByAddress",
+                                                              "([B)Ljava/net/InetAddress;"))
+        .load_long(sockaddr)
+        .push_long(SOCKADDR_PORT_OFFSET)
+        .add_long()
+        .invoke_static(context.load_8_method)
+        # The bytes of the memory are loaded with their sign
+        .push_long(0xff)
+        .and_long()
+        .push_integer(8)
+        .shift_left_long()
+        .load_long(sockaddr)
+        .push_long(SOCKADDR_PORT_OFFSET + 1)
+        .add_long()
+        .invoke_static(context.load_8_method)
+        .push_long(0xff)
+        .and_long()
+        .or_long()
+        .convert_long_to_integer()
+        # Stack: socket address, socket address, address, port
+        .invoke_special(context.cf.constants.create_method_ref(SOCKET_ADDRESS_CLASS, "<init>",
+                                                               "(Ljava/net/InetAddress;I)V"))
+        .return_reference()
+    )
+
+
+def socket_method_instructions(context: GenerateContext) -> Instructions:
+    # Variables:
+    # 0: protocol (ignored, TCP is the only protocol of the stream sockets)
+    # 2: type
+    # 4: domain
+    # 6: channel
+    # 7: file descriptor (as int)
+    type_ = 2
+    domain = 4
+    channel = 6
+    fd = 7
+
+    instructions = (
+        Instructions(context)
+        .load_long(domain)
+        .push_long(AF_INET)
+        .compare_long()
+        .branch_if_not_equal("eafnosupport")
+        .load_long(type_)
+        .push_long(SOCK_TYPE_MASK)
+        .and_long()
+        .push_long(SOCK_STREAM)
+        .compare_long()
+        .branch_if_not_equal("eprotonosupport")
+        .invoke_static(context.cf.constants.create_method_ref(SOCKET_CHANNEL_CLASS, "open",
+                                                              f"()L{SOCKET_CHANNEL_CLASS};"))
+        .store_reference(channel)
+    )
+    add_fd(context, instructions, channel, fd)
+    return (
+        instructions
+        .load_integer(fd)
+        .convert_integer_to_long()
+        .return_long()
+
+        .label("eafnosupport")
+        .push_long(-EAFNOSUPPORT)
+        .return_long()
+        .label("eprotonosupport")
+        .push_long(-EPROTONOSUPPORT)
+        .return_long()
+    )
+
+
+def bind_method_instructions(context: GenerateContext) -> Instructions:
+    # Variables:
+    # 0: addrlen (ignored)
+    # 2: addr pointer
+    # 4: file descriptor
+    # 6: channel
+    addr = 2
+    fd = 4
+    channel = 6
+
+    instructions = Instructions(context)
+    # Only a socket that is neither bound nor connected can be bound
+    load_channel(context, instructions, fd, channel, SOCKET_CHANNEL_CLASS, "einval")
+    return socket_errors(
+        instructions
+        .load_reference(channel)
+        .invoke_virtual(context.cf.constants.create_method_ref(SOCKET_CHANNEL_CLASS, "isConnected", "()Z"))
+        .branch_if_true("einval")
+        .load_reference(channel)
+        .invoke_virtual(context.cf.constants.create_method_ref(SOCKET_CHANNEL_CLASS, "close", "()V"))
+        .get_static_field(context.channels_ref)
+        .load_long(fd)
+        .convert_long_to_integer()
+        # SO_REUSEADDR is set on the server sockets by Java
+        .invoke_static(context.cf.constants.create_method_ref(SERVER_SOCKET_CHANNEL_CLASS, "open",
+                                                              f"()L{SERVER_SOCKET_CHANNEL_CLASS};"))
+        .load_long(addr)
+        .invoke_static(context.socket_address_method)
+        .invoke_virtual(context.cf.constants.create_method_ref(
+            SERVER_SOCKET_CHANNEL_CLASS, "bind", f"(Ljava/net/SocketAddress;)L{SERVER_SOCKET_CHANNEL_CLASS};"))
+        .store_array_reference()
+        .push_long(0)
+        .return_long()
+
+        .label("einval")
+        .push_long(-EINVAL)
+        .return_long()
+    )
+
+
+def listen_method_instructions(context: GenerateContext) -> Instructions:
+    # The socket already listens since `bind`, with the default backlog
+    # Variables:
+    # 0: backlog (ignored)
+    # 2: file descriptor
+    # 4: channel
+    fd = 2
+    channel = 4
+
+    instructions = Instructions(context)
+    load_channel(context, instructions, fd, channel, SERVER_SOCKET_CHANNEL_CLASS, "einval")
+    return socket_errors(
+        instructions
+        .push_long(0)
+        .return_long()
+
+        .label("einval")
+        .push_long(-EINVAL)
+        .return_long()
+    )
+
+
+def accept_method_instructions(context: GenerateContext) -> Instructions:
+    # Variables:
+    # 0: addrlen pointer
+    # 2: addr pointer
+    # 4: file descriptor
+    # 6: server channel
+    # 7: accepted channel
+    # 8: file descriptor of the accepted channel (as int)
+    # 9: peer address
+    # 10: peer address bytes
+    addrlen = 0
+    addr = 2
+    fd = 4
+    server = 6
+    channel = 7
+    accepted_fd = 8
+    peer = 9
+    address = 10
+
+    def store_field(offset: int, store_value):
+        # Stack: value (as long)
+        instructions.load_long(addr)
+        instructions.push_long(offset)
+        instructions.add_long()
+        store_value(context, instructions)
+
+    instructions = Instructions(context)
+    load_channel(context, instructions, fd, server, SERVER_SOCKET_CHANNEL_CLASS, "einval")
+    (
+        instructions
+        .load_reference(server)
+        .invoke_virtual(context.cf.constants.create_method_ref(SERVER_SOCKET_CHANNEL_CLASS, "accept",
+                                                               f"()L{SOCKET_CHANNEL_CLASS};"))
+        .store_reference(channel)
+    )
+    add_fd(context, instructions, channel, accepted_fd)
+    (
+        instructions
+        .load_long(addr)
+        .push_long(0)
+        .compare_long()
+        .branch_if_equal("return")
+        .load_reference(channel)
+        .invoke_virtual(context.cf.constants.create_method_ref(SOCKET_CHANNEL_CLASS, "getRemoteAddress",
+                                                               "()Ljava/net/SocketAddress;"))
+        .check_cast(context.cf.constants.create_class(SOCKET_ADDRESS_CLASS))
+        .store_reference(peer)
+        .load_reference(peer)
+        .invoke_virtual(context.cf.constants.create_method_ref(SOCKET_ADDRESS_CLASS, "getAddress",
+                                                               "()Ljava/net/InetAddress;"))
+        .invoke_virtual(context.cf.constants.create_method_ref("java/net/InetAddress", "getAddress", "()[B"))
+        .store_reference(address)
+        .push_long(AF_INET)
+    )
+    store_field(0, store_16)
+    (
+        instructions
+        .load_reference(peer)
+        .invoke_virtual(context.cf.constants.create_method_ref(SOCKET_ADDRESS_CLASS, "getPort", "()I"))
+        .push_integer(8)
+        .shift_right_integer()
+        .convert_integer_to_long()
+    )
+    store_field(SOCKADDR_PORT_OFFSET, store_8)
+    (
+        instructions
+        .load_reference(peer)
+        .invoke_virtual(context.cf.constants.create_method_ref(SOCKET_ADDRESS_CLASS, "getPort", "()I"))
+        .convert_integer_to_long()
+    )
+    store_field(SOCKADDR_PORT_OFFSET + 1, store_8)
+    for i in range(4):
+        (
+            instructions
+            .load_reference(address)
+            .push_integer(i)
+            .load_array_byte()
+            .convert_integer_to_long()
+        )
+        store_field(SOCKADDR_ADDRESS_OFFSET + i, store_8)
+    instructions.push_long(0)
+    store_field(SOCKADDR_PADDING_OFFSET, store_64)
+    (
+        instructions
+        .load_long(addrlen)
+        .push_long(0)
+        .compare_long()
+        .branch_if_equal("return")
+        .push_long(SOCKADDR_IN_SIZE)
+        .load_long(addrlen)
+    )
+    store_32(context, instructions)
+    return socket_errors(
+        instructions
+        .label("return")
+        .load_integer(accepted_fd)
+        .convert_integer_to_long()
+        .return_long()
+
+        .label("einval")
+        .push_long(-EINVAL)
+        .return_long()
+    )
+
+
+def connect_method_instructions(context: GenerateContext) -> Instructions:
+    # Variables:
+    # 0: addrlen (ignored)
+    # 2: addr pointer
+    # 4: file descriptor
+    # 6: channel
+    addr = 2
+    fd = 4
+    channel = 6
+
+    instructions = Instructions(context)
+    load_channel(context, instructions, fd, channel, SOCKET_CHANNEL_CLASS, "einval")
+    return socket_errors(
+        instructions
+        .load_reference(channel)
+        .load_long(addr)
+        .invoke_static(context.socket_address_method)
+        .invoke_virtual(context.cf.constants.create_method_ref(SOCKET_CHANNEL_CLASS, "connect",
+                                                               "(Ljava/net/SocketAddress;)Z"))
+        .pop()
+        .push_long(0)
+        .return_long()
+
+        .label("einval")
+        .push_long(-EINVAL)
+        .return_long()
+    )
+
+
+def shutdown_method_instructions(context: GenerateContext) -> Instructions:
+    # Variables:
+    # 0: how
+    # 2: file descriptor
+    # 4: channel
+    how = 0
+    fd = 2
+    channel = 4
+
+    def shutdown(method: str):
+        (
+            instructions
+            .load_reference(channel)
+            .invoke_virtual(context.cf.constants.create_method_ref(SOCKET_CHANNEL_CLASS, method,
+                                                                   f"()L{SOCKET_CHANNEL_CLASS};"))
+            .pop()
+        )
+
+    instructions = Instructions(context)
+    load_channel(context, instructions, fd, channel, SOCKET_CHANNEL_CLASS, "enotconn")
+    (
+        instructions
+        .load_long(how)
+        .convert_long_to_integer()
+        .lookup_switch("einval", {SHUT_RD: "rd", SHUT_WR: "wr", SHUT_RDWR: "rdwr"})
+        .label("rdwr")
+    )
+    shutdown("shutdownInput")
+    instructions.label("wr")
+    shutdown("shutdownOutput")
+    instructions.branch("return")
+    instructions.label("rd")
+    shutdown("shutdownInput")
+    return socket_errors(
+        instructions
+        .label("return")
+        .push_long(0)
+        .return_long()
+
+        .label("enotconn")
+        .push_long(-ENOTCONN)
+        .return_long()
+        .label("einval")
+        .push_long(-EINVAL)
+        .return_long()
+    )
+
+
+def setsockopt_method_instructions(context: GenerateContext) -> Instructions:
+    # The options are accepted and ignored, SO_REUSEADDR is already set on the server sockets
+    # Variables:
+    # 0: optlen (ignored)
+    # 2: optval (ignored)
+    # 4: optname (ignored)
+    # 6: level (ignored)
+    # 8: file descriptor
+    # 10: channel
+    fd = 8
+    channel = 10
+
+    instructions = Instructions(context)
+    # Any socket, bound or not
+    load_channel(context, instructions, fd, channel, NETWORK_CHANNEL_CLASS, "enotsock")
+    return socket_errors(
+        instructions
+        .push_long(0)
+        .return_long()
+    )
+
+
+def transfer_method_instructions(context: GenerateContext, channel_class: str, method: str) -> Instructions:
+    # Body of `sendto` and `recvfrom` (the method is `write` or `read` of the channel class). The sockets are
+    # connected, the address is ignored by `sendto` and not filled by `recvfrom`.
+    # Variables:
+    # 0: addrlen (ignored)
+    # 2: addr (ignored)
+    # 4: flags (ignored)
+    # 6: length
+    # 8: buffer pointer
+    # 10: file descriptor
+    # 12: channel
+    length = 6
+    buffer = 8
+    fd = 10
+    channel = 12
+
+    instructions = Instructions(context)
+    # A listening socket is not connected
+    load_channel(context, instructions, fd, channel, channel_class, "enotconn")
+    instructions.load_reference(channel)
+    push_memory_buffer(context, instructions, lambda: instructions.load_long(buffer),
+                       lambda: instructions.load_long(length))
+    return socket_errors(
+        instructions
+        .invoke_interface(context.cf.constants.create_interface_method_ref(channel_class, method,
+                                                                           "(Ljava/nio/ByteBuffer;)I"))
+        # -1 at the end of the stream
+        .push_integer(0)
+        .invoke_static(context.cf.constants.create_method_ref("java/lang/Math", "max", "(II)I"))
+        .convert_integer_to_long()
+        .return_long()
+
+        .label("enotconn")
+        .push_long(-ENOTCONN)
+        .return_long()
+    )
+
+
+def poll_method_instructions(context: GenerateContext) -> Instructions:
+    # The sockets are registered with the selector of the runtime for the time of the call. The standard streams
+    # and the files are always ready.
+    # Variables:
+    # 0: timeout (milliseconds, negative to wait forever)
+    # 2: nfds
+    # 4: fds pointer
+    # 6: selector
+    # 7: index (int)
+    # 8: pollfd pointer (long)
+    # 10: file descriptor (as int)
+    # 11: channel
+    # 12: events, then revents (int)
+    # 13: interest set, then ready set (int)
+    # 14: number of ready file descriptors (int)
+    # 15: selection key
+    timeout = 0
+    nfds = 2
+    fds = 4
+    selector = 6
+    index = 7
+    pollfd = 8
+    fd = 10
+    channel = 11
+    events = 12
+    operations = 13
+    ready = 14
+    key = 15
+
+    selectable_class = context.cf.constants.create_class(SELECTABLE_CHANNEL_CLASS)
+
+    def selector_method(method: str, descriptor: str):
+        return context.cf.constants.create_method_ref(SELECTOR_CLASS, method, descriptor)
+
+    def selectable_method(method: str, descriptor: str):
+        return context.cf.constants.create_method_ref(SELECTABLE_CHANNEL_CLASS, method, descriptor)
+
+    def key_method(method: str, descriptor: str):
+        return context.cf.constants.create_method_ref(SELECTION_KEY_CLASS, method, descriptor)
+
+    def for_each_pollfd(name: str, body):
+        # The body ends with a branch to `<name>_next`
+        (
+            instructions
+            .push_integer(0)
+            .store_integer(index)
+            .label(f"{name}_loop")
+            .load_integer(index)
+            .convert_integer_to_long()
+            .load_long(nfds)
+            .compare_long()
+            .branch_if_greater_or_equal(f"{name}_end")
+            .load_long(fds)
+            .load_integer(index)
+            .convert_integer_to_long()
+            .push_long(POLLFD_SIZE)
+            .multiply_long()
+            .add_long()
+            .store_long(pollfd)
+            .load_long(pollfd)
+            .invoke_static(context.load_32_method)
+            .convert_long_to_integer()
+            .store_integer(fd)
+            .load_integer(fd)
+            .invoke_static(context.channel_method)
+            .store_reference(channel)
+        )
+        body()
+        (
+            instructions
+            .label(f"{name}_next")
+            .increment_integer(index, 1)
+            .branch(f"{name}_loop")
+            .label(f"{name}_end")
+        )
+
+    def branch_if_not_selectable(label: str):
+        (
+            instructions
+            .load_reference(channel)
+            .instance_of(selectable_class)
+            .branch_if_false(label)
+            .load_reference(channel)
+            .check_cast(selectable_class)
+            .store_reference(channel)
+        )
+
+    def store_revents():
+        # Stack: revents (as long)
+        instructions.load_long(pollfd)
+        instructions.push_long(POLLFD_REVENTS_OFFSET)
+        instructions.add_long()
+        store_16(context, instructions)
+
+    def add_if_flag(flags: int, flag: int, value: int, target: int, label: str):
+        # target |= value if the flag is set in the flags (int variables)
+        (
+            instructions
+            .load_integer(flags)
+            .push_integer(flag)
+            .and_integer()
+            .branch_if_false(label)
+            .load_integer(target)
+            .push_integer(value)
+            .or_integer()
+            .store_integer(target)
+            .label(label)
+        )
+
+    def register():
+        (
+            instructions
+            .load_long(pollfd)
+            .push_long(POLLFD_EVENTS_OFFSET)
+            .add_long()
+            .invoke_static(context.load_16_method)
+            .convert_long_to_integer()
+            .store_integer(events)
+            .push_long(0)
+        )
+        store_revents()
+        branch_if_not_selectable("register_other")
+        instructions.push_integer(0)
+        instructions.store_integer(operations)
+        add_if_flag(events, POLLIN, OP_READ | OP_ACCEPT, operations, "register_in")
+        add_if_flag(events, POLLOUT, OP_WRITE, operations, "register_out")
+        (
+            instructions
+            .load_reference(channel)
+            .push_integer(0)
+            .invoke_virtual(selectable_method("configureBlocking", f"(Z)L{SELECTABLE_CHANNEL_CLASS};"))
+            .pop()
+            .load_reference(channel)
+            .load_reference(selector)
+            .load_integer(operations)
+            .load_reference(channel)
+            .invoke_virtual(selectable_method("validOps", "()I"))
+            .and_integer()
+            .invoke_virtual(selectable_method("register", f"(L{SELECTOR_CLASS};I)L{SELECTION_KEY_CLASS};"))
+            .pop()
+            .branch("register_next")
+
+            .label("register_other")
+            # Negative file descriptors are ignored
+            .load_integer(fd)
+            .branch_if_less("register_next")
+            .load_reference(channel)
+            .branch_if_reference_is_not_null("register_ready")
+            .load_integer(fd)
+            .get_static_field(context.fd_ref)
+            .array_length()
+            .branch_if_integer_greater_or_equal("register_invalid")
+            .get_static_field(context.fd_ref)
+            .load_integer(fd)
+            .load_array_reference()
+            .branch_if_reference_is_null("register_invalid")
+            .label("register_ready")
+            .load_integer(events)
+            .push_integer(POLLIN | POLLOUT)
+            .and_integer()
+            .store_integer(events)
+            .load_integer(events)
+            .branch_if_false("register_next")
+            .load_integer(events)
+            .convert_integer_to_long()
+        )
+        store_revents()
+        (
+            instructions
+            .increment_integer(ready, 1)
+            .branch("register_next")
+            .label("register_invalid")
+            .push_long(POLLNVAL)
+        )
+        store_revents()
+        instructions.increment_integer(ready, 1)
+
+    def collect():
+        branch_if_not_selectable("collect_next")
+        (
+            instructions
+            .load_reference(channel)
+            .load_reference(selector)
+            .invoke_virtual(selectable_method("keyFor", f"(L{SELECTOR_CLASS};)L{SELECTION_KEY_CLASS};"))
+            .store_reference(key)
+            # A channel listed twice is only collected once
+            .load_reference(key)
+            .invoke_virtual(key_method("isValid", "()Z"))
+            .branch_if_false("collect_next")
+            .load_reference(key)
+            .invoke_virtual(key_method("readyOps", "()I"))
+            .store_integer(operations)
+            # The channel is deregistered by the next selection
+            .load_reference(key)
+            .invoke_virtual(key_method("cancel", "()V"))
+            .push_integer(0)
+            .store_integer(events)
+        )
+        add_if_flag(operations, OP_READ | OP_ACCEPT, POLLIN, events, "collect_in")
+        add_if_flag(operations, OP_WRITE, POLLOUT, events, "collect_out")
+        (
+            instructions
+            .load_integer(events)
+            .branch_if_false("collect_next")
+            .load_integer(events)
+            .convert_integer_to_long()
+        )
+        store_revents()
+        instructions.increment_integer(ready, 1)
+
+    def restore():
+        branch_if_not_selectable("restore_next")
+        (
+            instructions
+            .load_reference(channel)
+            .push_integer(1)
+            .invoke_virtual(selectable_method("configureBlocking", f"(Z)L{SELECTABLE_CHANNEL_CLASS};"))
+            .pop()
+        )
+
+    instructions = (
+        Instructions(context)
+        .get_static_field(context.selector_ref)
+        .branch_if_reference_is_not_null("selector")
+        .invoke_static(selector_method("open", f"()L{SELECTOR_CLASS};"))
+        .put_static_field(context.selector_ref)
+        .label("selector")
+        .get_static_field(context.selector_ref)
+        .store_reference(selector)
+        .push_integer(0)
+        .store_integer(ready)
+    )
+    for_each_pollfd("register", register)
+    (
+        instructions
+        # Only wait if nothing is ready yet
+        .load_integer(ready)
+        .branch_if_true("select_now")
+        .load_long(timeout)
+        .push_long(0)
+        .compare_long()
+        .branch_if_equal("select_now")
+        .load_long(timeout)
+        .push_long(0)
+        .compare_long()
+        .branch_if_less("select")
+        .load_reference(selector)
+        .load_long(timeout)
+        .invoke_virtual(selector_method("select", "(J)I"))
+        .pop()
+        .branch("selected")
+        .label("select")
+        .load_reference(selector)
+        .invoke_virtual(selector_method("select", "()I"))
+        .pop()
+        .branch("selected")
+        .label("select_now")
+        .load_reference(selector)
+        .invoke_virtual(selector_method("selectNow", "()I"))
+        .pop()
+        .label("selected")
+    )
+    for_each_pollfd("collect", collect)
+    (
+        instructions
+        # The canceled keys are removed, the channels can be switched back to blocking mode
+        .load_reference(selector)
+        .invoke_virtual(selector_method("selectNow", "()I"))
+        .pop()
+    )
+    for_each_pollfd("restore", restore)
+    return (
+        instructions
+        .load_integer(ready)
+        .convert_integer_to_long()
+        .return_long()
+    )
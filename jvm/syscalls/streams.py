@@ -0,0 +1,161 @@
+from jvm.context import GenerateContext, MemoryBackend
+from jvm.instructions import Instructions
+
+STDOUT_BUFFER_SIZE = 64 * 1024
+
+
+def input_stream_method_instructions(context: GenerateContext) -> Instructions:
+    # Variables:
+    # 0: file descriptor (as int)
+    # 1: stream
+    stream = 1
+
+    instructions = (
+        Instructions(context)
+        .get_static_field(context.input_streams_ref)
+        .load_integer(0)
+        .load_array_reference()
+        # Stack: cached stream
+        .store_reference(stream)
+        .load_reference(stream)
+        .branch_if_reference_is_not_null("return")
+    )
+    open_channel_stream(context, instructions, "newInputStream", "java/nio/channels/ReadableByteChannel",
+                        "java/io/InputStream")
+    return (
+        instructions
+        .new(context.cf.constants.create_class("java/io/FileInputStream"))
+        .duplicate_top_of_stack()
+        .get_static_field(context.fd_ref)
+        .load_integer(0)
+        .load_array_reference()
+        # Stack: stream, stream, file descriptor
+        .invoke_special(context.cf.constants.create_method_ref("java/io/FileInputStream",
+                                                               "<init>",
+                                                               "(Ljava/io/FileDescriptor;)V"))
+        .store_reference(stream)
+        .label("cache")
+        .get_static_field(context.input_streams_ref)
+        .load_integer(0)
+        .load_reference(stream)
+        .store_array_reference()
+        .label("return")
+        .load_reference(stream)
+        .return_reference()
+    )
+
+
+def output_stream_method_instructions(context: GenerateContext) -> Instructions:
+    # Variables:
+    # 0: file descriptor (as int)
+    # 1: stream
+    stream = 1
+
+    instructions = (
+        Instructions(context)
+        .get_static_field(context.output_streams_ref)
+        .load_integer(0)
+        .load_array_reference()
+        # Stack: cached stream
+        .store_reference(stream)
+        .load_reference(stream)
+        .branch_if_reference_is_not_null("return")
+    )
+    open_channel_stream(context, instructions, "newOutputStream", "java/nio/channels/WritableByteChannel",
+                        "java/io/OutputStream")
+    (
+        instructions
+        .new(context.cf.constants.create_class("java/io/FileOutputStream"))
+        .duplicate_top_of_stack()
+        .get_static_field(context.fd_ref)
+        .load_integer(0)
+        .load_array_reference()
+        # Stack: stream, stream, file descriptor
+        .invoke_special(context.cf.constants.create_method_ref("java/io/FileOutputStream",
+                                                               "<init>",
+                                                               "(Ljava/io/FileDescriptor;)V"))
+        .store_reference(stream)
+    )
+
+    if context.buffered_output:
+        (
+            instructions
+            .load_integer(0)
+            .push_integer(1)
+            .branch_if_integer_not_equal("cache")
+            .new(context.cf.constants.create_class("java/io/BufferedOutputStream"))
+            .duplicate_top_of_stack()
+            .load_reference(stream)
+            .push_integer(STDOUT_BUFFER_SIZE)
+            # Stack: buffered stream, buffered stream, stream, buffer size
+            .invoke_special(context.cf.constants.create_method_ref("java/io/BufferedOutputStream",
+                                                                   "<init>",
+                                                                   "(Ljava/io/OutputStream;I)V"))
+            .store_reference(stream)
+        )
+
+    return (
+        instructions
+        .label("cache")
+        .get_static_field(context.output_streams_ref)
+        .load_integer(0)
+        .load_reference(stream)
+        .store_array_reference()
+        .label("return")
+        .load_reference(stream)
+        .return_reference()
+    )
+
+
+def open_channel_stream(context: GenerateContext, instructions: Instructions, method: str, channel_class: str,
+                        stream_class: str):
+    # Variables:
+    # 0: file descriptor (as int)
+    # 1: stream
+    if context.memory_backend == MemoryBackend.NATIVE:
+        # Only the standard streams are used, the files are opened by the kernel
+        return
+    (
+        instructions
+        .get_static_field(context.fd_ref)
+        .load_integer(0)
+        .load_array_reference()
+        .branch_if_reference_is_not_null("descriptor")
+        # The file descriptor is a file or a socket opened by the program
+        .get_static_field(context.channels_ref)
+        .load_integer(0)
+        .load_array_reference()
+        .check_cast(context.cf.constants.create_class(channel_class))
+        .invoke_static(context.cf.constants.create_method_ref("java/nio/channels/Channels", method,
+                                                              f"(L{channel_class};)L{stream_class};"))
+        .store_reference(1)
+        .branch("cache")
+        .label("descriptor")
+    )
+
+
+def flush_stdout_method_instructions(context: GenerateContext) -> Instructions:
+    # Variables:
+    # 0: stdout stream
+    stream = 0
+
+    return (
+        Instructions(context)
+        .get_static_field(context.output_streams_ref)
+        .push_integer(1)
+        .load_array_reference()
+        # Stack: stdout stream
+        .store_reference(stream)
+        .load_reference(stream)
+        .branch_if_reference_is_null("return")
+        .load_reference(stream)
+        .invoke_virtual(context.cf.constants.create_method_ref("java/io/OutputStream", "flush", "()V"))
+        .label("return")
+        .return_void()
+    )
+
+
+def flush_stdout(context: GenerateContext, instructions: Instructions):
+    # Only buffered output has to be flushed, writes are unbuffered otherwise
+    if context.buffered_output:
+        instructions.invoke_static(context.flush_stdout_method)
@@ -1,38 +1,34 @@
 from jvm.context import GenerateContext
 from jvm.instructions import Instructions
-from jvm.syscalls import SysCalls
+from jvm.syscalls import SysCalls, SYSCALL_METHODS
+from jvm.syscalls.streams import flush_stdout
 
 
 def syscall1_method_instructions(context: GenerateContext):
-    return (
+    # Variables:
+    # 0: argument
+    # 2: syscall number
+    instructions = (
         Instructions(context)
         .load_long(2)
         .convert_long_to_integer()
         .lookup_switch("exit0", {
-            SysCalls.CLOSE: "close",
+            **{number: number.name.lower() for number in SYSCALL_METHODS[1]},
             SysCalls.EXIT: "exit"
         })
+    )
+    for number, method in SYSCALL_METHODS[1].items():
+        instructions.label(number.name.lower())
+        instructions.load_long(0)
+        instructions.invoke_static(getattr(context, method))
+        instructions.return_long()
+        instructions.end_branch()
 
-        .label("close")
-        .new(context.cf.constants.create_class("java/io/FileInputStream"))
-        .duplicate_top_of_stack()
-        .get_static_field(context.fd_ref)
-        .load_long(0)  # file descriptor
-        .convert_long_to_integer()
-        .load_array_reference()
-        .invoke_special(context.cf.constants.create_method_ref("java/io/FileInputStream", "<init>",
-                                                               "(Ljava/io/FileDescriptor;)V"))
-        .invoke_virtual(context.cf.constants.create_method_ref("java/io/FileInputStream", "close", "()V"))
-        .get_static_field(context.fd_ref)
-        .load_long(0)  # file descriptor
-        .convert_long_to_integer()
-        .push_null()
-        .store_array_reference()
+    instructions.label("exit")
+    flush_stdout(context, instructions)
 
-        .branch("exit0")
-        .end_branch()
-
-        .label("exit")
+    return (
+        instructions
         .load_long(0)
         .convert_long_to_integer()
         .invoke_static(context.cf.constants.create_method_ref("java/lang/System", "exit", "(I)V"))
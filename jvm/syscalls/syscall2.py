@@ -1,17 +1,29 @@
 from jvm.commons import LONG_SIZE
 from jvm.context import GenerateContext
 from jvm.instructions import Instructions
-from jvm.syscalls import SysCalls
+from jvm.syscalls import SysCalls, SYSCALL_METHODS
 
 
 def syscall2_method_instructions(context: GenerateContext) -> Instructions:
-    return (
+    instructions = (
         Instructions(context)
         .load_long(4)
         .convert_long_to_integer()
         .lookup_switch("exit0", {
+            **{number: number.name.lower() for number in SYSCALL_METHODS[2]},
             SysCalls.CLOCK_GETTIME: "clock_gettime"
         })
+    )
+    for number, method in SYSCALL_METHODS[2].items():
+        instructions.label(number.name.lower())
+        for argument in range(0, 4, 2):
+            instructions.load_long(argument)
+        instructions.invoke_static(getattr(context, method))
+        instructions.return_long()
+        instructions.end_branch()
+
+    return (
+        instructions
         .label("clock_gettime")
         .load_long(2)
         .convert_long_to_integer()
@@ -1,80 +1,36 @@
+from typing import Callable, Optional
+
 from jvm.commons import LONG_SIZE
 from jvm.context import GenerateContext
 from jvm.instructions import Instructions
-from jvm.syscalls import SysCalls
+from jvm.intrinsics import OperandType
+from jvm.intrinsics.memory import copy_to_memory, push_memory_buffer
+from jvm.intrinsics.native import segment_method_ref, value_layout_ref, SEGMENT_CLASS
+from jvm.syscalls import SysCalls, SYSCALL_METHODS
+from jvm.syscalls.files import EBADF
+from jvm.syscalls.streams import flush_stdout
 
 
 def syscall3_method_instructions(context: GenerateContext):
-    return (
+    instructions = (
         Instructions(context)
         .load_long(6)
         .convert_long_to_integer()
         .lookup_switch("exit0", {
-            SysCalls.READ: "read",
-            SysCalls.WRITE: "write",
+            **{number: number.name.lower() for number in SYSCALL_METHODS[3]},
             SysCalls.EXECVE: "execve",
         })
-        .label("read")
-        .load_long(4)
-        .convert_long_to_integer()
-        .get_static_field(context.fd_ref)
-        .swap()
-        .load_array_reference()
-        .new(context.cf.constants.create_class("java/io/FileInputStream"))
-        .duplicate_behind_top_of_stack()
-        .duplicate_behind_top_of_stack()
-        .pop()
-        .invoke_special(context.cf.constants.create_method_ref("java/io/FileInputStream",
-                                                               "<init>",
-                                                               "(Ljava/io/FileDescriptor;)V"))
-        .get_static_field(context.memory_ref)
-        .load_long(2)
-        .convert_long_to_integer()
-        .load_long(0)
-        .convert_long_to_integer()
-        .invoke_virtual(context.cf.constants.create_method_ref("java/io/FileInputStream",
-                                                               "read",
-                                                               "([BII)I"))
-        .duplicate_top_of_stack()
-        .push_integer(-1)
-        .branch_if_integer_not_equal("read_return_value")  # if read() != -1, goto read_return_value
-        .push_integer(0)
-        .swap()
-        .pop()
-        .label("read_return_value")
-        .convert_integer_to_long()
-        .return_long()
-        .end_branch()
-
-        .label("write")
-        .load_long(4)
-        .convert_long_to_integer()
-        .get_static_field(context.fd_ref)
-        .swap()
-        .load_array_reference()
-        .new(context.cf.constants.create_class("java/io/FileOutputStream"))
-        .duplicate_behind_top_of_stack()
-        .duplicate_behind_top_of_stack()
-        .pop()
-        .invoke_special(context.cf.constants.create_method_ref("java/io/FileOutputStream",
-                                                               "<init>",
-                                                               "(Ljava/io/FileDescriptor;)V"))
-        .duplicate_top_of_stack()
-        .get_static_field(context.memory_ref)
-        .load_long(2)
-        .convert_long_to_integer()
-        .load_long(0)
-        .convert_long_to_integer()
-        .invoke_virtual(context.cf.constants.create_method_ref("java/io/OutputStream",
-                                                               "write",
-                                                               "([BII)V"))
-        .invoke_virtual(context.cf.constants.create_method_ref("java/io/OutputStream",
-                                                               "flush",
-                                                               "()V"))
-        .load_long(0)
-        .return_long()
-        .end_branch()
+    )
+    for number, method in SYSCALL_METHODS[3].items():
+        instructions.label(number.name.lower())
+        for argument in range(0, 6, 2):
+            instructions.load_long(argument)
+        instructions.invoke_static(getattr(context, method))
+        instructions.return_long()
+        instructions.end_branch()
 
+    (
+        instructions
         .label("execve")
         .new(context.cf.constants.create_class("java/lang/ProcessBuilder"))
         # Stack: process builder
@@ -232,6 +188,13 @@ def syscall3_method_instructions(context: GenerateContext):
         # Stack: (empty)
 
         .duplicate_top_of_stack()
+    )
+
+    # The child process writes to the same stdout, so pending output has to be written first
+    flush_stdout(context, instructions)
+
+    return (
+        instructions
         .invoke_virtual(context.cf.constants.create_method_ref("java/lang/ProcessBuilder",
                                                                "inheritIO",
                                                                "()Ljava/lang/ProcessBuilder;"))
@@ -251,4 +214,238 @@ def syscall3_method_instructions(context: GenerateContext):
         .end_branch()
         .push_long(0)
         .return_long()
-    )
\ No newline at end of file
+    )
+
+
+def return_if_closed(context: GenerateContext, instructions: Instructions, push_fd: Callable[[], Instructions]):
+    # Returns -EBADF if the file descriptor (pushed as int) is not open
+    push_fd()
+    (
+        instructions
+        .invoke_static(context.fd_entry_method)
+        .branch_if_reference_is_not_null("open")
+        .push_long(-EBADF)
+        .return_long()
+        .label("open")
+    )
+
+
+def read_method_instructions(context: GenerateContext) -> Instructions:
+    # Variables:
+    # 0: count
+    # 2: buffer pointer
+    # 4: file descriptor
+    instructions = Instructions(context)
+    return_if_closed(context, instructions, lambda: instructions.load_long(4).convert_long_to_integer())
+
+    if context.buffered_output:
+        # Flush pending output before blocking on stdin, so that prompts are visible
+        (
+            instructions
+            .load_long(4)
+            .convert_long_to_integer()
+            .branch_if_true("read")
+        )
+        flush_stdout(context, instructions)
+        instructions.label("read")
+
+    if context.memory_backend.is_segment:
+        # Variables:
+        # 6: buffer
+        # 7: number of bytes read
+        # 8: channel
+        buffer = 6
+        read_count = 7
+        channel = 8
+        readable_class = context.cf.constants.create_class("java/nio/channels/ReadableByteChannel")
+        # The files, pipes and sockets read straight into the memory
+        (
+            instructions
+            .load_long(4)
+            .convert_long_to_integer()
+            .invoke_static(context.channel_method)
+            .store_reference(channel)
+            .load_reference(channel)
+            .instance_of(readable_class)
+            .branch_if_false("stream")
+            .load_reference(channel)
+            .check_cast(readable_class)
+        )
+        push_memory_buffer(context, instructions, lambda: instructions.load_long(2),
+                           lambda: instructions.load_long(0))
+        (
+            instructions
+            .invoke_interface(context.cf.constants.create_interface_method_ref(
+                "java/nio/channels/ReadableByteChannel", "read", "(Ljava/nio/ByteBuffer;)I"))
+            .push_integer(0)
+            .invoke_static(context.cf.constants.create_method_ref("java/lang/Math", "max", "(II)I"))
+            .convert_integer_to_long()
+            .return_long()
+            .label("stream")
+        )
+        (
+            instructions
+            .load_long(4)
+            .convert_long_to_integer()
+            .invoke_static(context.input_stream_method)
+            # Stack: stream
+            .load_long(0)
+            .convert_long_to_integer()
+            .new_array(OperandType.Byte.array_type)
+            .duplicate_top_of_stack()
+            .store_reference(buffer)
+            .push_integer(0)
+            .load_long(0)
+            .convert_long_to_integer()
+            # Stack: stream, buffer, 0, count (as int)
+            .invoke_virtual(context.cf.constants.create_method_ref("java/io/InputStream", "read", "([BII)I"))
+            .push_integer(0)
+            .invoke_static(context.cf.constants.create_method_ref("java/lang/Math", "max", "(II)I"))
+            .store_integer(read_count)
+        )
+        copy_to_memory(context, instructions, lambda: instructions.load_reference(buffer),
+                       lambda: instructions.load_long(2), lambda: instructions.load_integer(read_count))
+        return (
+            instructions
+            .load_integer(read_count)
+            .convert_integer_to_long()
+            .return_long()
+        )
+
+    return (
+        instructions
+        .load_long(4)
+        .convert_long_to_integer()
+        .invoke_static(context.input_stream_method)
+        # Stack: stream
+        .get_static_field(context.memory_ref)
+        .load_long(2)
+        .convert_long_to_integer()
+        .load_long(0)
+        .convert_long_to_integer()
+        # Stack: stream, memory, buffer pointer (as int), count (as int)
+        .invoke_virtual(context.cf.constants.create_method_ref("java/io/InputStream",
+                                                               "read",
+                                                               "([BII)I"))
+        .duplicate_top_of_stack()
+        .push_integer(-1)
+        .branch_if_integer_not_equal("read_return_value")  # if read() != -1, goto read_return_value
+        .push_integer(0)
+        .swap()
+        .pop()
+        .label("read_return_value")
+        .convert_integer_to_long()
+        .return_long()
+    )
+
+
+def write_method_instructions(context: GenerateContext, fd: Optional[int] = None) -> Instructions:
+    """
+    Body of `write`, or of a `write` to the constant file descriptor `fd` that only takes the count and the buffer.
+    """
+    # Variables:
+    # 0: count
+    # 2: buffer pointer
+    # 4: file descriptor, unless it is constant
+    instructions = Instructions(context)
+
+    def push_fd():
+        if fd is None:
+            instructions.load_long(4).convert_long_to_integer()
+        else:
+            instructions.push_integer(fd)
+
+    return_if_closed(context, instructions, push_fd)
+    if fd is None:
+        # The standard streams are not files opened with O_APPEND
+        instructions.load_long(4).convert_long_to_integer().invoke_static(context.seek_append_method)
+    if context.buffered_output and fd is None:
+        # Keep the order of output written to stdout and other descriptors (e.g. stderr)
+        push_fd()
+        (
+            instructions
+            .push_integer(1)
+            .branch_if_integer_equal("write")
+        )
+        flush_stdout(context, instructions)
+        instructions.label("write")
+    elif context.buffered_output and fd != 1:
+        flush_stdout(context, instructions)
+
+    # A constant descriptor is a standard stream, written through its stream even if `dup2` made it a channel
+    if context.memory_backend.is_segment and fd is None:
+        # Variables:
+        # 6: channel
+        # 7: buffer
+        channel = 6
+        buffer = 7
+        writable_class = context.cf.constants.create_class("java/nio/channels/WritableByteChannel")
+        # The files, pipes and sockets are written straight from the memory
+        (
+            instructions
+            .load_long(4)
+            .convert_long_to_integer()
+            .invoke_static(context.channel_method)
+            .store_reference(channel)
+            .load_reference(channel)
+            .instance_of(writable_class)
+            .branch_if_false("stream")
+            .load_reference(channel)
+            .check_cast(writable_class)
+            .store_reference(channel)
+        )
+        push_memory_buffer(context, instructions, lambda: instructions.load_long(2),
+                           lambda: instructions.load_long(0))
+        (
+            instructions
+            .store_reference(buffer)
+            .label("write_buffer")
+            .load_reference(channel)
+            .load_reference(buffer)
+            .invoke_interface(context.cf.constants.create_interface_method_ref(
+                "java/nio/channels/WritableByteChannel", "write", "(Ljava/nio/ByteBuffer;)I"))
+            .pop()
+            .load_reference(buffer)
+            .invoke_virtual(context.cf.constants.create_method_ref("java/nio/Buffer", "hasRemaining", "()Z"))
+            .branch_if_true("write_buffer")
+            .load_long(0)
+            .return_long()
+
+            .label("stream")
+        )
+
+    if context.memory_backend.is_segment:
+        push_fd()
+        return (
+            instructions
+            .invoke_static(context.output_stream_method)
+            # Stack: stream
+            .get_static_field(context.memory_ref)
+            .load_long(2)
+            .load_long(0)
+            .invoke_interface(segment_method_ref(context, "asSlice", f"(JJ)L{SEGMENT_CLASS};"))
+            .get_static_field(value_layout_ref(context, "B"))
+            .invoke_interface(segment_method_ref(context, "toArray", "(Ljava/lang/foreign/ValueLayout$OfByte;)[B"))
+            # Stack: stream, bytes of the buffer
+            .invoke_virtual(context.cf.constants.create_method_ref("java/io/OutputStream", "write", "([B)V"))
+            .load_long(0)
+            .return_long()
+        )
+
+    push_fd()
+    return (
+        instructions
+        .invoke_static(context.output_stream_method)
+        # Stack: stream
+        .get_static_field(context.memory_ref)
+        .load_long(2)
+        .convert_long_to_integer()
+        .load_long(0)
+        .convert_long_to_integer()
+        # Stack: stream, memory, buffer pointer (as int), count (as int)
+        .invoke_virtual(context.cf.constants.create_method_ref("java/io/OutputStream",
+                                                               "write",
+                                                               "([BII)V"))
+        .load_long(0)
+        .return_long()
+    )
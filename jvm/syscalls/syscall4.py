@@ -0,0 +1,39 @@
+from jvm.context import GenerateContext
+from jvm.instructions import Instructions
+from jvm.syscalls import SysCalls, SYSCALL_METHODS
+
+
+def syscall4_method_instructions(context: GenerateContext) -> Instructions:
+    instructions = (
+        Instructions(context)
+        .load_long(8)
+        .convert_long_to_integer()
+        .lookup_switch("exit0", {
+            **{number: number.name.lower() for number in SYSCALL_METHODS[4]},
+            SysCalls.ACCEPT4: "accept4"
+        })
+    )
+    for number, method in SYSCALL_METHODS[4].items():
+        instructions.label(number.name.lower())
+        for argument in range(0, 8, 2):
+            instructions.load_long(argument)
+        instructions.invoke_static(getattr(context, method))
+        instructions.return_long()
+        instructions.end_branch()
+
+    return (
+        instructions
+        # The flags (SOCK_NONBLOCK, SOCK_CLOEXEC) are ignored
+        .label("accept4")
+        .load_long(2)
+        .load_long(4)
+        .load_long(6)
+        .invoke_static(context.accept_method)
+        .return_long()
+        .end_branch()
+
+        .label("exit0")
+        .end_branch()
+        .push_long(0)
+        .return_long()
+    )
@@ -0,0 +1,27 @@
+from jvm.context import GenerateContext
+from jvm.instructions import Instructions
+from jvm.syscalls import SYSCALL_METHODS
+
+
+def syscall5_method_instructions(context: GenerateContext) -> Instructions:
+    instructions = (
+        Instructions(context)
+        .load_long(10)
+        .convert_long_to_integer()
+        .lookup_switch("exit0", {number: number.name.lower() for number in SYSCALL_METHODS[5]})
+    )
+    for number, method in SYSCALL_METHODS[5].items():
+        instructions.label(number.name.lower())
+        for argument in range(0, 10, 2):
+            instructions.load_long(argument)
+        instructions.invoke_static(getattr(context, method))
+        instructions.return_long()
+        instructions.end_branch()
+
+    return (
+        instructions
+        .label("exit0")
+        .end_branch()
+        .push_long(0)
+        .return_long()
+    )
@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 import os
 import sys
+import time
 from os import path
 from typing import Optional
 
-from jvm.generator import generate_jvm_bytecode
-from porth.porth import usage, Program, ParseContext, parse_program_from_file, type_check_program, \
-    PORTH_EXT, cmd_call_echoed
+from jvm.cache import default_cache_directory
+from jvm.compiler import CompileOptions, compile_program, compile_batch, batch_programs
+from jvm.context import MemoryBackend, ReturnConvention
+from jvm.intrinsics.native import NATIVE_ACCESS_OPTION
+from jvm.runtime import JAR_EXT
+from jvm.server import SERVER_CLASS_NAME, default_socket_path, generate_server_class, run_on_server
+from porth.porth import usage, Program, ParseContext, parse_program_from_file, type_check_program, cmd_call_echoed
 
 
 def main():
@@ -61,12 +66,67 @@ def main():
         silent = False
         run = False
         output_path = None
+        memory_backend = MemoryBackend.BYTES
+        buffered_output = False
+        peephole = True
+        return_convention = ReturnConvention.SLOTS
+        use_cache = True
+        use_server = True
+        batch = False
+        jobs = os.cpu_count() or 1
         while len(argv) > 0:
             arg, *argv = argv
             if arg == '-r':
                 run = True
             elif arg == '-s':
                 silent = True
+            elif arg == '-buffered':
+                buffered_output = True
+            elif arg == '-no-peephole':
+                peephole = False
+            elif arg == '-no-cache':
+                use_cache = False
+            elif arg == '-no-server':
+                use_server = False
+            elif arg == '-batch':
+                batch = True
+            elif arg == '-j':
+                if len(argv) == 0:
+                    usage(compiler_name)
+                    print("[ERROR] no argument is provided for parameter -j", file=sys.stderr)
+                    exit(1)
+                jobs_arg, *argv = argv
+                if not jobs_arg.isdigit() or int(jobs_arg) < 1:
+                    usage(compiler_name)
+                    print("[ERROR] the number of jobs must be a positive integer, got %s" % jobs_arg, file=sys.stderr)
+                    exit(1)
+                jobs = int(jobs_arg)
+            elif arg == '-memory':
+                if len(argv) == 0:
+                    usage(compiler_name)
+                    print("[ERROR] no argument is provided for parameter -memory", file=sys.stderr)
+                    exit(1)
+                backend, *argv = argv
+                try:
+                    memory_backend = MemoryBackend(backend)
+                except ValueError:
+                    usage(compiler_name)
+                    print("[ERROR] unknown memory backend %s, expected one of: %s"
+                          % (backend, ", ".join(b.value for b in MemoryBackend)), file=sys.stderr)
+                    exit(1)
+            elif arg == '-returns':
+                if len(argv) == 0:
+                    usage(compiler_name)
+                    print("[ERROR] no argument is provided for parameter -returns", file=sys.stderr)
+                    exit(1)
+                convention, *argv = argv
+                try:
+                    return_convention = ReturnConvention(convention)
+                except ValueError:
+                    usage(compiler_name)
+                    print("[ERROR] unknown return convention %s, expected one of: %s"
+                          % (convention, ", ".join(c.value for c in ReturnConvention)), file=sys.stderr)
+                    exit(1)
             elif arg == '-o':
                 if len(argv) == 0:
                     usage(compiler_name)
@@ -82,43 +142,78 @@ def main():
             print("[ERROR] no input file is provided for the compilation", file=sys.stderr)
             exit(1)
 
-        basename: str
-        basedir: str
-        if output_path is not None:
-            if path.isdir(output_path):
-                basename = path.basename(program_path)
-                if basename.endswith(PORTH_EXT):
-                    basename = basename[:-len(PORTH_EXT)]
-                basedir = path.dirname(output_path)
-            else:
-                basename = path.basename(output_path)
-                basedir = path.dirname(output_path)
-        else:
-            basename = path.basename(program_path)
-            if basename.endswith(PORTH_EXT):
-                basename = basename[:-len(PORTH_EXT)]
-            basedir = path.dirname(program_path)
+        options = CompileOptions(tuple(include_paths), unsafe, memory_backend, buffered_output, peephole,
+                                 return_convention, use_cache)
 
-        # if basedir is empty we should "fix" the path appending the current working directory.
-        # So we avoid `com -r` to run command from $PATH.
-        if basedir == "":
-            basedir = os.getcwd()
-        basepath = path.join(basedir, basename)
+        if batch:
+            # The remaining arguments are further programs or directories of programs
+            if run:
+                usage(compiler_name)
+                print("[ERROR] -r is not supported in batch mode", file=sys.stderr)
+                exit(1)
+            if output_path is not None and not path.isdir(output_path):
+                usage(compiler_name)
+                print("[ERROR] -o must be an existing directory in batch mode", file=sys.stderr)
+                exit(1)
+            programs = batch_programs([program_path] + argv)
+            start = time.perf_counter()
+            results = compile_batch(programs, output_path, options, jobs)
+            failures = sum(1 for result in results if result.error is not None)
+            if not silent:
+                print("[INFO] Compiled %d of %d programs in %.3fs"
+                      % (len(results) - failures, len(results), time.perf_counter() - start))
+            exit(1 if failures else 0)
 
-        include_paths.append(path.dirname(program_path))
+        # A JAR by default, `-o` may name a JAR, a class file or a directory. The class is named after the file
+        out_file_path = "Main.jar"
+        if output_path is not None:
+            out_file_path = path.join(output_path, out_file_path) if path.isdir(output_path) else output_path
+        if not out_file_path.endswith((JAR_EXT, ".class")):
+            usage(compiler_name)
+            print("[ERROR] -o must be a %s or a .class file, or an existing directory" % JAR_EXT, file=sys.stderr)
+            exit(1)
+        class_name = path.splitext(path.basename(out_file_path))[0]
+        class_path = out_file_path if out_file_path.endswith(JAR_EXT) else path.dirname(out_file_path) or "."
 
-        parse_context = ParseContext()
-        parse_program_from_file(parse_context, program_path, include_paths)
-        program = Program(ops=parse_context.ops, memory_capacity=parse_context.memory_capacity)
-        if not unsafe:
-            type_check_program(program, {proc.addr: proc for proc in parse_context.procs.values()})
-        if not silent:
-            print("[INFO] Generating %s" % (basepath + ".class"))
-        generate_jvm_bytecode(parse_context, program, "Main.class", program_path)
-        cmd_call_echoed(["javap", "-v", "-c", "-constants", "Main.class"], silent)
+        compile_program(program_path, out_file_path, options, silent)
+        cmd_call_echoed(["javap", "-v", "-c", "-constants", "-cp", class_path, class_name], silent)
         if run:
-            # -Xverify:none to disable verification of stack map frames
-            exit(cmd_call_echoed(["java", "-Xverify:none", "Main"] + argv, silent))
+            # A warm run server is used if one is listening, `java` is started otherwise
+            exit_code = None
+            # The native syscalls would work on the file descriptors of the server instead of the client's
+            if use_server and memory_backend != MemoryBackend.NATIVE:
+                try:
+                    exit_code = run_on_server(out_file_path, argv)
+                except ConnectionError as e:
+                    print("[ERROR] %s" % e, file=sys.stderr)
+                    exit(1)
+            if exit_code is None:
+                # The segment backends call into the C library through restricted methods
+                java_options = [NATIVE_ACCESS_OPTION] if memory_backend.is_segment else []
+                exit_code = cmd_call_echoed(["java"] + java_options + ["-cp", class_path, class_name] + argv, silent)
+            elif not silent:
+                print("[INFO] %s ran on the run server at %s" % (out_file_path, default_socket_path()))
+            exit(exit_code)
+    elif subcommand == "serve":
+        socket_path = default_socket_path()
+        while len(argv) > 0:
+            arg, *argv = argv
+            if arg == '-socket':
+                if len(argv) == 0:
+                    usage(compiler_name)
+                    print("[ERROR] no argument is provided for parameter -socket", file=sys.stderr)
+                    exit(1)
+                socket_path, *argv = argv
+            else:
+                usage(compiler_name)
+                print("[ERROR] unknown argument %s for the serve subcommand" % arg, file=sys.stderr)
+                exit(1)
+        server_directory = path.join(default_cache_directory(), "server")
+        os.makedirs(server_directory, exist_ok=True)
+        generate_server_class(server_directory)
+        print("[INFO] Serving on %s" % socket_path)
+        exit(cmd_call_echoed(["java", NATIVE_ACCESS_OPTION, "-cp", server_directory, SERVER_CLASS_NAME, socket_path],
+                             False))
     elif subcommand == "help":
         usage(compiler_name)
         exit(0)
@@ -0,0 +1,34 @@
+from jawa.assemble import Label, assemble
+
+from extensions.DeduplicatingClassFile import DeduplicatingClassFile
+from jvm.branches import instruction_size, code_size, widen_branches
+
+constants = DeduplicatingClassFile.create("Test").constants
+
+
+def test_instruction_size():
+    assert instruction_size(("lconst_0",)) == 1
+    assert instruction_size(("bipush", 42)) == 2
+    assert instruction_size(("invokestatic", constants.create_method_ref("Test", "f", "()V"))) == 3
+    assert instruction_size(("lload", 4)) == 2
+    # Prefixed by `wide`
+    assert instruction_size(("lload", 300)) == 4
+    assert instruction_size(("iinc", 300, 1)) == 6
+    assert instruction_size(Label("start")) == 0
+    # Padded to a multiple of 4
+    assert instruction_size(("lookupswitch", {1: Label("start"), 2: Label("start")}, Label("start")), 1) == 27
+    assert instruction_size(("lookupswitch", {1: Label("start")}, Label("start")), 3) == 17
+
+
+def test_code_size_matches_assembly():
+    instructions = [Label("start"), ("lload", 4), ("lconst_1",), ("lcmp",), ("ifeq", Label("start")),
+                    ("sipush", 1000), ("goto", Label("start"))]
+    assembled = list(assemble(instructions))
+    assert code_size(instructions) == sum(instruction.size_on_disk() for instruction in assembled)
+
+
+def test_widen_branches():
+    widened = widen_branches([Label("start"), ("iload_0",), ("ifeq", Label("end")), ("goto", Label("start")),
+                              Label("end"), ("return",)])
+    assert widened == [Label("start"), ("iload_0",), ("ifne", Label("wide_2")), ("goto_w", Label("end")),
+                       Label("wide_2"), ("goto_w", Label("start")), Label("end"), ("return",)]
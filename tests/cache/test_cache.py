@@ -0,0 +1,57 @@
+from jvm.cache import CompileCache, record_opened_files
+
+
+def write(file_path, content: bytes):
+    with open(file_path, "wb") as f:
+        f.write(content)
+
+
+def read(file_path) -> bytes:
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
+def test_record_opened_files(tmp_path):
+    write(tmp_path / "before.porth", b"")
+    write(tmp_path / "program.porth", b"")
+    read(tmp_path / "before.porth")
+    with record_opened_files() as opened_files:
+        read(str(tmp_path / "program.porth"))
+        try:
+            read(str(tmp_path / "missing.porth"))
+        except FileNotFoundError:
+            pass
+    read(str(tmp_path / "program.porth"))
+    assert opened_files == [str(tmp_path / "program.porth"), str(tmp_path / "missing.porth")]
+
+    # The audit hook is installed only once
+    with record_opened_files() as opened_files:
+        read(str(tmp_path / "program.porth"))
+    assert opened_files == [str(tmp_path / "program.porth")]
+
+
+def test_lookup(tmp_path):
+    program = str(tmp_path / "program.porth")
+    include = str(tmp_path / "include.porth")
+    shadowing = str(tmp_path / "shadowing.porth")
+    write(program, b"include \"include.porth\"")
+    write(include, b"1 print")
+    write(tmp_path / "Main.class", b"\xca\xfe\xba\xbe")
+
+    cache = CompileCache(str(tmp_path / "cache"), program, ["bytes"])
+    assert not cache.lookup(str(tmp_path / "Out.class"))
+    cache.store(str(tmp_path / "Main.class"), [program, include, shadowing])
+    assert cache.lookup(str(tmp_path / "Out.class"))
+    assert read(tmp_path / "Out.class") == b"\xca\xfe\xba\xbe"
+
+    # Other options
+    assert not CompileCache(str(tmp_path / "cache"), program, ["varhandle"]).lookup(str(tmp_path / "Out.class"))
+
+    write(include, b"2 print")
+    assert not cache.lookup(str(tmp_path / "Out.class"))
+    write(include, b"1 print")
+    assert cache.lookup(str(tmp_path / "Out.class"))
+
+    # A file that did not exist would now be included instead
+    write(shadowing, b"")
+    assert not cache.lookup(str(tmp_path / "Out.class"))
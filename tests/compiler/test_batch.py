@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip("porth.porth")
+
+from jvm.compiler import CompileOptions, batch_programs, batch_out_file_path, compile_batch
+
+
+def test_batch_programs(tmp_path):
+    (tmp_path / "b.porth").write_text("")
+    (tmp_path / "a.porth").write_text("")
+    (tmp_path / "notes.txt").write_text("")
+    assert batch_programs([str(tmp_path), "c.porth"]) == [str(tmp_path / "a.porth"), str(tmp_path / "b.porth"),
+                                                          "c.porth"]
+
+
+def test_batch_out_file_path():
+    assert batch_out_file_path("examples/hello.porth", None) == "examples/hello.class"
+    assert batch_out_file_path("examples/hello.porth", "out") == "out/hello.class"
+
+
+def test_failures_do_not_stop_the_batch(tmp_path):
+    (tmp_path / "first.porth").write_text("1 print\n")
+    (tmp_path / "broken.porth").write_text("+\n")
+    (tmp_path / "last.porth").write_text("2 print\n")
+    options = CompileOptions(include_paths=(), use_cache=False)
+    results = compile_batch(batch_programs([str(tmp_path)]), None, options, 2)
+
+    assert [result.program_path for result in results] == [str(tmp_path / "broken.porth"),
+                                                           str(tmp_path / "first.porth"), str(tmp_path / "last.porth")]
+    assert results[0].error is not None
+    assert results[1].error is None and results[2].error is None
+    assert (tmp_path / "first.class").exists() and (tmp_path / "last.class").exists()
@@ -0,0 +1,35 @@
+import shutil
+import subprocess
+import sys
+from os import path
+
+import pytest
+
+pytest.importorskip("porth.porth")
+
+COMPILER = path.join(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))), "porth-jvm.py")
+
+
+def com(tmp_path, *args: str) -> subprocess.CompletedProcess:
+    (tmp_path / "program.porth").write_text("42 print\n")
+    return subprocess.run([sys.executable, COMPILER, "com", "-s", "-no-cache", "-no-server", *args, "program.porth"],
+                          cwd=tmp_path, capture_output=True, text=True)
+
+
+@pytest.mark.skipif(shutil.which("java") is None or shutil.which("javap") is None, reason="java is not installed")
+@pytest.mark.parametrize("output, out_file", [("out/hello.jar", "out/hello.jar"),
+                                              ("out/Hello.class", "out/Hello.class"),
+                                              ("out", "out/Main.jar")])
+def test_output_path(tmp_path, output, out_file):
+    (tmp_path / "out").mkdir()
+    result = com(tmp_path, "-r", "-o", output)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.endswith("42\n")
+    assert (tmp_path / out_file).exists()
+    assert not (tmp_path / "Main.jar").exists()
+
+
+def test_output_path_must_be_a_class_or_a_jar(tmp_path):
+    result = com(tmp_path, "-o", "program.txt")
+    assert result.returncode == 1
+    assert "-o must be" in result.stderr
@@ -0,0 +1,57 @@
+import hashlib
+import os
+import subprocess
+import sys
+from os import path
+
+import pytest
+
+pytest.importorskip("porth.porth")
+
+from benchmarks.programs import SYNTHESIZERS, corpus_programs
+from benchmarks.runtime import workloads
+
+REPOSITORY_DIRECTORY = path.dirname(path.dirname(path.dirname(path.abspath(__file__))))
+SYNTHESIZED_SIZE = 50
+# Procedures with the name and descriptor of utility methods
+COLLIDING_PROGRAM = """
+proc load_64 int -- int in 1 + end
+proc flush_stdout in end
+proc load_64_1 int -- int in 2 + end
+41 load_64 print
+41 load_64_1 print
+flush_stdout
+"""
+
+
+def compile_in_subprocess(program_path: str, out_file_path: str, hash_seed: str) -> str:
+    # A new interpreter with another hash seed, so that the iteration order of sets of strings differs
+    subprocess.run([sys.executable, "-c", "import sys\n"
+                                          "from benchmarks.compile import compile_program, Profiler\n"
+                                          "compile_program(sys.argv[1], sys.argv[2], Profiler())",
+                    program_path, out_file_path],
+                   cwd=REPOSITORY_DIRECTORY, env=dict(os.environ, PYTHONHASHSEED=hash_seed), check=True)
+    with open(out_file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def programs(directory: str):
+    programs = list(workloads()) + corpus_programs()
+    for name, synthesize in SYNTHESIZERS.items():
+        programs.append(path.join(directory, f"{name}.porth"))
+        with open(programs[-1], "w") as f:
+            f.write(synthesize(SYNTHESIZED_SIZE))
+    programs.append(path.join(directory, "colliding.porth"))
+    with open(programs[-1], "w") as f:
+        f.write(COLLIDING_PROGRAM)
+    return programs
+
+
+def test_identical_compiles_are_byte_identical(tmp_path):
+    # The class is named after the file, the JAR also contains the runtime class
+    (tmp_path / "first").mkdir()
+    (tmp_path / "second").mkdir()
+    for program_path in programs(str(tmp_path)):
+        first = compile_in_subprocess(program_path, str(tmp_path / "first" / "Main.jar"), "1")
+        second = compile_in_subprocess(program_path, str(tmp_path / "second" / "Main.jar"), "2")
+        assert first == second, program_path
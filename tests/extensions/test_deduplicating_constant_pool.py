@@ -0,0 +1,62 @@
+from io import BytesIO
+
+from extensions.DeduplicatingClassFile import DeduplicatingClassFile
+from extensions.DeduplicatingConstantPool import DeduplicatingConstantPool
+
+
+def test_deduplicate_utf8():
+    pool = DeduplicatingConstantPool()
+    first = pool.create_utf8("Hello")
+    second = pool.create_utf8("Hello")
+    assert first.index == second.index
+    assert pool.raw_count == 2
+
+
+def test_deduplicate_by_tag():
+    pool = DeduplicatingConstantPool()
+    integer = pool.create_integer(1)
+    long = pool.create_long(1)
+    float_ = pool.create_float(1.0)
+    assert len({integer.index, long.index, float_.index}) == 3
+
+
+def test_deduplicate_long_padding():
+    pool = DeduplicatingConstantPool()
+    first = pool.create_long(1 << 40)
+    assert pool.raw_count == 3
+    assert pool._pool[first.index + 1] is None
+    second = pool.create_long(1 << 40)
+    assert first.index == second.index
+    assert pool.raw_count == 3
+    integer = pool.create_integer(5)
+    assert integer.index == first.index + 2
+
+
+def test_deduplicate_double_signed_zero():
+    pool = DeduplicatingConstantPool()
+    positive = pool.create_double(0.0)
+    negative = pool.create_double(-0.0)
+    assert positive.index != negative.index
+    assert pool.create_double(float("nan")).index == pool.create_double(float("nan")).index
+
+
+def test_deduplicate_references():
+    pool = DeduplicatingConstantPool()
+    first = pool.create_method_ref("java/lang/Math", "max", "(JJ)J")
+    count = pool.raw_count
+    second = pool.create_method_ref("java/lang/Math", "max", "(JJ)J")
+    assert first.index == second.index
+    assert pool.raw_count == count
+    assert pool.create_method_ref("java/lang/Math", "min", "(JJ)J").index != first.index
+    assert pool.create_class("java/lang/Math").index == first.class_.index
+
+
+def test_save():
+    cf = DeduplicatingClassFile.create("Test")
+    cf.constants.create_string("Hello")
+    cf.constants.create_string("Hello")
+    cf.constants.create_long(42)
+    cf.constants.create_long(42)
+    output = BytesIO()
+    cf.save(output)
+    assert output.getvalue().count(b"Hello") == 1
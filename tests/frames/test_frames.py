@@ -0,0 +1,121 @@
+from jawa.assemble import Label
+from jawa.attributes.stack_map_table import StackMapTableAttribute
+from jawa.util.stream import BufferStreamReader
+
+from extensions.DeduplicatingClassFile import DeduplicatingClassFile
+from extensions.PackingStackMapTableAttribute import PackingStackMapTableAttribute
+from jvm.frames import analyze, stack_map_frames, encode_locals, object_type, Frame, INTEGER, LONG, TOP, NULL
+
+cf = DeduplicatingClassFile.create("Test")
+constants = cf.constants
+
+
+def test_loop_frames():
+    analysis = analyze("(J)J", [
+        ("iconst_0",),
+        ("istore", 2),
+        ("lconst_0",),
+        Label("loop"),
+        ("iload", 2),
+        ("ifne", Label("exit")),
+        ("iinc", 2, 1),
+        ("goto", Label("loop")),
+        Label("exit"),
+        ("lload", 0),
+        ("ladd",),
+        ("lreturn",),
+    ])
+    assert analysis.initial == Frame((LONG, TOP), ())
+    assert analysis.frames == {
+        "loop": Frame((LONG, TOP, INTEGER), (LONG,)),
+        "exit": Frame((LONG, TOP, INTEGER), (LONG,)),
+    }
+    assert analysis.max_stack == 4
+    assert analysis.max_locals == 3
+
+
+def test_merged_types():
+    input_stream = constants.create_class("java/io/InputStream")
+    file_input_stream = constants.create_class("java/io/FileInputStream")
+    analysis = analyze("(I)Ljava/io/InputStream;", [
+        ("aconst_null",),
+        ("astore_1",),
+        ("iload_0",),
+        ("ifeq", Label("file")),
+        ("iconst_1",),
+        ("anewarray", input_stream),
+        ("iconst_0",),
+        ("aaload",),
+        ("goto", Label("return")),
+        Label("file"),
+        ("new", file_input_stream),
+        ("dup",),
+        ("aload_1",),
+        ("invokespecial", constants.create_method_ref("java/io/FileInputStream", "<init>", "(Ljava/lang/String;)V")),
+        ("lconst_1",),
+        ("lstore_1",),
+        Label("return"),
+        ("areturn",),
+    ])
+    # The second local holds null on one path and a long on the other
+    assert analysis.frames["return"] == Frame((INTEGER,), (object_type("java/io/InputStream"),))
+    assert analysis.frames["file"] == Frame((INTEGER, NULL), ())
+
+
+def test_unreachable_instructions_are_removed():
+    analysis = analyze("()V", [
+        ("goto", Label("end")),
+        Label("dead"),
+        ("iconst_0",),
+        ("pop",),
+        Label("end"),
+        ("return",),
+    ])
+    assert analysis.instructions == [("goto", Label("end")), Label("end"), ("return",)]
+    assert analysis.frames == {"end": Frame((), ())}
+
+
+def test_pack_frames():
+    analysis = analyze("(J)V", [
+        Label("start"),
+        ("iconst_1",),
+        ("istore_2",),
+        ("lload_0",),
+        ("lconst_0",),
+        ("lcmp",),
+        ("ifeq", Label("append")),
+        ("goto", Label("start")),
+        Label("append"),
+        ("iconst_0",),
+        ("istore_2",),
+        ("iconst_5",),
+        ("iload_2",),
+        ("ifne", Label("stack")),
+        ("iconst_1",),
+        ("goto", Label("full")),
+        Label("stack"),
+        ("iconst_3",),
+        Label("full"),
+        ("pop2",),
+        ("return",),
+    ])
+    frames = stack_map_frames(constants, analysis)
+    assert frames == [
+        (0, [(4,)], []),
+        (11, [(4,), (1,)], []),
+        (22, [(4,), (1,)], [(1,)]),
+        (23, [(4,), (1,)], [(1,), (1,)]),
+    ]
+
+    method = cf.methods.create("test", "(J)V", code=True)
+    attribute = method.code.attributes.create(PackingStackMapTableAttribute)
+    attribute.initial_locals = encode_locals(constants, [], analysis.initial.locals)
+    attribute.entries = frames
+    packed = attribute.pack()
+    # same_frame, append_frame, same_locals_1_stack_item_frame and full_frame
+    assert [packed[2], packed[3], packed[7], packed[9]] == [0, 252, 64 + 10, 255]
+
+    unpacked = StackMapTableAttribute(method.code.attributes)
+    unpacked.unpack(BufferStreamReader(packed))
+    assert [frame.frame_offset for frame in unpacked.frames] == [0, 11, 22, 23]
+    assert unpacked.frames[3].frame_stack == [(1,), (1,)]
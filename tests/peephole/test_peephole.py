@@ -0,0 +1,80 @@
+from jawa.assemble import Label
+
+from extensions.DeduplicatingClassFile import DeduplicatingClassFile
+from jvm.peephole import optimize, verify_rewrite, RULES
+
+constants = DeduplicatingClassFile.create("Test").constants
+
+
+def test_integer_to_long_to_integer():
+    optimized, hits = optimize(constants, [("bipush", 42), ("i2l",), ("l2i",), ("ireturn",)])
+    assert optimized == [("bipush", 42), ("ireturn",)]
+    assert hits == {"integer-to-long-to-integer": 1}
+
+
+def test_swap_longs_twice():
+    optimized, hits = optimize(constants, [("lconst_0",), ("lconst_1",), ("dup2_x2",), ("pop2",), ("dup2_x2",),
+                                         ("pop2",), ("lsub",)])
+    assert optimized == [("lconst_0",), ("lconst_1",), ("lsub",)]
+    assert hits == {"swap-longs-swap-longs": 1}
+
+
+def test_push_drop_cascade():
+    # `sipush 1000; i2l; pop2` is removed in two steps
+    optimized, hits = optimize(constants, [("sipush", 1000), ("i2l",), ("pop2",), ("return",)])
+    assert optimized == [("return",)]
+    assert hits == {"convert-integer-pop": 1, "push-pop": 1}
+
+
+def test_fold_string_address():
+    optimized, hits = optimize(constants, [("sipush", 1000), ("sipush", 200), ("iadd",), ("i2l",), ("lreturn",)])
+    assert optimized == [("sipush", 1200), ("i2l",), ("lreturn",)]
+    assert hits == {"fold-integer-addition": 1}
+
+
+def test_compare_integer_with_zero():
+    optimized, hits = optimize(constants, [("iload", 1), ("i2l",), ("lconst_0",), ("lcmp",), ("ifeq", Label("end")),
+                                         Label("end"), ("return",)])
+    assert optimized == [("iload", 1), ("ifeq", Label("end")), Label("end"), ("return",)]
+    assert hits == {"compare-integer-with-zero": 1}
+
+
+def test_branch_targets_are_respected():
+    # `end` is the target of a branch, so `lconst_0` and `pop2` are not adjacent
+    instructions = [("iload", 1), ("ifeq", Label("end")), ("lconst_0",), Label("end"), ("pop2",), ("return",)]
+    optimized, hits = optimize(constants, instructions)
+    assert optimized == instructions
+    assert hits == {}
+
+
+def test_other_labels_are_ignored():
+    optimized, hits = optimize(constants, [("lconst_1",), Label("addr_1"), ("pop2",), ("return",)])
+    assert optimized == [Label("addr_1"), ("return",)]
+    assert hits == {"push-long-pop": 1}
+
+
+def test_goto_next():
+    optimized, hits = optimize(constants, [("goto", Label("next")), Label("next"), ("return",)])
+    assert optimized == [Label("next"), ("return",)]
+    assert hits == {"goto-next": 1}
+
+
+def test_rules_keep_stack_effects():
+    # Every rule that applies to a window of its first opcodes keeps the stack effect
+    for rule in RULES:
+        window = [(sorted(opcodes)[0], *_operands(sorted(opcodes)[0])) for opcodes in rule.pattern]
+        replacement = rule.rewrite(constants, window)
+        if replacement is not None:
+            verify_rewrite(rule, window, replacement)
+
+
+def _operands(opcode: str) -> tuple:
+    if opcode in ("bipush", "sipush", "iload", "aload", "fload", "lload", "dload"):
+        return 1,
+    if opcode in ("ldc", "ldc_w"):
+        return constants.create_integer(100000),
+    if opcode == "ldc2_w":
+        return constants.create_long(100000),
+    if opcode.startswith("if"):
+        return Label("target"),
+    return ()
@@ -0,0 +1,119 @@
+import zipfile
+
+import pytest
+
+pytest.importorskip("porth.porth")
+
+from extensions.DeduplicatingClassFile import DeduplicatingClassFile
+from jvm.context import MemoryBackend, GenerateContext
+from jvm.generator import generate_runtime, generate_jvm_bytecode
+from jvm.runtime import Runtime, RuntimeCache, RUNTIME_CLASS_NAME, read_program, write_program, link_runtime
+
+RUNTIME = Runtime(b"runtime class", {"memory_ref": ("field", "memory", "[B")})
+
+
+def test_write_jar(tmp_path):
+    write_program(b"program class", str(tmp_path / "Hello.jar"), RUNTIME)
+    with zipfile.ZipFile(tmp_path / "Hello.jar") as jar:
+        assert "Main-Class: Hello" in jar.read("META-INF/MANIFEST.MF").decode()
+    assert read_program(str(tmp_path / "Hello.jar")) == {"Hello": b"program class", RUNTIME_CLASS_NAME: b"runtime class"}
+
+    # The same program always generates the same JAR
+    first = (tmp_path / "Hello.jar").read_bytes()
+    write_program(b"program class", str(tmp_path / "Hello.jar"), RUNTIME)
+    assert (tmp_path / "Hello.jar").read_bytes() == first
+
+
+def test_write_class(tmp_path):
+    write_program(b"program class", str(tmp_path / "Hello.class"), RUNTIME)
+    assert (tmp_path / f"{RUNTIME_CLASS_NAME}.class").read_bytes() == b"runtime class"
+    assert read_program(str(tmp_path / "Hello.class")) == {"Hello": b"program class",
+                                                           RUNTIME_CLASS_NAME: b"runtime class"}
+
+
+def test_runtime_cache(tmp_path):
+    generated = []
+
+    def generate():
+        generated.append(RUNTIME)
+        return RUNTIME
+
+    assert RuntimeCache(str(tmp_path), ["bytes"]).load(generate) == RUNTIME
+    assert RuntimeCache(str(tmp_path), ["bytes"]).load(generate) == RUNTIME
+    assert len(generated) == 1
+    RuntimeCache(str(tmp_path), ["varhandle"]).load(generate)
+    assert len(generated) == 2
+
+
+def test_generate_runtime():
+    runtime = generate_runtime(MemoryBackend.VAR_HANDLE, True, True)
+    assert runtime.references["memory_ref"] == ("field", "memory", "[B")
+    assert runtime.references["long_view_ref"] == ("field", "long_view", "Ljava/lang/invoke/VarHandle;")
+    assert runtime.references["flush_stdout_method"] == ("method", "flush_stdout", "()V")
+    assert runtime.references["channels_ref"] == ("field", "channels", "[Ljava/nio/channels/Channel;")
+    assert runtime.references["mmap_method"] == ("method", "sys_mmap", "(JJJJJJ)J")
+    assert runtime.references["poll_method"] == ("method", "sys_poll", "(JJJ)J")
+    assert runtime.references["syscall5_method"] == ("method", "syscall5", "(JJJJJJ)J")
+    assert runtime.references["sendfile_method"] == ("method", "sys_sendfile", "(JJJJ)J")
+    assert "flush_stdout_method" not in generate_runtime(MemoryBackend.BYTES, False, True).references
+
+    assert runtime.references["write_stdout_method"] == ("method", "sys_write_stdout", "(JJ)J")
+
+    runtime = generate_runtime(MemoryBackend.SEGMENT, False, True)
+    assert runtime.references["memory_ref"] == ("field", "memory", "Ljava/lang/foreign/MemorySegment;")
+    assert runtime.references["memory_top_ref"] == ("field", "memory_top", "J")
+    assert runtime.references["store_8_method"] == ("method", "store_8", "(JJ)V")
+
+    runtime = generate_runtime(MemoryBackend.NATIVE, False, True)
+    assert runtime.references["memory_base_ref"] == ("field", "memory_base", "J")
+    assert runtime.references["syscall0_method"] == ("method", "syscall0", "(J)J")
+    assert runtime.references["syscall6_method"] == ("method", "syscall6", "(JJJJJJJ)J")
+    assert "write_method" not in runtime.references
+    assert "write_stdout_method" not in runtime.references
+    assert "channels_ref" not in runtime.references
+    assert "selector_ref" not in runtime.references
+
+
+def test_link_runtime_on_first_use():
+    context = GenerateContext()
+    context.cf = DeduplicatingClassFile.create("Hello")
+    link_runtime(context, generate_runtime(MemoryBackend.BYTES, False, True))
+    constants = len(context.cf.constants)
+
+    reference = context.print_long_method
+    assert reference.class_.name.value == RUNTIME_CLASS_NAME
+    assert reference.name_and_type.name.value == "print_long"
+    assert context.print_long_method is reference
+    assert len(context.cf.constants) > constants
+    # The other members of the runtime are not referenced by the program
+    assert not any(getattr(constant, "name_and_type", None) is not None
+                   and constant.name_and_type.name.value == "prepare_envp" for constant in context.cf.constants)
+    with pytest.raises(AttributeError):
+        context.missing_method
+
+
+def called_methods(tmp_path, source: str, memory_backend: MemoryBackend = MemoryBackend.BYTES):
+    from porth.porth import ParseContext, Program, parse_program_from_file
+
+    program_path = tmp_path / "Main.porth"
+    program_path.write_text(source)
+    parse_context = ParseContext()
+    parse_program_from_file(parse_context, str(program_path), [])
+    context = generate_jvm_bytecode(parse_context, Program(ops=parse_context.ops,
+                                                           memory_capacity=parse_context.memory_capacity),
+                                    str(tmp_path / "Main.class"), str(program_path), memory_backend)
+    return {constant.name_and_type.name.value for constant in context.cf.constants
+            if getattr(constant, "name_and_type", None) is not None}
+
+
+def test_constant_syscalls(tmp_path):
+    methods = called_methods(tmp_path, '"out\\n" 1 1 syscall3 drop "err\\n" 2 1 syscall3 drop 3 3 syscall1 drop')
+    assert {"sys_write_stdout", "sys_write_stderr", "sys_close"} <= methods
+    assert not methods & {"sys_write", "syscall1", "syscall3"}
+
+    # Only the writes to stdout and stderr have their own helper
+    assert "sys_write" in called_methods(tmp_path, '"out\\n" 4 1 syscall3 drop')
+    # A jump lands between the number and the syscall
+    assert "syscall3" in called_methods(tmp_path, '"out\\n" 1 true if 1 else 1 end syscall3 drop')
+    # The number is passed to the kernel
+    assert "syscall3" in called_methods(tmp_path, '"out\\n" 1 1 syscall3 drop', MemoryBackend.NATIVE)
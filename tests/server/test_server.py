@@ -0,0 +1,61 @@
+import shutil
+import subprocess
+import time
+from io import BytesIO
+
+import pytest
+
+pytest.importorskip("porth.porth")
+
+from jawa.constants import ConstantPool, MethodReference
+
+from jvm.compiler import CompileOptions, compile_program
+from jvm.runtime import read_program
+from jvm.server import SERVER_CLASS_NAME, generate_server_class, redirect_exit, run_on_server
+
+EXIT_PROGRAM = '"hello\\n" 1 1 syscall3 drop\n42 print\n3 60 syscall1 drop\n'
+
+
+def compile_exit_program(tmp_path) -> str:
+    (tmp_path / "program.porth").write_text(EXIT_PROGRAM)
+    out_file_path = str(tmp_path / "Main.class")
+    compile_program(str(tmp_path / "program.porth"), out_file_path, CompileOptions(include_paths=(), use_cache=False))
+    return out_file_path
+
+
+def test_redirect_exit(tmp_path):
+    exit_references = []
+    for class_file in read_program(compile_exit_program(tmp_path)).values():
+        constants = ConstantPool()
+        constants.unpack(BytesIO(redirect_exit(class_file)[8:]))
+        exit_references.extend(constant.class_.name.value for constant in constants
+                               if isinstance(constant, MethodReference) and constant.name_and_type.name.value == "exit")
+    assert exit_references == [SERVER_CLASS_NAME]
+
+
+def test_no_server(tmp_path):
+    assert run_on_server(compile_exit_program(tmp_path), [], str(tmp_path / "missing.sock")) is None
+
+
+@pytest.mark.skipif(shutil.which("java") is None, reason="java is not installed")
+def test_run(tmp_path):
+    class_file_path = compile_exit_program(tmp_path)
+    socket_path = str(tmp_path / "server.sock")
+    # The classes of the programs must not be on the class path of the server
+    (tmp_path / "server").mkdir()
+    generate_server_class(str(tmp_path / "server"))
+    server = subprocess.Popen(["java", "-cp", str(tmp_path / "server"), SERVER_CLASS_NAME, socket_path])
+    try:
+        # The static state of a run does not leak into the next one
+        for run in range(2):
+            with open(tmp_path / "stdout", "w+b") as stdout:
+                # None until the server listens
+                while (exit_code := run_on_server(class_file_path, [], socket_path, stdout=stdout.fileno())) is None:
+                    assert server.poll() is None
+                    time.sleep(0.05)
+                assert exit_code == 3
+                stdout.seek(0)
+                assert stdout.read() == b"hello\n42\n"
+    finally:
+        server.kill()
+        server.wait()
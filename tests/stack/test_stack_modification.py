@@ -2078,3 +2078,28 @@ def test_tableswitch():
     assert stack._stack[0] == OperandType.Integer
     stack.update_stack("tableswitch", 0, 0, 0, 0)
     assert len(stack._stack) == 0
+
+
+def test_max_stack_size():
+    stack = Stack()
+    stack.update_stack("lconst_0")
+    stack.update_stack("lconst_1")
+    stack.update_stack("iconst_0")
+    assert stack._stack.size == 5
+    assert stack.max_stack_size == 5
+    stack.update_stack("pop")
+    stack.update_stack("ladd")
+    assert stack._stack.size == 2
+    assert stack.max_stack_size == 5
+
+
+def test_restore_stack_size():
+    stack = Stack()
+    stack.update_stack("lconst_0")
+    stack.update_stack("iconst_0")
+    stack.update_stack("ifeq", Label("target"))
+    stack.update_stack("pop2")
+    assert stack._stack.size == 0
+    stack.restore_stack()
+    assert stack._stack.size == 2
+    assert stack._stack[0] == OperandType.Long
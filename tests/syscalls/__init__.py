@@ -0,0 +1,29 @@
+import shutil
+import subprocess
+from typing import Tuple
+
+import pytest
+
+# The emulated backends, and the native one whose syscalls go to the kernel and give the expected results
+BACKENDS = ["bytes", "varhandle", "segment", "native"]
+
+requires_java = pytest.mark.skipif(shutil.which("java") is None, reason="java is not installed")
+
+
+def run_program(tmp_path, source: str, memory_backend: str, buffered_output: bool = False,
+                timeout: float = 60) -> Tuple[int, str]:
+    """
+    Compiles the Porth source into `tmp_path` and runs it, returns the exit code and the stdout of the program.
+    """
+    from jvm.compiler import CompileOptions, compile_program
+    from jvm.context import MemoryBackend
+    from jvm.intrinsics.native import NATIVE_ACCESS_OPTION
+
+    program_path = tmp_path / "program.porth"
+    program_path.write_text(source)
+    compile_program(str(program_path), str(tmp_path / "Main.class"),
+                    CompileOptions(include_paths=(), memory_backend=MemoryBackend(memory_backend),
+                                   buffered_output=buffered_output, use_cache=False))
+    result = subprocess.run(["java", NATIVE_ACCESS_OPTION, "-cp", str(tmp_path), "Main"], cwd=tmp_path,
+                            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, timeout=timeout)
+    return result.returncode, result.stdout.decode()
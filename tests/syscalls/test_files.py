@@ -0,0 +1,107 @@
+import pytest
+
+pytest.importorskip("porth.porth")
+
+from tests.syscalls import BACKENDS, requires_java, run_program
+
+DATA = b"hello, world\n"
+# Opened with O_CREAT | O_RDONLY (64), O_CREAT | O_EXCL (192), O_WRONLY | O_CREAT | O_EXCL (193),
+# O_RDWR | O_CREAT | O_EXCL (194) and O_WRONLY | O_CREAT | O_TRUNC (577), mode 0644
+FILES_PROGRAM = """
+memory st 144 end
+memory buf 64 end
+memory fd 8 end
+memory map 8 end
+0 0 "{dir}/missing"c 2 syscall3 print
+420 64 "{dir}/created"c 2 syscall3 dup fd !64 0 >= print
+fd @64 3 syscall1 print
+420 192 "{dir}/created"c 2 syscall3 print
+420 64 "{dir}/missing/created"c 2 syscall3 print
+420 193 "{dir}/exclusive-w"c 2 syscall3 fd !64 fd @64 0 >= print fd @64 3 syscall1 print
+420 194 "{dir}/exclusive-rw"c 2 syscall3 fd !64 fd @64 0 >= print fd @64 3 syscall1 print
+420 193 "{dir}/exclusive-w"c 2 syscall3 print
+0 0 "{dir}/data.txt"c 2 syscall3 fd !64
+st fd @64 5 syscall2 print
+st 48 + @64 print
+st 24 + @32 61440 and print
+5 buf fd @64 0 syscall3 print
+5 buf 1 1 syscall3 drop "\\n" 1 1 syscall3 drop
+2 -5 fd @64 8 syscall3 print
+0 7 fd @64 8 syscall3 print
+5 buf fd @64 0 syscall3 print
+5 buf 1 1 syscall3 drop "\\n" 1 1 syscall3 drop
+0 fd @64 2 1 13 0 9 syscall6 map !64
+13 map @64 1 1 syscall3 drop
+fd @64 3 syscall1 print
+fd @64 3 syscall1 print
+st fd @64 5 syscall2 print
+0 0 fd @64 8 syscall3 print
+420 577 "{dir}/out.txt"c 2 syscall3 fd !64
+"written\\n" fd @64 1 syscall3 print
+fd @64 3 syscall1 print
+"""
+# Opened with O_RDWR | O_APPEND (1026), O_RDONLY | O_APPEND (1024) and O_WRONLY | O_APPEND | O_TRUNC (1537)
+APPEND_PROGRAM = """
+memory buf 64 end
+memory fd 8 end
+0 1026 "{dir}/log.txt"c 2 syscall3 fd !64
+0 0 fd @64 8 syscall3 print
+"tail\\n" fd @64 1 syscall3 print
+0 0 fd @64 8 syscall3 print
+64 buf fd @64 0 syscall3 dup print
+buf 1 1 syscall3 drop
+fd @64 3 syscall1 print
+0 1024 "{dir}/log.txt"c 2 syscall3 fd !64
+4 buf fd @64 0 syscall3 print
+fd @64 3 syscall1 print
+0 1537 "{dir}/old.txt"c 2 syscall3 fd !64
+"new\\n" fd @64 1 syscall3 print
+0 0 fd @64 8 syscall3 print
+"new\\n" fd @64 1 syscall3 print
+fd @64 3 syscall1 print
+"""
+
+
+@requires_java
+@pytest.mark.parametrize("memory_backend", BACKENDS)
+def test_files(tmp_path, memory_backend):
+    (tmp_path / "data.txt").write_bytes(DATA)
+    exit_code, stdout = run_program(tmp_path, FILES_PROGRAM.format(dir=tmp_path), memory_backend)
+    assert exit_code == 0
+    assert stdout.split("\n") == [
+        # ENOENT, O_CREAT creates the file even if it is opened read-only, EEXIST, ENOENT of the directory
+        "-2", "1", "0", "-17", "-2",
+        # O_EXCL creates the missing files whatever the access mode, then EEXIST
+        "1", "0", "1", "0", "-17",
+        # fstat: size and S_IFREG
+        "0", "13", str(0o100000),
+        # read, lseek from the end and from the start
+        "5", "hello", "8", "7", "5", "world",
+        # mmap
+        "hello, world",
+        # close, then EBADF
+        "0", "-9", "-9", "-9",
+        # write and close
+        "8", "0", "",
+    ]
+    assert (tmp_path / "created").read_bytes() == b""
+    assert (tmp_path / "out.txt").read_bytes() == b"written\n"
+
+
+@requires_java
+@pytest.mark.parametrize("memory_backend", BACKENDS)
+def test_append(tmp_path, memory_backend):
+    (tmp_path / "log.txt").write_bytes(b"head\n")
+    (tmp_path / "old.txt").write_bytes(b"old content\n")
+    exit_code, stdout = run_program(tmp_path, APPEND_PROGRAM.format(dir=tmp_path), memory_backend)
+    assert exit_code == 0
+    assert stdout.split("\n") == [
+        # O_RDWR | O_APPEND: written at the end whatever the position, then read from the start
+        "0", "5", "0", "10", "head", "tail", "0",
+        # O_RDONLY | O_APPEND
+        "4", "0",
+        # O_WRONLY | O_APPEND | O_TRUNC
+        "4", "0", "4", "0", "",
+    ]
+    assert (tmp_path / "log.txt").read_bytes() == b"head\ntail\n"
+    assert (tmp_path / "old.txt").read_bytes() == b"new\nnew\n"
@@ -0,0 +1,94 @@
+import pytest
+
+pytest.importorskip("porth.porth")
+
+from tests.syscalls import BACKENDS, requires_java, run_program
+
+DATA = b"hello, world\n"
+# `off` is the first memory of the program, at the lowest address
+PIPES_PROGRAM = """
+memory off 8 end
+memory pipefd 8 end
+memory buf 64 end
+memory fd 8 end
+memory st 144 end
+pipefd 22 syscall1 print
+st pipefd @32 5 syscall2 print st 24 + @32 61440 and print
+st pipefd 4 + @32 5 syscall2 print st 24 + @32 61440 and print
+"ping\\n" pipefd 4 + @32 1 syscall3 print
+64 buf pipefd @32 0 syscall3 dup print
+buf 1 1 syscall3 drop
+pipefd 4 + @32 32 syscall1 dup fd !64 0 >= print
+pipefd 4 + @32 3 syscall1 print
+"dup\\n" fd @64 1 syscall3 print
+64 buf pipefd @32 0 syscall3 dup print
+buf 1 1 syscall3 drop
+fd @64 3 syscall1 print
+64 buf pipefd @32 0 syscall3 print
+pipefd @32 3 syscall1 print
+"x" pipefd 4 + @32 1 syscall3 print
+99 32 syscall1 print
+5 99 33 syscall2 print
+5 0 99 1 40 syscall4 print
+0 0 "{dir}/data.txt"c 2 syscall3 fd !64
+7 off !64
+5 off fd @64 1 40 syscall4 "\\n" 1 1 syscall3 drop print
+off @64 print
+5 0 fd @64 1 40 syscall4 "\\n" 1 1 syscall3 drop print
+1 0 fd @64 8 syscall3 print
+5 off fd @64 99 40 syscall4 print
+fd @64 3 syscall1 print
+"""
+# Redirects the standard output to a file with `dup2`, then restores it
+DUP2_PROGRAM = """
+memory fd 8 end
+memory saved 8 end
+1 print
+420 577 "{dir}/out.txt"c 2 syscall3 fd !64
+1 32 syscall1 saved !64
+1 fd @64 33 syscall2 print
+42 print
+"write\\n" 1 1 syscall3 drop
+1 saved @64 33 syscall2 print
+saved @64 3 syscall1 print
+fd @64 3 syscall1 print
+2 print
+"""
+
+
+@requires_java
+@pytest.mark.parametrize("memory_backend", BACKENDS)
+def test_pipes(tmp_path, memory_backend):
+    (tmp_path / "data.txt").write_bytes(DATA)
+    exit_code, stdout = run_program(tmp_path, PIPES_PROGRAM.format(dir=tmp_path), memory_backend)
+    assert exit_code == 0
+    assert stdout.split("\n") == [
+        # pipe, fstat of both ends: S_IFIFO
+        "0", "0", str(0o10000), "0", str(0o10000),
+        # write, read
+        "5", "5", "ping",
+        # dup of the write end, which stays open after the original is closed
+        "1", "0", "4", "4", "dup",
+        # end of the stream once all the write ends are closed
+        "0", "0", "0",
+        # EBADF: write to the closed pipe, dup, dup2, sendfile
+        "-9", "-9", "-9", "-9",
+        # sendfile from the offset, which is advanced
+        "world", "5", "12",
+        # sendfile from the file position, NULL offset
+        "hello", "5", "5",
+        # sendfile to a closed file descriptor, close
+        "-9", "0", "",
+    ]
+
+
+@requires_java
+@pytest.mark.parametrize("buffered_output", [False, True])
+@pytest.mark.parametrize("memory_backend", BACKENDS)
+def test_dup2_stdout(tmp_path, memory_backend, buffered_output):
+    exit_code, stdout = run_program(tmp_path, DUP2_PROGRAM.format(dir=tmp_path), memory_backend,
+                                    buffered_output=buffered_output)
+    assert exit_code == 0
+    # The standard output stays open while it is replaced, then dup2 restores it and returns 1
+    assert stdout.split("\n") == ["1", "1", "0", "0", "2", ""]
+    assert (tmp_path / "out.txt").read_bytes() == b"1\n42\nwrite\n"
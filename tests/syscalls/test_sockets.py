@@ -0,0 +1,181 @@
+import socket
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("porth.porth")
+
+from tests.syscalls import BACKENDS, requires_java, run_program
+
+# sockaddr_in of 127.0.0.1 and the port, stored at `addr`
+ADDRESS = """
+2 addr !16 {port_high} addr 2 + !8 {port_low} addr 3 + !8
+127 addr 4 + !8 0 addr 5 + !8 0 addr 6 + !8 1 addr 7 + !8
+"""
+# Accepts one connection after polling the listening socket, echoes what it receives and shuts the connection down
+SERVER_PROGRAM = """
+memory addr 16 end
+memory alen 8 end
+memory pfd 8 end
+memory buf 64 end
+memory sfd 8 end
+memory cfd 8 end
+memory len 8 end
+0 1 2 41 syscall3 dup sfd !64 0 >= print
+1 alen !32 4 alen 2 1 sfd @64 54 syscall5 print
+4 alen 2 1 99 54 syscall5 print
+4 alen 2 1 1 54 syscall5 print
+{address}
+16 addr sfd @64 49 syscall3 print
+16 sfd @64 50 syscall2 print
+sfd @64 pfd !32 1 pfd 4 + !16
+-1 1 pfd 7 syscall3 print
+pfd 6 + @16 print
+16 alen !64
+alen addr sfd @64 43 syscall3 dup cfd !64 0 >= print
+addr @16 print addr 4 + @8 print alen @64 print
+0 0 0 64 buf cfd @64 45 syscall6 dup len !64 print
+0 0 0 len @64 buf cfd @64 44 syscall6 print
+1 cfd @64 48 syscall2 print
+0 0 0 64 buf cfd @64 45 syscall6 print
+cfd @64 3 syscall1 print
+cfd @64 3 syscall1 print
+0 0 0 64 buf cfd @64 45 syscall6 print
+0 0 0 64 buf 1 45 syscall6 print
+alen addr 1 43 syscall3 print
+sfd @64 3 syscall1 print
+"""
+# Connects, waits for the socket to be writable, then for the reply to be readable
+CLIENT_PROGRAM = """
+memory addr 16 end
+memory buf 64 end
+memory fd 8 end
+memory pfd 8 end
+memory st 144 end
+0 1 2 41 syscall3 fd !64
+st fd @64 5 syscall2 print st 24 + @32 61440 and print
+{address}
+16 addr fd @64 42 syscall3 print
+fd @64 pfd !32 4 pfd 4 + !16
+-1 1 pfd 7 syscall3 print
+pfd 6 + @16 print
+"ping\\n" fd @64 1 syscall3 print
+fd @64 pfd !32 1 pfd 4 + !16
+-1 1 pfd 7 syscall3 print
+pfd 6 + @16 print
+64 buf fd @64 0 syscall3 dup print
+buf 1 1 syscall3 drop
+1 fd @64 48 syscall2 print
+64 buf fd @64 0 syscall3 print
+fd @64 3 syscall1 print
+0 1 255 41 syscall3 print
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def address(port: int) -> str:
+    return ADDRESS.format(port_high=port >> 8, port_low=port & 0xff)
+
+
+def connect(port: int, timeout: float = 30) -> socket.socket:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return socket.create_connection(("127.0.0.1", port))
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+@requires_java
+@pytest.mark.parametrize("memory_backend", BACKENDS)
+def test_server(tmp_path, memory_backend):
+    port = free_port()
+    received = []
+
+    def client():
+        with connect(port) as connection:
+            connection.sendall(b"ping\n")
+            response = b""
+            while data := connection.recv(64):
+                response += data
+            received.append(response)
+
+    thread = threading.Thread(target=client)
+    thread.start()
+    try:
+        exit_code, stdout = run_program(tmp_path, SERVER_PROGRAM.format(address=address(port)), memory_backend)
+    finally:
+        thread.join(60)
+
+    assert exit_code == 0
+    assert received == [b"ping\n"]
+    assert stdout.split("\n") == [
+        # socket, setsockopt of SO_REUSEADDR, then EBADF and ENOTSOCK
+        "1", "0", "-9", "-88",
+        # bind, listen
+        "0", "0",
+        # poll: the pending connection makes the listening socket readable
+        "1", "1",
+        # accept: AF_INET, 127.x.x.x, length of the address
+        "1", "2", "127", "16",
+        # recvfrom, sendto of the echo, shutdown, end of the stream
+        "5", "5", "0", "0",
+        # close, then EBADF
+        "0", "-9", "-9",
+        # not a socket
+        "-88", "-88",
+        "0", "",
+    ]
+
+
+@requires_java
+@pytest.mark.parametrize("memory_backend", BACKENDS)
+def test_client(tmp_path, memory_backend):
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        listener.settimeout(60)
+        port = listener.getsockname()[1]
+        received = []
+
+        def server():
+            connection, _ = listener.accept()
+            with connection:
+                request = b""
+                while not request.endswith(b"\n"):
+                    request += connection.recv(64)
+                connection.sendall(b"pong\n")
+                # Closed once the client shut down its side
+                while data := connection.recv(64):
+                    request += data
+                received.append(request)
+
+        thread = threading.Thread(target=server)
+        thread.start()
+        try:
+            exit_code, stdout = run_program(tmp_path, CLIENT_PROGRAM.format(address=address(port)), memory_backend)
+        finally:
+            thread.join(60)
+
+    assert exit_code == 0
+    assert received == [b"ping\n"]
+    assert stdout.split("\n") == [
+        # fstat: S_IFSOCK
+        "0", str(0o140000),
+        # connect, poll for POLLOUT
+        "0", "1", "4",
+        # write, poll for POLLIN, read
+        "5", "1", "1", "5", "pong",
+        # shutdown, end of the stream, close
+        "0", "0", "0",
+        # Unknown address family
+        "-97", "",
+    ]